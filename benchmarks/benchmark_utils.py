@@ -0,0 +1,54 @@
+"""Helpers shared by benchmarks."""
+import os
+import subprocess
+import sys
+
+import numpy as np
+from zquantum.core import circuits
+
+# Benchmarks parametrized by number of qubits go up to this size. Large sizes take a
+# lot of memory and time, hence they need to be requested explicitly.
+MAX_QUBITS = int(os.getenv("QHIPSTER_BENCHMARK_MAX_QUBITS", "20"))
+
+
+def qubit_counts(start, step=2):
+    return list(range(start, MAX_QUBITS + 1, step))
+
+
+def _max_rss(code):
+    process = subprocess.Popen([sys.executable, "-c", code])
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = status
+    if status != 0:
+        raise subprocess.CalledProcessError(status, code)
+    # ru_maxrss is reported in kilobytes on Linux.
+    return rusage.ru_maxrss * 1024
+
+
+def peak_rss(setup, statement):
+    """Measure how much peak RSS of a fresh interpreter grows by running statement.
+
+    Args:
+        setup: code run before measured statement, e.g. imports.
+        statement: measured code.
+
+    Returns:
+        Difference (in bytes) between peak RSS of process executing setup and
+        statement, and peak RSS of process executing setup only.
+    """
+    return _max_rss(f"{setup}\n{statement}") - _max_rss(setup)
+
+
+def layered_circuit(n_qubits, n_layers=10, seed=0):
+    """Circuit of layers of random RY rotations followed by a ladder of CNOTs."""
+    rng = np.random.default_rng(seed)
+    operations = []
+    for _ in range(n_layers):
+        operations.extend(
+            circuits.RY(angle)(qubit)
+            for qubit, angle in enumerate(rng.uniform(0, 2 * np.pi, n_qubits))
+        )
+        operations.extend(
+            circuits.CNOT(qubit, qubit + 1) for qubit in range(n_qubits - 1)
+        )
+    return circuits.Circuit(operations, n_qubits=n_qubits)
@@ -0,0 +1,75 @@
+"""Per-call overhead of the simulator.
+
+Interpreters are replaced by `fake_interpreter.py`, which writes correctly shaped
+outputs without simulating anything, so these benchmarks measure everything but
+the simulation itself and run on any Linux machine.
+"""
+import pytest
+from benchmark_utils import layered_circuit
+from fake_interpreter import make_executable
+from qeqhipster import simulator as simulator_module
+from qeqhipster.scratch import SCRATCH_BACKENDS
+from qeqhipster.simulator import QHipsterSimulator
+from zquantum.core.openfermion import QubitOperator
+
+FAKE_INTERPRETERS = {
+    "WAVEFUNCTION_INTERPRETER": "wavefunction",
+    "BINARY_WAVEFUNCTION_INTERPRETER": "binary",
+    "EXPECTATION_VALUES_INTERPRETER": "expectation_values",
+}
+
+
+@pytest.fixture(autouse=True)
+def fake_interpreters(tmp_path, monkeypatch):
+    for attribute, mode in FAKE_INTERPRETERS.items():
+        monkeypatch.setattr(
+            simulator_module, attribute, make_executable(str(tmp_path / mode), mode)
+        )
+
+
+@pytest.fixture
+def simulator_options(tmp_path):
+    # Small circuits would be simulated in process, without the interpreter.
+    return {
+        "operator_cache_dir": str(tmp_path / "operators"),
+        "in_process_max_qubits": None,
+    }
+
+
+@pytest.mark.parametrize("wavefunction_format", ["json", "binary"])
+@pytest.mark.parametrize("n_qubits", [2, 10, 16])
+def test_get_wavefunction(benchmark, simulator_options, n_qubits, wavefunction_format):
+    simulator = QHipsterSimulator(
+        wavefunction_format=wavefunction_format, **simulator_options
+    )
+    circuit = layered_circuit(n_qubits)
+    benchmark.extra_info["n_qubits"] = n_qubits
+
+    benchmark(simulator.get_wavefunction, circuit)
+
+
+@pytest.mark.parametrize("use_worker", [False, True])
+def test_get_exact_expectation_values(benchmark, simulator_options, use_worker):
+    circuit = layered_circuit(8)
+    operator = sum((QubitOperator(f"Z{i} Z{i + 1}") for i in range(7)), QubitOperator())
+
+    with QHipsterSimulator(use_worker=use_worker, **simulator_options) as simulator:
+        benchmark(simulator.get_exact_expectation_values, circuit, operator)
+
+
+@pytest.mark.parametrize("scratch", SCRATCH_BACKENDS)
+def test_scratch_backend(benchmark, simulator_options, scratch):
+    circuit = layered_circuit(10)
+
+    with QHipsterSimulator(scratch=scratch, **simulator_options) as simulator:
+        benchmark(simulator.run_circuit_and_measure, circuit, 100)
+        benchmark.extra_info["io_time"] = simulator.stats.io_time
+        benchmark.extra_info["simulation_time"] = simulator.stats.simulation_time
+
+
+def test_batch_of_measurements(benchmark, simulator_options):
+    simulator = QHipsterSimulator(**simulator_options)
+    circuitset = [layered_circuit(4, seed=seed) for seed in range(32)]
+    benchmark.extra_info["n_circuits"] = len(circuitset)
+
+    benchmark(simulator.run_circuitset_and_measure, circuitset, [100] * 32)
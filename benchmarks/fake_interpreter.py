@@ -0,0 +1,80 @@
+"""Stand-in for the qHiPSTER interpreters, producing correctly shaped outputs.
+
+Usage:
+    fake_interpreter.py wavefunction CIRCUIT NTHREADS OUTPUT
+    fake_interpreter.py binary CIRCUIT NTHREADS OUTPUT
+    fake_interpreter.py expectation_values CIRCUIT NTHREADS OPERATOR OUTPUT
+
+Circuits are not simulated, every circuit yields the |0...0> state. Only the
+standard library is used, so that startup time of the stand-in stays close to the
+one of a native binary.
+"""
+import array
+import json
+import os
+import stat
+import sys
+
+
+def _n_qubits(circuit_path):
+    with open(circuit_path) as f:
+        return int(f.readline())
+
+
+def _write_wavefunction(circuit_path, output_path):
+    n_amplitudes = 2 ** _n_qubits(circuit_path)
+    real = [0.0] * n_amplitudes
+    real[0] = 1.0
+    with open(output_path, "w") as f:
+        json.dump(
+            {
+                "schema": "zapata-v1-wavefunction",
+                "amplitudes": {"real": real, "imag": [0.0] * n_amplitudes},
+            },
+            f,
+        )
+
+
+def _write_binary_wavefunction(circuit_path, output_path):
+    amplitudes = array.array("d", bytes(16 * 2 ** _n_qubits(circuit_path)))
+    amplitudes[0] = 1.0
+    with open(output_path, "wb") as f:
+        amplitudes.tofile(f)
+
+
+def _write_expectation_values(operator_path, output_path):
+    with open(operator_path) as f:
+        n_terms = sum(1 for _ in f)
+    with open(output_path, "w") as f:
+        json.dump(
+            {
+                "schema": "zapata-v1-expectation_values",
+                "expectation_values": {"real": [1.0] * n_terms},
+            },
+            f,
+        )
+
+
+def make_executable(path, mode):
+    """Write shell script running the stand-in in given mode and return its path."""
+    script = os.path.abspath(__file__)
+    with open(path, "w") as f:
+        f.write(f'#!/bin/sh\nexec {sys.executable} {script} {mode} "$@"\n')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    return path
+
+
+def main(argv):
+    mode, circuit_path, _nthreads, *rest = argv
+    if mode == "wavefunction":
+        _write_wavefunction(circuit_path, *rest)
+    elif mode == "binary":
+        _write_binary_wavefunction(circuit_path, *rest)
+    elif mode == "expectation_values":
+        _write_expectation_values(*rest)
+    else:
+        raise ValueError(f"Unknown mode: {mode}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
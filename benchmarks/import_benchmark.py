@@ -0,0 +1,66 @@
+"""Startup cost of the package.
+
+Each import is measured in a fresh interpreter. Cumulative import time of every
+module of the package, as reported by `python -X importtime`, is saved in extra
+info, together with modules imported only on first use that were imported anyway,
+e.g. by z-quantum-core itself.
+"""
+import subprocess
+import sys
+
+import pytest
+from qeqhipster.simulator import QHipsterSimulator
+
+# Modules imported by each benchmarked module only when a simulation needs them.
+_DEFERRED_ZQUANTUM_MODULES = [
+    "zquantum.core.measurement",
+    "zquantum.core.openfermion",
+    "zquantum.core.wavefunction",
+]
+DEFERRED_MODULES = {
+    "qeqhipster.simulator": ["asyncio", *_DEFERRED_ZQUANTUM_MODULES],
+    "qeqhipster.async_simulator": _DEFERRED_ZQUANTUM_MODULES,
+}
+
+
+def _import(module):
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+
+
+def _import_times(module):
+    """Cumulative import time in microseconds of every module imported by `module`,
+    keyed by module name."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize("module", DEFERRED_MODULES)
+def test_import(benchmark, module):
+    times = _import_times(module)
+    benchmark.extra_info["import_time_us"] = times[module]
+    benchmark.extra_info["package_import_times_us"] = {
+        name: time for name, time in times.items() if name.startswith("qeqhipster")
+    }
+    benchmark.extra_info["deferred_modules_imported"] = [
+        name for name in DEFERRED_MODULES[module] if name in times
+    ]
+
+    benchmark(_import, module)
+
+
+def test_simulator_construction(benchmark, tmp_path):
+    def _construct():
+        QHipsterSimulator(operator_cache_dir=str(tmp_path)).close()
+
+    benchmark(_construct)
@@ -0,0 +1,57 @@
+"""Crossover between in-process simulation and the interpreter.
+
+Layered circuits of growing size are simulated in process by `qeqhipster.statevector`
+and by the interpreter. If the interpreter is not installed, it is replaced by
+`fake_interpreter.py`, which doesn't simulate anything, so its times are a lower
+bound of the interpreter's cost. `IN_PROCESS_MAX_QUBITS` and `IN_PROCESS_MAX_GATES`
+in `qeqhipster.simulator` are chosen where simulating in process stops being faster.
+"""
+import os
+
+import pytest
+from benchmark_utils import layered_circuit
+from fake_interpreter import make_executable
+from qeqhipster import simulator as simulator_module
+from qeqhipster.simulator import QHipsterSimulator
+
+FAKE_INTERPRETERS = {
+    "WAVEFUNCTION_INTERPRETER": "wavefunction",
+    "BINARY_WAVEFUNCTION_INTERPRETER": "binary",
+}
+
+N_QUBITS = [4, 8, 10, 12, 14, 16]
+N_LAYERS = [1, 10, 50]
+
+
+@pytest.fixture
+def interpreter(tmp_path, monkeypatch):
+    if not os.access(simulator_module.WAVEFUNCTION_INTERPRETER, os.X_OK):
+        for attribute, mode in FAKE_INTERPRETERS.items():
+            monkeypatch.setattr(
+                simulator_module, attribute, make_executable(str(tmp_path / mode), mode)
+            )
+
+
+def _benchmark_wavefunction(benchmark, simulator, n_qubits, n_layers):
+    circuit = layered_circuit(n_qubits, n_layers)
+    benchmark.extra_info["n_qubits"] = n_qubits
+    benchmark.extra_info["n_gates"] = len(circuit.operations)
+
+    benchmark(simulator.get_wavefunction, circuit)
+
+
+@pytest.mark.parametrize("n_layers", N_LAYERS)
+@pytest.mark.parametrize("n_qubits", N_QUBITS)
+def test_in_process(benchmark, n_qubits, n_layers):
+    simulator = QHipsterSimulator(
+        in_process_max_qubits=n_qubits, in_process_max_gates=None
+    )
+
+    _benchmark_wavefunction(benchmark, simulator, n_qubits, n_layers)
+
+
+@pytest.mark.parametrize("n_layers", N_LAYERS)
+@pytest.mark.parametrize("n_qubits", N_QUBITS)
+def test_interpreter(benchmark, interpreter, n_qubits, n_layers):
+    with QHipsterSimulator(in_process_max_qubits=None) as simulator:
+        _benchmark_wavefunction(benchmark, simulator, n_qubits, n_layers)
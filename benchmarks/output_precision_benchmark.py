@@ -0,0 +1,51 @@
+"""Comparison of wavefunction output modes.
+
+Each mode converts memory-mapped complex128 interpreter output block by block, see
+`qeqhipster.wavefunction.convert_output`. Bytes of the returned output and peak RSS
+of the conversion are reported in extra info of each benchmark.
+"""
+import numpy as np
+import pytest
+from benchmark_utils import peak_rss, qubit_counts
+from qeqhipster.wavefunction import (
+    OUTPUT_MODES,
+    convert_output,
+    load_binary_wavefunction,
+    save_binary_wavefunction,
+)
+
+SETUP = """
+from qeqhipster.wavefunction import convert_output, load_binary_wavefunction
+"""
+
+# Fraction of amplitudes kept by sparse output.
+SPARSE_FRACTION = 1 / 64
+
+
+def _convert(path, mode):
+    return convert_output(load_binary_wavefunction(path), mode)
+
+
+@pytest.fixture(scope="module", params=qubit_counts(10))
+def binary_path(request, tmp_path_factory):
+    n_qubits = request.param
+    rng = np.random.default_rng(n_qubits)
+    amplitudes = rng.normal(size=2**n_qubits) + 1j * rng.normal(size=2**n_qubits)
+    amplitudes[rng.random(2**n_qubits) > SPARSE_FRACTION] = 0
+    path = str(tmp_path_factory.mktemp("output") / f"wavefunction_{n_qubits}.bin")
+    save_binary_wavefunction(amplitudes / np.linalg.norm(amplitudes), path)
+    return path
+
+
+@pytest.mark.parametrize("mode", OUTPUT_MODES)
+def test_output_mode(benchmark, binary_path, mode):
+    output = _convert(binary_path, mode)
+    benchmark.extra_info["n_qubits"] = int(
+        np.log2(len(load_binary_wavefunction(binary_path)))
+    )
+    benchmark.extra_info["output_bytes"] = int(output.nbytes)
+    benchmark.extra_info["peak_rss_bytes"] = peak_rss(
+        SETUP, f"convert_output(load_binary_wavefunction({binary_path!r}), {mode!r})"
+    )
+
+    benchmark(_convert, binary_path, mode)
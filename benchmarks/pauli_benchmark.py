@@ -0,0 +1,39 @@
+"""Expectation values of many Pauli terms computed with NumPy engine."""
+import numpy as np
+import pytest
+from qeqhipster.pauli import PauliTerms, expectation_values
+
+N_QUBITS = 16
+
+
+def _random_terms(n_terms, n_x_masks, seed=0):
+    rng = np.random.default_rng(seed)
+    x_masks = rng.integers(0, 2**N_QUBITS, n_x_masks, dtype=np.uint64)
+    return PauliTerms(
+        x_masks=rng.choice(x_masks, n_terms),
+        z_masks=rng.integers(0, 2**N_QUBITS, n_terms, dtype=np.uint64),
+        phases=np.ones(n_terms, dtype=complex),
+        coefficients=rng.normal(size=n_terms).astype(complex),
+    )
+
+
+@pytest.fixture(scope="module")
+def state():
+    rng = np.random.default_rng(0)
+    state = rng.normal(size=2**N_QUBITS) + 1j * rng.normal(size=2**N_QUBITS)
+    return state / np.linalg.norm(state)
+
+
+@pytest.mark.parametrize("n_terms", [10**4, 10**5])
+@pytest.mark.parametrize("n_x_masks", [16, 1024])
+def test_expectation_values(benchmark, state, n_terms, n_x_masks):
+    terms = _random_terms(n_terms, n_x_masks)
+
+    benchmark(expectation_values, state, terms)
+
+
+@pytest.mark.parametrize("chunk_size", [2**10, 2**14, None])
+def test_chunk_size(benchmark, state, chunk_size):
+    terms = _random_terms(10**4, 64)
+
+    benchmark(expectation_values, state, terms, chunk_size)
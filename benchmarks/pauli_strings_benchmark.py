@@ -0,0 +1,51 @@
+"""Serialization of operators into Pauli strings files read by the interpreter."""
+import os
+
+import numpy as np
+import pytest
+from qeqhipster.operators import (
+    OPERATOR_TXT_FILENAME,
+    PAULI_STRINGS_CONVERTER,
+    convert_with_native_converter,
+)
+from qeqhipster.utils import write_pauli_strings
+from zquantum.core.openfermion import QubitOperator
+
+MAX_TERMS = int(os.getenv("QHIPSTER_BENCHMARK_MAX_TERMS", "100000"))
+N_QUBITS = 24
+
+
+def _random_operator(n_terms, seed=0):
+    rng = np.random.default_rng(seed)
+    operator = QubitOperator()
+    for coefficient in rng.normal(size=n_terms):
+        qubits = sorted(rng.choice(N_QUBITS, size=4, replace=False))
+        actions = rng.choice(["X", "Y", "Z"], size=4)
+        operator += QubitOperator(
+            " ".join(f"{a}{q}" for a, q in zip(actions, qubits)), coefficient
+        )
+    return operator
+
+
+@pytest.fixture(
+    scope="module",
+    params=[n for n in (10**3, 10**4, 10**5, 10**6) if n <= MAX_TERMS],
+)
+def operator(request):
+    return _random_operator(request.param)
+
+
+def test_python_writer(benchmark, operator, tmp_path):
+    benchmark.extra_info["n_terms"] = len(operator.terms)
+
+    benchmark(write_pauli_strings, operator, str(tmp_path / OPERATOR_TXT_FILENAME))
+
+
+@pytest.mark.skipif(
+    not os.access(PAULI_STRINGS_CONVERTER, os.X_OK),
+    reason="qubitop_to_paulistrings.o is available only in qe-qhipster image.",
+)
+def test_json_and_native_converter(benchmark, operator, tmp_path):
+    benchmark.extra_info["n_terms"] = len(operator.terms)
+
+    benchmark(convert_with_native_converter, operator, str(tmp_path))
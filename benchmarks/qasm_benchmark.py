@@ -0,0 +1,48 @@
+"""Serialization of circuits into simplified QASM read by the interpreter."""
+import io
+import os
+
+import numpy as np
+import pytest
+from qeqhipster.utils import (
+    convert_to_simplified_qasm,
+    make_circuit_qhipster_compatible,
+    write_simplified_qasm,
+)
+from zquantum.core import circuits
+
+MAX_GATES = int(os.getenv("QHIPSTER_BENCHMARK_MAX_GATES", "100000"))
+N_QUBITS = 24
+
+
+def _random_circuit(n_gates, seed=0):
+    rng = np.random.default_rng(seed)
+    operations = []
+    for angle, qubit in zip(
+        rng.uniform(0, 2 * np.pi, n_gates), rng.integers(1, N_QUBITS, n_gates)
+    ):
+        operations.append(circuits.RX(angle)(int(qubit)))
+        operations.append(circuits.CNOT(0, int(qubit)))
+    return circuits.Circuit(operations[:n_gates], n_qubits=N_QUBITS)
+
+
+@pytest.fixture(
+    scope="module",
+    params=[n for n in (10**3, 10**4, 10**5, 10**6) if n <= MAX_GATES],
+)
+def circuit(request):
+    return _random_circuit(request.param)
+
+
+def test_converting_to_string(benchmark, circuit):
+    benchmark.extra_info["n_gates"] = len(circuit.operations)
+
+    benchmark(
+        lambda: convert_to_simplified_qasm(make_circuit_qhipster_compatible(circuit))
+    )
+
+
+def test_streaming_writer(benchmark, circuit):
+    benchmark.extra_info["n_gates"] = len(circuit.operations)
+
+    benchmark(lambda: write_simplified_qasm(circuit, io.StringIO()))
@@ -0,0 +1,46 @@
+"""Comparison of reversing qubit order with `flip_wavefunction` and in place."""
+import numpy as np
+import pytest
+from benchmark_utils import peak_rss, qubit_counts
+from qeqhipster.wavefunction import reverse_qubit_order
+from zquantum.core.wavefunction import Wavefunction, flip_wavefunction
+
+SETUP = """
+import numpy as np
+from qeqhipster.wavefunction import reverse_qubit_order
+from zquantum.core.wavefunction import Wavefunction, flip_wavefunction
+amplitudes = np.zeros(2**{n_qubits}, dtype=complex)
+amplitudes[0] = 1
+"""
+
+
+@pytest.fixture(scope="module", params=qubit_counts(20))
+def n_qubits(request):
+    return request.param
+
+
+@pytest.fixture
+def amplitudes(n_qubits):
+    amplitudes = np.zeros(2**n_qubits, dtype=complex)
+    amplitudes[0] = 1
+    return amplitudes
+
+
+def test_flip_wavefunction(benchmark, n_qubits, amplitudes):
+    benchmark.extra_info["n_qubits"] = n_qubits
+    benchmark.extra_info["peak_rss_bytes"] = peak_rss(
+        SETUP.format(n_qubits=n_qubits), "flip_wavefunction(Wavefunction(amplitudes))"
+    )
+
+    benchmark(flip_wavefunction, Wavefunction(amplitudes))
+
+
+@pytest.mark.parametrize("nthreads", [1, 4])
+def test_reverse_qubit_order(benchmark, n_qubits, amplitudes, nthreads):
+    benchmark.extra_info["n_qubits"] = n_qubits
+    benchmark.extra_info["peak_rss_bytes"] = peak_rss(
+        SETUP.format(n_qubits=n_qubits),
+        f"reverse_qubit_order(amplitudes, nthreads={nthreads})",
+    )
+
+    benchmark(reverse_qubit_order, amplitudes, nthreads)
@@ -0,0 +1,46 @@
+"""Rebinding parameters of a compiled circuit template."""
+import io
+
+import numpy as np
+import pytest
+import sympy
+from qeqhipster.templates import CircuitTemplate
+from qeqhipster.utils import write_simplified_qasm
+from zquantum.core import circuits
+
+N_QUBITS = 20
+
+
+def _ansatz(n_layers):
+    operations = []
+    for layer in range(n_layers):
+        for qubit in range(N_QUBITS):
+            operations.append(circuits.RY(sympy.Symbol(f"t_{layer}_{qubit}"))(qubit))
+        for qubit in range(N_QUBITS - 1):
+            operations.append(circuits.CNOT(qubit, qubit + 1))
+    return circuits.Circuit(operations)
+
+
+@pytest.fixture(scope="module", params=[1, 10, 100])
+def circuit(request):
+    return _ansatz(request.param)
+
+
+def test_binding_circuit(benchmark, circuit):
+    symbols = circuit.free_symbols
+    params = np.random.default_rng(0).uniform(size=len(symbols))
+    benchmark.extra_info["n_gates"] = len(circuit.operations)
+
+    benchmark(
+        lambda: write_simplified_qasm(
+            circuit.bind(dict(zip(symbols, params))), io.StringIO()
+        )
+    )
+
+
+def test_binding_template(benchmark, circuit):
+    template = CircuitTemplate(circuit)
+    params = np.random.default_rng(0).uniform(size=template.n_params)
+    benchmark.extra_info["n_gates"] = len(circuit.operations)
+
+    benchmark(template.qasm, params)
@@ -0,0 +1,70 @@
+"""Comparison of JSON and binary wavefunction transport.
+
+JSON transport is what the default interpreter produces: state vector is parsed with
+`load_wavefunction` and then flipped into z-quantum-core qubit order. Binary transport
+memory-maps raw complex128 output already written in the right order.
+"""
+import numpy as np
+import pytest
+from benchmark_utils import peak_rss, qubit_counts
+from qeqhipster.wavefunction import load_binary_wavefunction, save_binary_wavefunction
+from zquantum.core.measurement import load_wavefunction, save_wavefunction
+from zquantum.core.wavefunction import Wavefunction, flip_wavefunction
+
+SETUP = """
+from qeqhipster.wavefunction import load_binary_wavefunction
+from zquantum.core.measurement import load_wavefunction
+from zquantum.core.wavefunction import flip_wavefunction
+"""
+
+
+def _load_json(path):
+    return flip_wavefunction(load_wavefunction(path)).amplitudes
+
+
+def _load_binary(path):
+    # Touch all amplitudes so that the memory map is actually read.
+    amplitudes = load_binary_wavefunction(path)
+    amplitudes.sum()
+    return amplitudes
+
+
+@pytest.fixture(scope="module", params=qubit_counts(10))
+def amplitudes(request):
+    rng = np.random.default_rng(request.param)
+    amplitudes = rng.normal(size=2**request.param) + 1j * rng.normal(
+        size=2**request.param
+    )
+    return amplitudes / np.linalg.norm(amplitudes)
+
+
+@pytest.fixture
+def json_path(amplitudes, tmp_path):
+    path = str(tmp_path / "wavefunction.json")
+    save_wavefunction(Wavefunction(amplitudes), path)
+    return path
+
+
+@pytest.fixture
+def binary_path(amplitudes, tmp_path):
+    path = str(tmp_path / "wavefunction.bin")
+    save_binary_wavefunction(amplitudes, path)
+    return path
+
+
+def test_json_transport(benchmark, json_path, amplitudes):
+    benchmark.extra_info["n_qubits"] = int(np.log2(len(amplitudes)))
+    benchmark.extra_info["peak_rss_bytes"] = peak_rss(
+        SETUP, f"flip_wavefunction(load_wavefunction({json_path!r}))"
+    )
+
+    benchmark(_load_json, json_path)
+
+
+def test_binary_transport(benchmark, binary_path, amplitudes):
+    benchmark.extra_info["n_qubits"] = int(np.log2(len(amplitudes)))
+    benchmark.extra_info["peak_rss_bytes"] = peak_rss(
+        SETUP, f"load_binary_wavefunction({binary_path!r}).sum()"
+    )
+
+    benchmark(_load_binary, binary_path)
@@ -10,6 +10,8 @@ except ImportError:
     warnings.warn("Unable to import extras")
     extras = {}
 
+extras["benchmarks"] = ["pytest-benchmark~=3.4"]
+
 # Workaound for https://github.com/pypa/pip/issues/7953
 site.ENABLE_USER_SITE = "--user" in sys.argv[1:]
 
@@ -0,0 +1,254 @@
+"""Asyncio front-end of the qHiPSTER simulator.
+
+`AsyncQHipsterSimulator` runs the same simulations as `QHipsterSimulator`, but it
+launches the interpreter with `asyncio.create_subprocess_exec`, so the event loop is
+not blocked while the interpreter runs. Everything else a simulation does, e.g.
+writing circuits and operators, loading and reordering state vectors or computing
+expectation values with NumPy, runs in the default executor of the loop. The number
+of concurrently running interpreter processes, the total number of threads they use
+and their total predicted peak memory are bounded.
+"""
+import asyncio
+import contextlib
+import subprocess
+import weakref
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+from .batching import AsyncCoreBudget
+from .instrumentation import check_executable
+from .memory import AsyncMemoryBudget
+from .simulator import QHipsterSimulator, _pack_operator_results, _unpack_operators
+from .threads import AUTO_THREADS, set_affinity
+from .wavefunction import DEFAULT_SPARSE_THRESHOLD
+
+if TYPE_CHECKING:
+    from zquantum.core.wavefunction import Wavefunction
+
+
+@dataclass
+class _Limits:
+    processes: asyncio.Semaphore
+    cores: AsyncCoreBudget
+    memory: Optional[AsyncMemoryBudget]
+
+
+def _advance(steps, value):
+    """Send `value` into simulation steps, returning tuple (finished, value) where
+    value is either the next argv or the result of the simulation."""
+    # StopIteration cannot be passed through futures.
+    try:
+        return False, steps.send(value)
+    except StopIteration as stop:
+        return True, stop.value
+
+
+class AsyncQHipsterSimulator:
+    """qHiPSTER based simulator with asynchronous interface.
+
+    Args:
+        nthreads: number of threads used by the interpreter for each circuit. If
+            "auto" (or None), it is chosen based on circuit's size, as by
+            `QHipsterSimulator` with `nthreads="auto"`.
+        max_processes: maximum number of concurrently running interpreter processes.
+            Defaults to `max_cores`.
+        max_cores: number of cores shared by concurrently running interpreter
+            processes. Defaults to all cores available to the process, or to cores
+            bound to the simulator if `bind_cores=True` is passed.
+        **kwargs: options of the underlying `QHipsterSimulator`, used for preparing
+            inputs and reading outputs of the interpreter. Its worker is never used.
+            Concurrent simulations wait until their predicted peak memory fits into
+            the limit of its `memory_budget`, which is tracked separately from
+            simulations run synchronously.
+
+    The limits are tracked separately for each event loop in which the simulator
+    is used.
+    """
+
+    def __init__(
+        self,
+        nthreads=1,
+        max_processes: Optional[int] = None,
+        max_cores: Optional[int] = None,
+        **kwargs,
+    ):
+        self.simulator = QHipsterSimulator(
+            nthreads=AUTO_THREADS if nthreads is None else nthreads,
+            max_cores=max_cores,
+            **kwargs,
+        )
+        self.n_cores = self.simulator._n_cores()
+        self.max_processes = max_processes or self.n_cores
+        # Limits of each event loop in which the simulator is used.
+        self._limits_of_loops: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    @property
+    def number_of_circuits_run(self):
+        return self.simulator.number_of_circuits_run
+
+    @property
+    def number_of_jobs_run(self):
+        return self.simulator.number_of_jobs_run
+
+    def close(self):
+        self.simulator.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _limits(self) -> _Limits:
+        # Synchronization primitives belong to the event loop in which they are
+        # created, hence each loop gets its own.
+        loop = asyncio.get_running_loop()
+        if loop not in self._limits_of_loops:
+            memory_budget = self.simulator.memory_budget
+            self._limits_of_loops[loop] = _Limits(
+                asyncio.Semaphore(self.max_processes),
+                AsyncCoreBudget(
+                    self.simulator.cores
+                    if self.simulator.cores is not None
+                    else self.n_cores
+                ),
+                AsyncMemoryBudget(memory_budget.limit)
+                if memory_budget is not None
+                else None,
+            )
+        return self._limits_of_loops[loop]
+
+    async def _run_interpreter(self, argv, nthreads):
+        check_executable(argv, self.simulator._env)
+        limits = self._limits()
+        async with limits.processes, limits.cores.reserve(nthreads) as cores:
+            if self.simulator.cores is None:
+                process = await asyncio.create_subprocess_exec(
+                    *argv, env=self.simulator._env
+                )
+            else:
+                # Concurrent jobs are bound to disjoint cores of the simulator.
+                process = await asyncio.create_subprocess_exec(
+                    *argv, env=self.simulator._job_env(cores)
+                )
+                set_affinity(process.pid, cores)
+            try:
+                returncode = await process.wait()
+            except asyncio.CancelledError:
+                with contextlib.suppress(ProcessLookupError):
+                    process.kill()
+                await process.wait()
+                raise
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, argv)
+
+    async def _step(self, steps, value):
+        """Advance simulation steps in the default executor."""
+        future = asyncio.get_running_loop().run_in_executor(
+            None, _advance, steps, value
+        )
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # A running step cannot be interrupted, and steps cannot be closed
+            # before it finishes.
+            with contextlib.suppress(Exception):
+                await future
+            raise
+
+    async def _run_steps(self, steps, nthreads, memory=None):
+        """Asynchronous counterpart of `QHipsterSimulator._run_steps`.
+
+        Steps run in the default executor, only the interpreter is started and
+        awaited in the event loop. If `memory` is given, that many bytes are
+        reserved in the memory budget for the whole simulation. If the coroutine is
+        cancelled, the interpreter process is killed and scratch files of the
+        simulation are removed.
+        """
+        async with contextlib.AsyncExitStack() as stack:
+            limits = self._limits()
+            if memory is not None and limits.memory is not None:
+                await stack.enter_async_context(limits.memory.reserve(memory))
+            try:
+                finished, value = await self._step(steps, None)
+                while not finished:
+                    await self._run_interpreter(value, nthreads)
+                    # Resource usage of a single child is not available to asyncio.
+                    finished, value = await self._step(steps, None)
+                return value
+            finally:
+                steps.close()
+
+    def _count_circuit(self):
+        self.simulator.number_of_circuits_run += 1
+        self.simulator.number_of_jobs_run += 1
+
+    async def get_wavefunction(self, circuit) -> "Wavefunction":
+        """Compute wavefunction of circuit, starting from |0> state."""
+        from zquantum.core.wavefunction import Wavefunction
+
+        self._count_circuit()
+        nthreads = self.simulator._threads_for(circuit)
+        amplitudes = await self._run_steps(
+            self.simulator._simulate_wavefunction_steps(circuit, nthreads),
+            nthreads,
+            self.simulator._memory_needed(circuit, "wavefunction"),
+        )
+        return Wavefunction(amplitudes)
+
+    async def get_probabilities(self, circuit):
+        """Asynchronous counterpart of `QHipsterSimulator.get_probabilities`."""
+        self._count_circuit()
+        nthreads = self.simulator._threads_for(circuit)
+        return await self._run_steps(
+            self.simulator._simulate_wavefunction_steps(
+                circuit, nthreads, "probabilities"
+            ),
+            nthreads,
+            self.simulator._memory_needed(circuit, "wavefunction", "probabilities"),
+        )
+
+    async def get_sparse_amplitudes(self, circuit, threshold=DEFAULT_SPARSE_THRESHOLD):
+        """Asynchronous counterpart of `QHipsterSimulator.get_sparse_amplitudes`."""
+        self._count_circuit()
+        nthreads = self.simulator._threads_for(circuit)
+        return await self._run_steps(
+            self.simulator._simulate_wavefunction_steps(
+                circuit, nthreads, "sparse", threshold
+            ),
+            nthreads,
+            self.simulator._memory_needed(circuit, "wavefunction", "sparse"),
+        )
+
+    async def get_exact_expectation_values(self, circuit, qubit_operator):
+        self._count_circuit()
+        nthreads = self.simulator._threads_for(circuit)
+        return await self._run_steps(
+            self.simulator._expectation_values_steps(circuit, qubit_operator, nthreads),
+            nthreads,
+            self.simulator._memory_needed(circuit, "expectation_values"),
+        )
+
+    async def get_exact_expectation_values_of_operators(self, circuit, qubit_operators):
+        """Asynchronous counterpart of
+        `QHipsterSimulator.get_exact_expectation_values_of_operators`."""
+        self._count_circuit()
+        names, operators = _unpack_operators(qubit_operators)
+        nthreads = self.simulator._threads_for(circuit)
+        expectation_values = await self._run_steps(
+            self.simulator._operators_expectation_values_steps(
+                circuit, operators, nthreads
+            ),
+            nthreads,
+            self.simulator._memory_needed(circuit, "expectation_values"),
+        )
+        return _pack_operator_results(names, expectation_values)
+
+    async def run_circuit_and_measure(self, circuit, n_samples):
+        self._count_circuit()
+        nthreads = self.simulator._threads_for(circuit)
+        return await self._run_steps(
+            self.simulator._measure_steps(circuit, n_samples, nthreads),
+            nthreads,
+            self.simulator._memory_needed(circuit, "measure"),
+        )
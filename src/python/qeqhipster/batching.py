@@ -0,0 +1,198 @@
+"""Scheduling of concurrent interpreter runs.
+
+Each job of a batch runs in its own native process using a number of threads chosen
+from its qubit count. Jobs are started as long as their threads fit into the core
+budget, so small circuits run many at a time with a single thread each, while large
+circuits run a few at a time with many threads each. If a memory budget is given,
+jobs are also started only as long as their predicted peak memory fits into it.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence, TypeVar, Union
+
+T = TypeVar("T")
+
+# Circuits up to this size are simulated single-threaded. Above it the number of
+# threads doubles with every two qubits, i.e. roughly with the square root of the
+# state vector size.
+SINGLE_THREAD_MAX_QUBITS = 16
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover
+        return os.cpu_count() or 1
+
+
+def threads_for_circuit(n_qubits: int, n_cores: int) -> int:
+    """Choose number of threads for simulating circuit with `n_qubits` qubits."""
+    exponent = max(0, (n_qubits - SINGLE_THREAD_MAX_QUBITS + 1) // 2)
+    return max(1, min(n_cores, 2**exponent))
+
+
+class _Cores:
+    """Free cores of a core budget."""
+
+    def __init__(self, cores: Union[int, Sequence[int]]):
+        self.free = list(range(cores) if isinstance(cores, int) else sorted(cores))
+        self.n_cores = len(self.free)
+
+    def take(self, n_cores: int) -> List[int]:
+        cores, self.free = self.free[:n_cores], self.free[n_cores:]
+        return cores
+
+    def give_back(self, cores: List[int]) -> None:
+        self.free = sorted(self.free + cores)
+
+
+class CoreBudget:
+    """Pool of cores shared by concurrently running jobs.
+
+    Args:
+        cores: number of cores, or the cores themselves. Each reservation yields the
+            cores it holds, which are disjoint from those of other reservations.
+            Given a number, cores are numbered from 0.
+    """
+
+    def __init__(self, cores: Union[int, Sequence[int]]):
+        self._cores = _Cores(cores)
+        self.n_cores = self._cores.n_cores
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, n_cores: int):
+        n_cores = min(n_cores, self.n_cores)
+        with self._condition:
+            self._condition.wait_for(lambda: len(self._cores.free) >= n_cores)
+            cores = self._cores.take(n_cores)
+        try:
+            yield cores
+        finally:
+            with self._condition:
+                self._cores.give_back(cores)
+                self._condition.notify_all()
+
+
+class AsyncCoreBudget:
+    """Pool of cores shared by concurrently running coroutines, see `CoreBudget`.
+
+    Has to be created in the event loop in which it is used.
+    """
+
+    def __init__(self, cores: Union[int, Sequence[int]]):
+        # Imported here, as asyncio takes longer to import than the rest of the
+        # package and it is not needed by synchronous simulations.
+        import asyncio
+
+        self._cores = _Cores(cores)
+        self.n_cores = self._cores.n_cores
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def reserve(self, n_cores: int):
+        n_cores = min(n_cores, self.n_cores)
+        async with self._condition:
+            await self._condition.wait_for(lambda: len(self._cores.free) >= n_cores)
+            cores = self._cores.take(n_cores)
+        try:
+            yield cores
+        finally:
+            async with self._condition:
+                self._cores.give_back(cores)
+                self._condition.notify_all()
+
+
+@dataclass
+class BatchReport:
+    """Timing of a single batch.
+
+    Attributes:
+        n_cores: size of the core budget the batch was scheduled on.
+        threads: number of threads used by each job, in input order.
+        job_times: wall time of each job in seconds, in input order.
+        wall_time: wall time of the whole batch in seconds.
+        memory: predicted peak memory of each job in bytes, in input order. Empty
+            if the batch was not scheduled within a memory budget.
+    """
+
+    n_cores: int
+    threads: List[int] = field(default_factory=list)
+    job_times: List[float] = field(default_factory=list)
+    memory: List[int] = field(default_factory=list)
+    wall_time: float = 0.0
+
+    @property
+    def n_jobs(self) -> int:
+        return len(self.threads)
+
+    @property
+    def jobs_per_second(self) -> float:
+        return self.n_jobs / self.wall_time if self.wall_time > 0 else float("inf")
+
+
+def run_batch(
+    jobs: Sequence[Callable[[int], T]],
+    n_qubits: Sequence[int],
+    n_cores: Optional[int] = None,
+    threads_for: Callable[[int, int], int] = threads_for_circuit,
+    memory_for: Optional[Callable[[int], int]] = None,
+    memory_budget=None,
+):
+    """Run jobs concurrently within core budget and, optionally, memory budget.
+
+    Args:
+        jobs: callables running a single simulation. Each of them is passed number of
+            threads it should use.
+        n_qubits: number of qubits simulated by each job.
+        n_cores: number of cores that can be used. Defaults to all available cores.
+        threads_for: function choosing number of threads of a job from its number
+            of qubits and `n_cores`.
+        memory_for: function predicting peak memory of a job from its number of
+            qubits. Has to be given together with `memory_budget`.
+        memory_budget: `qeqhipster.memory.MemoryBudget` shared by the jobs. If any
+            of the jobs does not fit into it, `MemoryBudgetExceeded` is raised before
+            any job is started.
+
+    Returns:
+        Tuple (results, report), where results are returned by jobs in input order
+        and report is a BatchReport describing the run.
+    """
+    n_cores = n_cores or available_cores()
+    budget = CoreBudget(n_cores)
+    report = BatchReport(
+        n_cores=n_cores,
+        threads=[threads_for(n, n_cores) for n in n_qubits],
+        job_times=[0.0] * len(jobs),
+    )
+    if memory_budget is not None and memory_for is not None:
+        report.memory = [memory_for(n) for n in n_qubits]
+        for n_bytes in report.memory:
+            memory_budget.check(n_bytes)
+    results: List[Optional[T]] = [None] * len(jobs)
+
+    def _run_job(index):
+        memory_reservation = (
+            memory_budget.reserve(report.memory[index])
+            if report.memory
+            else nullcontext()
+        )
+        # Memory is reserved first, so that jobs waiting for it don't hold cores.
+        with memory_reservation, budget.reserve(report.threads[index]):
+            start = time.perf_counter()
+            results[index] = jobs[index](report.threads[index])
+            report.job_times[index] = time.perf_counter() - start
+
+    # Largest jobs go first, so that they don't end up running alone at the end.
+    order = sorted(range(len(jobs)), key=lambda i: n_qubits[i], reverse=True)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(n_cores, len(jobs)))) as executor:
+        for future in [executor.submit(_run_job, index) for index in order]:
+            future.result()
+    report.wall_time = time.perf_counter() - start
+
+    return results, report
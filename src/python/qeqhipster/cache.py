@@ -0,0 +1,95 @@
+"""Bounded cache of simulation results."""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+
+def make_cache_key(*parts: str) -> str:
+    """Hash parts describing a simulation into a cache key."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode())
+        # Separator prevents ("ab", "c") and ("a", "bc") from colliding.
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """LRU cache of numpy arrays bounded by number of entries and total size.
+
+    Entries evicted from memory are written to `spill_dir` (if given), from where
+    they are loaded back on next access.
+
+    Args:
+        max_entries: maximum number of entries kept in memory.
+        max_bytes: maximum total size of entries kept in memory. Unbounded if None.
+        spill_dir: directory to which evicted entries are written.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 128,
+        max_bytes: Optional[int] = None,
+        spill_dir: Optional[str] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _spill_path(self, key: str) -> str:
+        assert self.spill_dir is not None
+        return os.path.join(self.spill_dir, f"{key}.npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Return a copy of cached array or None if there is none."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                value = self._entries[key]
+            elif self.spill_dir is not None and os.path.exists(self._spill_path(key)):
+                value = np.load(self._spill_path(key))
+                self._insert(key, value)
+            else:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return value.copy()
+
+    def put(self, key: str, value: np.ndarray) -> None:
+        """Store a copy of `value` under `key`."""
+        value = np.array(value)
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key).nbytes
+            self._insert(key, value)
+
+    def _insert(self, key: str, value: np.ndarray) -> None:
+        self._entries[key] = value
+        self.total_bytes += value.nbytes
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self.total_bytes > self.max_bytes)
+        ):
+            evicted_key, evicted_value = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_value.nbytes
+            if self.spill_dir is not None:
+                np.save(self._spill_path(evicted_key), evicted_value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
@@ -0,0 +1,178 @@
+"""Gradients of expectation values computed with the parameter-shift rule.
+
+Every gate whose parameter depends on the circuit's symbols has to be of the form
+exp(-i x G) with generator G having eigenvalues +1/2 and -1/2, i.e. 1 apart (up
+to a global phase), e.g. a Pauli rotation. Derivative of an expectation value f with
+respect to parameter x of a single such gate is then
+
+    df/dx = (f(x + pi/2) - f(x - pi/2)) / 2,
+
+and derivatives with respect to symbols follow from the chain rule. Gates without
+such a form, e.g. XY and ISWAP, are first lowered into ones that have it, see
+`qeqhipster.utils.lower_operation`.
+
+Shifting either of two consecutive rotations about the same axis gives the same
+circuit, hence such rotations are merged before gate parameters are shifted, see
+`qeqhipster.utils.simplify_circuit`. `ParameterShiftGradient` then compiles the
+circuit once into a template with a separate slot for each gate parameter, so that
+all shifted circuits of a point are obtained by binding the template.
+`QHipsterSimulator.get_gradient` simulates them as a single batch.
+"""
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+import sympy
+from zquantum.core import circuits
+
+from .templates import CircuitTemplate
+from .utils import make_circuit_qhipster_compatible, simplify_circuit
+
+# Gates of the form exp(-i x G), G having eigenvalues +1/2 and -1/2.
+SHIFTABLE_GATES = {"RX", "RY", "RZ", "PHASE", "CPHASE", "XX", "YY", "ZZ"}
+SHIFT = np.pi / 2
+
+
+@dataclass
+class GradientReport:
+    """Description of a single gradient evaluation.
+
+    Attributes:
+        n_params: number of symbols the gradient is taken with respect to.
+        n_shifted_circuits: number of shifted circuits needed by the rule applied to
+            every parameterized gate of the circuit.
+        n_circuits: number of circuits simulated after merging gates and skipping
+            ones with vanishing derivatives.
+        wall_time: time in seconds taken by the evaluation.
+    """
+
+    n_params: int
+    n_shifted_circuits: int
+    n_circuits: int
+    wall_time: float = 0.0
+
+    @property
+    def circuits_per_second(self) -> float:
+        return self.n_circuits / self.wall_time if self.wall_time > 0 else float("inf")
+
+
+@dataclass(frozen=True)
+class ShiftedPoints:
+    """Points at which the template of `ParameterShiftGradient` is evaluated.
+
+    Attributes:
+        points: slot values of the shifted circuits, one row per circuit. Rows 2j
+            and 2j + 1 have gate parameter j of `active` shifted forward and back.
+        active: indices of gate parameters with nonzero derivative.
+        jacobian: derivatives of active gate parameters with respect to symbols.
+    """
+
+    points: np.ndarray
+    active: np.ndarray
+    jacobian: np.ndarray
+
+    def gradient(self, values) -> np.ndarray:
+        """Combine expectation values at `points` into gradient with respect to
+        symbols."""
+        values = np.asarray(values, dtype=float)
+        derivatives = (values[0::2] - values[1::2]) / 2
+        return derivatives @ self.jacobian
+
+
+def _is_parameterized(operation: circuits.GateOperation) -> bool:
+    return any(
+        isinstance(param, sympy.Expr) and param.free_symbols
+        for param in operation.gate.params
+    )
+
+
+class ParameterShiftGradient:
+    """Circuit compiled for evaluating gradients with the parameter-shift rule.
+
+    Args:
+        circuit: circuit with symbolic parameters.
+        symbols: order of symbols in parameter vectors and gradients. Defaults to
+            `circuit.free_symbols`.
+
+    Attributes:
+        circuit: the circuit with merged rotations and a separate symbol for each
+            parameter depending on `symbols`, from which the template is compiled.
+        n_gate_params: number of parameters depending on `symbols` before merging.
+
+    Raises:
+        ValueError: if a gate depending on symbols is not in `SHIFTABLE_GATES` or
+            the circuit has symbols other than `symbols`.
+    """
+
+    def __init__(
+        self,
+        circuit: circuits.Circuit,
+        symbols: Optional[Sequence[sympy.Symbol]] = None,
+    ):
+        self.symbols = list(circuit.free_symbols if symbols is None else symbols)
+        unbound_symbols = set(circuit.free_symbols) - set(self.symbols)
+        if unbound_symbols:
+            raise ValueError(
+                f"Symbols {unbound_symbols} of the circuit are not gradient's symbols."
+            )
+        lowered = make_circuit_qhipster_compatible(circuit)
+        self.n_gate_params = sum(map(_is_parameterized, lowered.operations))
+        operations = []
+        expressions = []
+        slot_symbols = []
+        for operation in simplify_circuit(lowered, merge_symbolic=True)[0].operations:
+            gate = operation.gate
+            if not _is_parameterized(operation):
+                operations.append(operation)
+                continue
+            if gate.name not in SHIFTABLE_GATES:
+                raise ValueError(
+                    f"Gradient of gate {gate.name} cannot be computed with the "
+                    f"parameter-shift rule. Supported gates are: {SHIFTABLE_GATES}."
+                )
+            (expression,) = gate.params
+            slot_symbol = sympy.Symbol(f"_shift_{len(slot_symbols)}")
+            expressions.append(expression)
+            slot_symbols.append(slot_symbol)
+            operations.append(
+                gate.replace_params((slot_symbol,))(*operation.qubit_indices)
+            )
+
+        self.circuit = circuits.Circuit(operations, n_qubits=circuit.n_qubits)
+        self.template = CircuitTemplate(self.circuit, slot_symbols)
+        self._evaluate_slots = sympy.lambdify(self.symbols, expressions, "numpy")
+        self._evaluate_jacobian = sympy.lambdify(
+            self.symbols,
+            [[sympy.diff(e, symbol) for symbol in self.symbols] for e in expressions],
+            "numpy",
+        )
+
+    @property
+    def n_params(self) -> int:
+        return len(self.symbols)
+
+    @property
+    def n_slots(self) -> int:
+        return self.template.n_params
+
+    def shifted_points(self, params) -> ShiftedPoints:
+        """Compute shifted circuits needed for gradient at `params`.
+
+        Gate parameters whose derivatives vanish at `params` are not shifted.
+        """
+        params = np.asarray(params, dtype=float)
+        if params.shape != (self.n_params,):
+            raise ValueError(
+                f"Expected vector of {self.n_params} parameters, got array of shape "
+                f"{params.shape}."
+            )
+        slots = np.array(self._evaluate_slots(*params), dtype=complex).real
+        jacobian = np.array(
+            self._evaluate_jacobian(*params), dtype=complex
+        ).real.reshape(self.n_slots, self.n_params)
+        active = np.flatnonzero(np.any(jacobian != 0, axis=1))
+
+        points = np.repeat(slots.reshape(1, self.n_slots), 2 * len(active), axis=0)
+        points[0::2, active] += np.eye(len(active)) * SHIFT
+        points[1::2, active] -= np.eye(len(active)) * SHIFT
+        return ShiftedPoints(points, active, jacobian[active])
@@ -0,0 +1,281 @@
+"""Instrumentation of simulator calls.
+
+Every simulation is described by a `CallRecord` holding time spent in each of its
+stages, resource usage of the interpreter process and number of bytes exchanged
+with it through scratch files. Records are accumulated into `SimulationStats` and
+passed to hooks registered with `SimulationStats.add_hook`, e.g. the one returned
+by `make_tracing_hook`, which exports them as OpenTelemetry spans.
+"""
+import contextlib
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence
+
+# Stages in which files are exchanged with the interpreter.
+IO_STAGES = ("qasm", "load")
+SIMULATION_STAGE = "simulation"
+
+
+@dataclass
+class ProcessUsage:
+    """Resources used by an interpreter process.
+
+    Attributes:
+        max_rss: peak resident set size in bytes.
+        user_time: user CPU time in seconds.
+        system_time: system CPU time in seconds.
+    """
+
+    max_rss: int
+    user_time: float
+    system_time: float
+
+    @classmethod
+    def from_rusage(cls, rusage) -> "ProcessUsage":
+        # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS.
+        scale = 1 if sys.platform == "darwin" else 1024
+        return cls(rusage.ru_maxrss * scale, rusage.ru_utime, rusage.ru_stime)
+
+
+def _exit_code(status: int) -> int:
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class ExecutableNotFound(FileNotFoundError):
+    """Raised if a program to be run is not installed or is not executable."""
+
+
+@lru_cache(maxsize=None)
+def find_executable(command: str, path: Optional[str] = None) -> Optional[str]:
+    """Locate `command` like `shutil.which`, probing the filesystem only once for
+    each command and search path.
+
+    Programs installed after the first probe are found only after
+    `find_executable.cache_clear()`.
+    """
+    return shutil.which(command, path=path)
+
+
+def check_executable(argv: Sequence[str], env: Optional[Dict[str, str]] = None) -> None:
+    """Check that the program of `argv` can be started with environment `env`.
+
+    Raises:
+        ExecutableNotFound: if the program is not installed or is not executable.
+    """
+    path = (os.environ if env is None else env).get("PATH")
+    if find_executable(argv[0], path) is None:
+        raise ExecutableNotFound(
+            f"Cannot run {argv[0]}: it is not installed or it is not executable."
+        )
+
+
+def run_process(
+    argv: Sequence[str],
+    env: Optional[Dict[str, str]] = None,
+    on_start: Optional[Callable[[int], None]] = None,
+) -> ProcessUsage:
+    """Run process like `subprocess.run(argv, env=env, check=True)`, returning its
+    resource usage.
+
+    Args:
+        argv: command line of the process.
+        env: environment of the process.
+        on_start: called with pid of the process right after it is started.
+    """
+    with subprocess.Popen(argv, env=env) as process:
+        if on_start is not None:
+            on_start(process.pid)
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = _exit_code(status)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, list(argv))
+    return ProcessUsage.from_rusage(rusage)
+
+
+@dataclass
+class CallRecord:
+    """Instrumentation of a single simulation.
+
+    Attributes:
+        kind: kind of simulation, i.e. "wavefunction", "expectation_values" or
+            "measure".
+        stages: time in seconds spent in each stage of the simulation.
+        usage: resources used by the interpreter, if known.
+        bytes_written: number of bytes of input files written for the interpreter.
+        bytes_read: number of bytes of output files read from the interpreter.
+        n_files: number of scratch files used.
+        n_removed_gates: number of gates removed by simplifying the circuit.
+        cached: whether the result was served from cache.
+        in_process: whether the circuit was simulated in process instead of by the
+            interpreter, see `qeqhipster.statevector`.
+        start_time_ns: wall-clock time at which the call started.
+        end_time_ns: wall-clock time at which the call ended.
+    """
+
+    kind: str
+    stages: Dict[str, float] = field(default_factory=dict)
+    usage: Optional[ProcessUsage] = None
+    bytes_written: int = 0
+    bytes_read: int = 0
+    n_files: int = 0
+    n_removed_gates: int = 0
+    cached: bool = False
+    in_process: bool = False
+    start_time_ns: int = field(default_factory=time.time_ns)
+    end_time_ns: int = 0
+
+    @property
+    def total_time(self) -> float:
+        return (self.end_time_ns - self.start_time_ns) / 1e9
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Add time spent in the context to stage `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def add_file(self, path: str, written: bool) -> None:
+        size = os.path.getsize(path)
+        if written:
+            self.bytes_written += size
+        else:
+            self.bytes_read += size
+
+
+class _DisabledCallRecord:
+    """Stand-in for `CallRecord` used when instrumentation is disabled."""
+
+    _null_context = contextlib.nullcontext()
+    kind = ""
+    usage = None
+    cached = False
+    in_process = False
+    n_files = 0
+    n_removed_gates = 0
+
+    def stage(self, name):
+        return self._null_context
+
+    def add_file(self, path, written):
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+
+DISABLED_CALL = _DisabledCallRecord()
+
+
+class SimulationStats:
+    """Instrumentation accumulated over all calls of a simulator.
+
+    Attributes:
+        n_calls: number of recorded calls.
+        n_cached_calls: number of calls served from cache.
+        n_in_process_calls: number of calls simulated in process.
+        n_files: number of scratch files used.
+        n_removed_gates: number of gates removed by simplifying circuits.
+        stage_times: total time in seconds spent in each stage.
+        bytes_written: total number of bytes written for the interpreter.
+        bytes_read: total number of bytes read from the interpreter.
+        child_user_time: total user CPU time of interpreter processes.
+        child_system_time: total system CPU time of interpreter processes.
+        max_child_rss: largest peak RSS of an interpreter process, in bytes.
+        last_call: most recently recorded call.
+    """
+
+    def __init__(self):
+        self.n_calls = 0
+        self.n_cached_calls = 0
+        self.n_in_process_calls = 0
+        self.n_files = 0
+        self.n_removed_gates = 0
+        self.stage_times: Dict[str, float] = {}
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.child_user_time = 0.0
+        self.child_system_time = 0.0
+        self.max_child_rss = 0
+        self.last_call: Optional[CallRecord] = None
+        self._hooks: List[Callable[[CallRecord], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def io_time(self) -> float:
+        """Time spent on writing inputs and reading outputs of the interpreter."""
+        return sum(self.stage_times.get(stage, 0.0) for stage in IO_STAGES)
+
+    @property
+    def simulation_time(self) -> float:
+        """Time spent waiting for the interpreter or simulating circuits in
+        process."""
+        return self.stage_times.get(SIMULATION_STAGE, 0.0)
+
+    def add_hook(self, hook: Callable[[CallRecord], None]) -> None:
+        """Register function called with record of every finished call."""
+        self._hooks.append(hook)
+
+    def record(self, call: CallRecord) -> None:
+        call.end_time_ns = time.time_ns()
+        with self._lock:
+            self.n_calls += 1
+            self.n_cached_calls += call.cached
+            self.n_in_process_calls += call.in_process
+            self.n_files += call.n_files
+            self.n_removed_gates += call.n_removed_gates
+            for stage, stage_time in call.stages.items():
+                self.stage_times[stage] = self.stage_times.get(stage, 0.0) + stage_time
+            self.bytes_written += call.bytes_written
+            self.bytes_read += call.bytes_read
+            if call.usage is not None:
+                self.child_user_time += call.usage.user_time
+                self.child_system_time += call.usage.system_time
+                self.max_child_rss = max(self.max_child_rss, call.usage.max_rss)
+            self.last_call = call
+        for hook in self._hooks:
+            hook(call)
+
+
+def make_tracing_hook(tracer, span_name: str = "qhipster.{kind}"):
+    """Make hook exporting calls as spans of an OpenTelemetry tracer.
+
+    Args:
+        tracer: tracer, e.g. `opentelemetry.trace.get_tracer(__name__)`.
+        span_name: format of span names, filled with call's kind.
+    """
+
+    def _hook(call: CallRecord) -> None:
+        attributes = {
+            "qhipster.cached": call.cached,
+            "qhipster.in_process": call.in_process,
+            "qhipster.bytes_written": call.bytes_written,
+            "qhipster.bytes_read": call.bytes_read,
+            **{f"qhipster.stage.{name}": value for name, value in call.stages.items()},
+        }
+        if call.usage is not None:
+            attributes.update(
+                {
+                    "qhipster.child.max_rss": call.usage.max_rss,
+                    "qhipster.child.user_time": call.usage.user_time,
+                    "qhipster.child.system_time": call.usage.system_time,
+                }
+            )
+        span = tracer.start_span(
+            span_name.format(kind=call.kind),
+            start_time=call.start_time_ns,
+            attributes=attributes,
+        )
+        span.end(end_time=call.end_time_ns)
+
+    return _hook
@@ -0,0 +1,235 @@
+"""Preflight memory estimates and memory admission control.
+
+A state vector of n qubits takes 16 * 2**n bytes, but a simulation needs several
+times that at its peak, depending on how its results are passed back. Peak memory
+of a job is predicted by `estimate_memory` before the interpreter is started, and
+jobs reserve their predicted peak in a `MemoryBudget`. Jobs that would not fit into
+the budget even on their own are rejected with `MemoryBudgetExceeded`, other jobs
+wait until enough memory is released by jobs running concurrently.
+"""
+import os
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+from .wavefunction import AMPLITUDE_DTYPE, OUTPUT_DTYPES, OUTPUT_MODES
+
+SIMULATION_KINDS = ("wavefunction", "expectation_values", "measure")
+
+# Fraction of memory available to the process used by default memory budgets.
+DEFAULT_MEMORY_FRACTION = 0.8
+
+AMPLITUDE_BYTES = AMPLITUDE_DTYPE.itemsize
+# Memory taken by the interpreter regardless of circuit's size, i.e. its code,
+# libraries and thread stacks.
+NATIVE_BASE_BYTES = 64 * 2**20
+# Number of state vectors held by the interpreter. Expectation values are computed
+# by applying Pauli strings to a copy of the state.
+NATIVE_STATE_COPIES = {"wavefunction": 1, "expectation_values": 2, "measure": 1}
+# Number of state vectors held by MPI ranks, in total, in buffers for amplitudes
+# exchanged with other ranks.
+NATIVE_MPI_BUFFER_COPIES = 1
+# Length of an amplitude in JSON output, i.e. of its real and imaginary parts
+# printed with full precision.
+JSON_BYTES_PER_AMPLITUDE = 48
+# Parsed JSON output holds every amplitude as two Python floats referenced from
+# two lists.
+PARSED_JSON_BYTES_PER_AMPLITUDE = 2 * (24 + 8)
+
+_CGROUP_LIMIT_FILES = (
+    "/sys/fs/cgroup/memory.max",
+    "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+)
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """Raised if a job would need more memory than its budget allows."""
+
+
+@dataclass(frozen=True)
+class MemoryEstimate:
+    """Predicted memory usage of a single simulation, in bytes.
+
+    Attributes:
+        native: peak memory of the interpreter process.
+        python: peak memory needed for reading and post-processing its results.
+        scratch: size of scratch files kept in memory during the simulation.
+    """
+
+    native: int
+    python: int
+    scratch: int = 0
+
+    @property
+    def peak(self) -> int:
+        # Results are read after the interpreter exits, but scratch files are kept
+        # until the simulation ends.
+        return self.scratch + max(self.native, self.python)
+
+
+def estimate_memory(
+    n_qubits: int,
+    kind: str = "wavefunction",
+    binary: bool = True,
+    reorder: bool = False,
+    in_memory_scratch: bool = False,
+    n_ranks: int = 1,
+    output: str = "complex128",
+) -> MemoryEstimate:
+    """Predict memory usage of simulating circuit with `n_qubits` qubits.
+
+    Args:
+        n_qubits: number of qubits of the circuit.
+        kind: one of `SIMULATION_KINDS`.
+        binary: whether the state vector is passed back in binary format (as opposed
+            to JSON).
+        reorder: whether the qubit order of the state vector has to be reversed.
+        in_memory_scratch: whether scratch files are kept in memory, e.g. in
+            `/dev/shm`.
+        n_ranks: number of MPI ranks the state vector is split between, see
+            `qeqhipster.mpi`. The estimate covers all of them, as if they ran on a
+            single machine.
+        output: one of `qeqhipster.wavefunction.OUTPUT_MODES`, the form in which
+            the state vector of a "wavefunction" simulation is returned. Sparse
+            output is assumed to be negligibly small.
+    """
+    if kind not in SIMULATION_KINDS:
+        raise ValueError(
+            f"Unknown simulation kind: {kind}. Supported kinds are: "
+            f"{SIMULATION_KINDS}."
+        )
+    if output not in OUTPUT_MODES:
+        raise ValueError(
+            f"Unknown output mode: {output}. Supported modes are: {OUTPUT_MODES}."
+        )
+    n_amplitudes = 2**n_qubits
+    state_bytes = AMPLITUDE_BYTES * n_amplitudes
+    native = NATIVE_BASE_BYTES * n_ranks + NATIVE_STATE_COPIES[kind] * state_bytes
+    if n_ranks > 1:
+        native += NATIVE_MPI_BUFFER_COPIES * state_bytes
+    if kind == "expectation_values":
+        return MemoryEstimate(native, python=0)
+
+    if binary:
+        output_bytes = state_bytes
+        if kind == "wavefunction" and output != "complex128":
+            # Memory map is converted block by block, and reordered (if at all)
+            # after conversion.
+            python = (
+                OUTPUT_DTYPES[output].itemsize * n_amplitudes
+                if output in OUTPUT_DTYPES
+                else 0
+            )
+        else:
+            # Memory map is backed by the output file until its pages are modified
+            # by reordering or copied into the result.
+            python = state_bytes if reorder or kind == "wavefunction" else 0
+    else:
+        output_bytes = JSON_BYTES_PER_AMPLITUDE * n_amplitudes
+        parsed_bytes = PARSED_JSON_BYTES_PER_AMPLITUDE * n_amplitudes
+        # Text is released once parsed, the parsed lists only after the array (and
+        # its contiguous copy) has been built.
+        python = parsed_bytes + max(output_bytes, 2 * state_bytes)
+    return MemoryEstimate(native, python, output_bytes if in_memory_scratch else 0)
+
+
+def _cgroup_memory_limit() -> Optional[int]:
+    for path in _CGROUP_LIMIT_FILES:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit():
+            return int(value)
+    return None
+
+
+def memory_limit() -> int:
+    """Return memory available to the process, i.e. physical memory or the limit of
+    its cgroup if it is lower."""
+    physical = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    cgroup_limit = _cgroup_memory_limit()
+    return min(physical, cgroup_limit) if cgroup_limit else physical
+
+
+def _check(n_bytes: int, limit: int) -> None:
+    if n_bytes > limit:
+        raise MemoryBudgetExceeded(
+            f"Job needs an estimated {n_bytes / 2**30:.2f}GiB of memory, which "
+            f"exceeds the memory budget of {limit / 2**30:.2f}GiB."
+        )
+
+
+class MemoryBudget:
+    """Pool of memory shared by concurrently running jobs.
+
+    Args:
+        limit: size of the pool in bytes. Defaults to `DEFAULT_MEMORY_FRACTION` of
+            `memory_limit()`.
+    """
+
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = (
+            int(DEFAULT_MEMORY_FRACTION * memory_limit()) if limit is None else limit
+        )
+        self._available = self.limit
+        self._condition = threading.Condition()
+
+    def check(self, n_bytes: int) -> None:
+        """Raise `MemoryBudgetExceeded` if `n_bytes` can never be reserved."""
+        _check(n_bytes, self.limit)
+
+    @contextmanager
+    def reserve(self, n_bytes: int):
+        self.check(n_bytes)
+        with self._condition:
+            self._condition.wait_for(lambda: self._available >= n_bytes)
+            self._available -= n_bytes
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._available += n_bytes
+                self._condition.notify_all()
+
+
+_default_budget: Optional[MemoryBudget] = None
+_default_budget_lock = threading.Lock()
+
+
+def default_memory_budget() -> MemoryBudget:
+    """Return memory budget shared by all simulators of this process."""
+    global _default_budget
+    with _default_budget_lock:
+        if _default_budget is None:
+            _default_budget = MemoryBudget()
+        return _default_budget
+
+
+class AsyncMemoryBudget:
+    """Pool of memory shared by concurrently running coroutines.
+
+    Has to be created in the event loop in which it is used.
+    """
+
+    def __init__(self, limit: int):
+        import asyncio
+
+        self.limit = limit
+        self._available = limit
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def reserve(self, n_bytes: int):
+        _check(n_bytes, self.limit)
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._available >= n_bytes)
+            self._available -= n_bytes
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._available += n_bytes
+                self._condition.notify_all()
@@ -0,0 +1,167 @@
+"""Distributed simulation of a single circuit by multiple MPI ranks.
+
+qHiPSTER splits the state vector of n qubits between 2**k ranks, rank r holding
+amplitudes r * 2**(n - k) to (r + 1) * 2**(n - k) - 1 in its native qubit order
+(qubit 0 being the least significant bit of amplitude index). Highest k qubits are
+thus global, the remaining n - k are local to each rank.
+
+MPI interpreters are launched with `mpirun` and never gather results on a single
+rank. Given output path `path`, each rank writes its part of the result into
+`path.<rank>`:
+
+- the wavefunction interpreter writes its shard of the state vector as raw
+  complex128 values, which are memory-mapped into a `ShardedStateVector`,
+- the expectation values interpreter writes contributions of its amplitudes to the
+  expectation values in the JSON format of the non-MPI interpreter, which are summed
+  by `reduce_expectation_values`.
+
+Ranks may run on a single machine, in which case all scratch backends using files
+work. On a cluster, scratch directory has to be shared by all nodes.
+"""
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .wavefunction import load_binary_wavefunction
+
+MPIRUN = "mpirun"
+
+
+@dataclass(frozen=True)
+class MPIConfig:
+    """How the interpreter is launched under MPI.
+
+    Attributes:
+        n_ranks: number of ranks, has to be a power of two.
+        ranks_per_node: number of ranks placed on each node. Defaults to the
+            placement chosen by `mpirun`.
+        mpirun: command launching MPI programs.
+        mpirun_args: additional arguments of `mpirun`, e.g. a host file.
+    """
+
+    n_ranks: int
+    ranks_per_node: Optional[int] = None
+    mpirun: str = MPIRUN
+    mpirun_args: Tuple[str, ...] = ()
+
+    def __post_init__(self):
+        if self.n_ranks < 1 or self.n_ranks & (self.n_ranks - 1):
+            raise ValueError(
+                f"Number of MPI ranks has to be a power of two, got {self.n_ranks}."
+            )
+        if self.ranks_per_node is not None and self.ranks_per_node < 1:
+            raise ValueError("Number of MPI ranks per node has to be positive.")
+
+    @property
+    def global_qubits(self) -> int:
+        """Number of qubits whose state determines the rank holding amplitudes."""
+        return self.n_ranks.bit_length() - 1
+
+    def local_qubits(self, n_qubits: int) -> int:
+        """Number of qubits of the state vector shard held by each rank."""
+        if n_qubits < self.global_qubits:
+            raise ValueError(
+                f"Circuit with {n_qubits} qubits cannot be split between "
+                f"{self.n_ranks} MPI ranks."
+            )
+        return n_qubits - self.global_qubits
+
+    def threads_per_rank(self, nthreads: int) -> int:
+        """Split total number of threads of a simulation between ranks."""
+        return max(1, nthreads // self.n_ranks)
+
+    def argv(self, interpreter_argv: Sequence[str]) -> List[str]:
+        """Command line running the interpreter under `mpirun`."""
+        argv = [self.mpirun, "-n", str(self.n_ranks)]
+        if self.ranks_per_node is not None:
+            argv += ["-ppn", str(self.ranks_per_node)]
+        return [*argv, *self.mpirun_args, *interpreter_argv]
+
+
+class ShardedStateVector:
+    """State vector stored as equally sized, consecutive shards.
+
+    Supports `len`, integer and slice indexing and indexing with integer arrays, so
+    that it can be sampled with `qeqhipster.wavefunction.sample_counts` and passed to
+    `qeqhipster.pauli.expectation_values` without being stitched together.
+
+    Args:
+        shards: parts of the state vector, e.g. memory maps of files written by MPI
+            ranks. All of them have the same length, which is a power of two.
+    """
+
+    def __init__(self, shards: Sequence[np.ndarray]):
+        shard_size = len(shards[0]) if shards else 0
+        if (
+            not shards
+            or shard_size & (shard_size - 1)
+            or shard_size == 0
+            or any(len(shard) != shard_size for shard in shards)
+        ):
+            raise ValueError("Shards have to be non-empty and of equal size.")
+        self.shards = list(shards)
+        self.shard_size = shard_size
+        self.dtype = np.result_type(*self.shards)
+        self._shard_bits = shard_size.bit_length() - 1
+
+    def __len__(self):
+        return self.shard_size * len(self.shards)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return self._slice(start, stop)
+            key = np.arange(start, stop, step)
+        elif np.ndim(key) == 0:
+            shard, offset = divmod(int(key) % len(self), self.shard_size)
+            return self.shards[shard][offset]
+        return self._take(np.asarray(key))
+
+    def _slice(self, start, stop):
+        if start >= stop:
+            return np.empty(0, dtype=self.dtype)
+        first, last = start >> self._shard_bits, (stop - 1) >> self._shard_bits
+        offset = first << self._shard_bits
+        if first == last:
+            return self.shards[first][start - offset : stop - offset]
+        return np.concatenate(self.shards[first : last + 1])[
+            start - offset : stop - offset
+        ]
+
+    def _take(self, indices):
+        shard_of_index = indices >> self._shard_bits
+        offsets = indices & (self.shard_size - 1)
+        first = shard_of_index.min(initial=0)
+        if first == shard_of_index.max(initial=0):
+            return np.asarray(self.shards[first][offsets])
+        result = np.empty(indices.shape, dtype=self.dtype)
+        for shard in np.unique(shard_of_index):
+            selected = shard_of_index == shard
+            result[selected] = self.shards[shard][offsets[selected]]
+        return result
+
+    def to_array(self) -> np.ndarray:
+        """Stitch shards into a single writeable array."""
+        amplitudes = np.empty(len(self), dtype=self.dtype)
+        for index, shard in enumerate(self.shards):
+            start = index * self.shard_size
+            amplitudes[start : start + self.shard_size] = shard
+        return amplitudes
+
+    def __array__(self, dtype=None):
+        amplitudes = self.to_array()
+        return amplitudes if dtype is None else amplitudes.astype(dtype, copy=False)
+
+
+def load_sharded_wavefunction(paths: Sequence[str]) -> ShardedStateVector:
+    """Memory-map state vector shards written by MPI ranks, in order of ranks."""
+    return ShardedStateVector([load_binary_wavefunction(path) for path in paths])
+
+
+def reduce_expectation_values(paths: Sequence[str]) -> np.ndarray:
+    """Sum contributions to expectation values written by MPI ranks."""
+    from zquantum.core.measurement import load_expectation_values
+
+    return np.sum([load_expectation_values(path).values for path in paths], axis=0)
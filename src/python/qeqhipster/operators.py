@@ -0,0 +1,287 @@
+"""Preparation of operators for the expectation values interpreter.
+
+The interpreter reads operators as Pauli strings files. Preparing such a file for a
+large operator takes time, but in typical variational algorithms the same operator
+is evaluated thousands of times. Prepared operators are therefore stored in a
+persistent cache directory, keyed by content hash of the operator's terms.
+
+Several operators evaluated against the same state are prepared as a single Pauli
+strings file, the concatenation of their files, so that a single run of the
+interpreter computes expectation values of all of them.
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .pauli import PauliTerms
+from .utils import (
+    is_negligible_coefficient,
+    save_symbolic_operator,
+    write_pauli_strings,
+)
+
+if TYPE_CHECKING:
+    from zquantum.core.openfermion import SymbolicOperator
+
+PAULI_STRINGS_CONVERTER = "/app/json_parser/qubitop_to_paulistrings.o"
+
+OPERATOR_JSON_FILENAME = "temp_qhipster_operator.json"
+OPERATOR_TXT_FILENAME = "temp_qhipster_operator.txt"
+
+# Prepared operators are evicted from the cache directory, least recently used first,
+# once it holds more than this many of them or more than this many bytes.
+MAX_CACHED_OPERATORS = 4096
+MAX_CACHED_OPERATOR_BYTES = 2**30
+
+
+def default_operator_cache_dir() -> str:
+    cache_home = os.getenv("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "qeqhipster", "operators")
+
+
+def hash_operator(op: "SymbolicOperator") -> str:
+    """Compute content hash of operator's terms, preserving their order."""
+    digest = hashlib.sha256(type(op).__name__.encode())
+    for term, coefficient in op.terms.items():
+        digest.update(repr((term, complex(coefficient))).encode())
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class PreparedOperator:
+    """Operator prepared for the expectation values interpreter.
+
+    Attributes:
+        hash: content hash of the operator's terms.
+        path: path to Pauli strings file read by the interpreter.
+        n_terms: number of the operator's terms.
+        term_indices: indices of terms written to Pauli strings file. Terms with
+            negligible coefficients are omitted.
+        coefficients: coefficients of written terms, in the order matching order of
+            expectation values produced by the interpreter.
+    """
+
+    hash: str
+    path: str
+    n_terms: int
+    term_indices: np.ndarray
+    coefficients: np.ndarray
+
+    def rescale(self, values: np.ndarray) -> np.ndarray:
+        """Turn expectation values of Pauli strings into expectation values of terms.
+
+        Terms omitted from Pauli strings file get expectation value 0.
+        """
+        rescaled_values = np.zeros(self.n_terms)
+        rescaled_values[self.term_indices] = np.real(self.coefficients * values)
+        return rescaled_values
+
+
+@dataclass(frozen=True)
+class PreparedOperatorSet:
+    """Several operators prepared as a single Pauli strings file.
+
+    Attributes:
+        hash: content hash of all operators, preserving their order.
+        path: path to Pauli strings file containing Pauli strings of all operators,
+            one operator after another.
+        operators: the prepared operators.
+    """
+
+    hash: str
+    path: str
+    operators: Tuple[PreparedOperator, ...]
+
+    def rescale(self, values: np.ndarray) -> List[np.ndarray]:
+        """Split expectation values of Pauli strings between operators and turn
+        them into expectation values of operators' terms."""
+        rescaled_values = []
+        start = 0
+        for operator in self.operators:
+            stop = start + len(operator.term_indices)
+            rescaled_values.append(operator.rescale(values[start:stop]))
+            start = stop
+        return rescaled_values
+
+
+def _prepare_coefficients(op: "SymbolicOperator"):
+    all_coefficients = np.array(list(op.terms.values()), dtype=complex)
+    term_indices = np.flatnonzero(
+        [not is_negligible_coefficient(c) for c in all_coefficients]
+    )
+    return len(all_coefficients), term_indices, all_coefficients[term_indices]
+
+
+def convert_with_native_converter(op: "SymbolicOperator", dir_path: str) -> None:
+    """Write Pauli strings file into `dir_path` using `qubitop_to_paulistrings.o`."""
+    operator_json_path = os.path.join(dir_path, OPERATOR_JSON_FILENAME)
+    save_symbolic_operator(op, operator_json_path)
+    subprocess.run([PAULI_STRINGS_CONVERTER, operator_json_path], check=True)
+    os.remove(operator_json_path)
+
+
+class OperatorCache:
+    """Persistent cache of prepared operators.
+
+    Every prepared operator lives in its own subdirectory of `cache_dir` named after
+    its hash. Subdirectories are populated in a temporary location and then renamed,
+    so concurrent processes sharing the cache never see partially written files.
+
+    Modification time of a subdirectory is updated whenever it is used. After a new
+    operator is stored, least recently used subdirectories are removed until the
+    cache fits into `max_entries` and `max_bytes`. Operators evicted while a
+    process still holds them are prepared again on next use.
+
+    Args:
+        cache_dir: directory in which prepared operators are stored. Defaults to
+            `qeqhipster/operators` in the user's cache directory.
+        use_native_converter: if True, Pauli strings files are produced by the
+            `qubitop_to_paulistrings.o` tool instead of `write_pauli_strings`.
+        max_entries: maximum number of prepared operators (and operator sets) kept
+            in `cache_dir`. Unbounded if None.
+        max_bytes: maximum total size of files kept in `cache_dir`. Unbounded if
+            None.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        use_native_converter: bool = False,
+        max_entries: Optional[int] = MAX_CACHED_OPERATORS,
+        max_bytes: Optional[int] = MAX_CACHED_OPERATOR_BYTES,
+    ):
+        self.cache_dir = cache_dir or default_operator_cache_dir()
+        self.use_native_converter = use_native_converter
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._prepared: Dict[str, PreparedOperator] = {}
+        self._pauli_terms: Dict[Tuple[str, int, bool], PauliTerms] = {}
+        self._lock = threading.Lock()
+
+    def prepare(self, op: "SymbolicOperator") -> PreparedOperator:
+        operator_hash = hash_operator(op)
+        with self._lock:
+            prepared = self._prepared.get(operator_hash)
+            if prepared is None or not _touch(prepared.path):
+                n_terms, term_indices, coefficients = _prepare_coefficients(op)
+                self._prepared[operator_hash] = PreparedOperator(
+                    hash=operator_hash,
+                    path=self._ensure_pauli_strings(op, operator_hash),
+                    n_terms=n_terms,
+                    term_indices=term_indices,
+                    coefficients=coefficients,
+                )
+            return self._prepared[operator_hash]
+
+    def pauli_terms(
+        self, op: "SymbolicOperator", n_qubits: int, native_qubit_order: bool = False
+    ) -> PauliTerms:
+        """Return operator's terms encoded for `qeqhipster.pauli`, kept in memory
+        for subsequent calls."""
+        key = (hash_operator(op), n_qubits, native_qubit_order)
+        with self._lock:
+            if key not in self._pauli_terms:
+                self._pauli_terms[key] = PauliTerms.from_operator(
+                    op, n_qubits, native_qubit_order
+                )
+            return self._pauli_terms[key]
+
+    def prepare_many(self, ops: Sequence["SymbolicOperator"]) -> PreparedOperatorSet:
+        operators = tuple(self.prepare(op) for op in ops)
+        if len(operators) == 1:
+            return PreparedOperatorSet(operators[0].hash, operators[0].path, operators)
+
+        digest = hashlib.sha256(b"PreparedOperatorSet")
+        for operator in operators:
+            digest.update(operator.hash.encode())
+        set_hash = digest.hexdigest()
+
+        def _concatenate(dir_path):
+            with open(os.path.join(dir_path, OPERATOR_TXT_FILENAME), "wb") as f:
+                for operator in operators:
+                    with open(operator.path, "rb") as operator_file:
+                        shutil.copyfileobj(operator_file, f)
+
+        with self._lock:
+            path = self._ensure_file(set_hash, _concatenate)
+        return PreparedOperatorSet(set_hash, path, operators)
+
+    def _ensure_pauli_strings(self, op: "SymbolicOperator", operator_hash: str) -> str:
+        def _write(dir_path):
+            if self.use_native_converter:
+                convert_with_native_converter(op, dir_path)
+            else:
+                write_pauli_strings(op, os.path.join(dir_path, OPERATOR_TXT_FILENAME))
+
+        return self._ensure_file(operator_hash, _write)
+
+    def _ensure_file(self, operator_hash: str, write: Callable[[str], None]) -> str:
+        """Return path to Pauli strings file stored under `operator_hash`, calling
+        `write` with a directory in which to write it if it is not stored yet."""
+        operator_dir = os.path.join(self.cache_dir, operator_hash)
+        operator_txt_path = os.path.join(operator_dir, OPERATOR_TXT_FILENAME)
+        if _touch(operator_txt_path):
+            return operator_txt_path
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".staging-")
+        try:
+            write(staging_dir)
+            os.rename(staging_dir, operator_dir)
+        except OSError:
+            # Another process has prepared the same operator in the meantime.
+            if not os.path.exists(operator_txt_path):
+                raise
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        self._evict(keep=operator_hash)
+        return operator_txt_path
+
+    def _evict(self, keep: str) -> None:
+        """Remove least recently used entries other than `keep` until the cache
+        fits into its bounds."""
+        if self.max_entries is None and self.max_bytes is None:
+            return
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.startswith(".") or not entry.is_dir():
+                    continue
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                    entries.append((entry.stat().st_mtime, entry.name, size))
+                except FileNotFoundError:
+                    # Evicted by another process in the meantime.
+                    continue
+        n_entries = len(entries)
+        total_bytes = sum(size for _, _, size in entries)
+        for _, name, size in sorted(entries):
+            if (self.max_entries is None or n_entries <= self.max_entries) and (
+                self.max_bytes is None or total_bytes <= self.max_bytes
+            ):
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            n_entries -= 1
+            total_bytes -= size
+
+
+def _touch(path: str) -> bool:
+    """Mark cache entry containing `path` as used, telling if it still exists."""
+    if not os.path.exists(path):
+        return False
+    try:
+        os.utime(os.path.dirname(path))
+    except FileNotFoundError:
+        return False
+    return True
@@ -0,0 +1,209 @@
+"""Expectation values of Pauli strings computed from a state vector with NumPy.
+
+A Pauli string P flips the bits of basis states in its X/Y support (its x mask) and
+multiplies them by a phase depending on parity of bits in its Y/Z support (its z
+mask):
+
+    P|i> = i**n_y * (-1)**popcount(i & z) |i ^ x>,
+
+hence
+
+    <psi|P|psi> = i**n_y * sum_i (-1)**popcount(i & z) conj(psi[i ^ x]) psi[i].
+
+Terms are grouped by their x mask, so that each group shares the product
+conj(psi[i ^ x]) psi[i]. Sums over signs given by z masks are computed directly for
+groups of one or two terms, and read off the Walsh-Hadamard transform of the product for
+groups with many terms. State vector is processed in chunks of bounded size, so
+memory overhead does not grow with the number of qubits.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+# Number of amplitudes processed at once.
+DEFAULT_CHUNK_SIZE = 2**20
+# Groups with more terms than this get their sums from Walsh-Hadamard transform,
+# which costs about as much as summing a couple of terms directly.
+DIRECT_SUM_MAX_TERMS = 2
+
+_FACTOR_X = {"X": 1, "Y": 1, "Z": 0}
+_FACTOR_Z = {"X": 0, "Y": 1, "Z": 1}
+
+
+@dataclass(frozen=True)
+class PauliTerms:
+    """Pauli strings with coefficients, encoded as bit masks over amplitude indices.
+
+    Attributes:
+        x_masks: bits flipped by each string.
+        z_masks: bits contributing to sign of each string.
+        phases: i**n_y of each string, n_y being number of its Y factors.
+        coefficients: coefficient of each string.
+    """
+
+    x_masks: np.ndarray
+    z_masks: np.ndarray
+    phases: np.ndarray
+    coefficients: np.ndarray
+
+    def __len__(self):
+        return len(self.coefficients)
+
+    @classmethod
+    def from_operator(
+        cls, op, n_qubits: int, native_qubit_order: bool = False
+    ) -> "PauliTerms":
+        """Encode terms of a QubitOperator.
+
+        Terms with negligible coefficients get zero coefficients, which matches
+        expectation values computed by the interpreter.
+
+        Args:
+            op: the operator.
+            n_qubits: number of qubits of state vectors the terms act on.
+            native_qubit_order: whether the state vectors use qubit order native to
+                qHiPSTER (qubit 0 being the least significant bit of amplitude
+                index) instead of the order used by z-quantum-core.
+
+        Raises:
+            ValueError: if the operator acts on qubits beyond `n_qubits`.
+        """
+        from .utils import is_negligible_coefficient
+
+        action_strings = dict(zip(op.actions, op.action_strings))
+        n_terms = len(op.terms)
+        x_masks = np.zeros(n_terms, dtype=np.uint64)
+        z_masks = np.zeros(n_terms, dtype=np.uint64)
+        n_ys = np.zeros(n_terms, dtype=int)
+        coefficients = np.zeros(n_terms, dtype=complex)
+        for index, (term, coefficient) in enumerate(op.terms.items()):
+            x_mask = z_mask = n_y = 0
+            for qubit, action in term:
+                if qubit >= n_qubits:
+                    raise ValueError(
+                        f"Operator acts on qubit {qubit}, but state vectors have "
+                        f"only {n_qubits} qubits."
+                    )
+                action = action_strings[action]
+                bit = 1 << (qubit if native_qubit_order else n_qubits - 1 - qubit)
+                x_mask |= bit * _FACTOR_X[action]
+                z_mask |= bit * _FACTOR_Z[action]
+                n_y += action == "Y"
+            x_masks[index], z_masks[index], n_ys[index] = x_mask, z_mask, n_y
+            if not is_negligible_coefficient(coefficient):
+                coefficients[index] = coefficient
+        return cls(x_masks, z_masks, 1j**n_ys, coefficients)
+
+
+@lru_cache(maxsize=None)
+def _parity_table() -> np.ndarray:
+    """Parity of number of set bits of every 16-bit value, built on first use."""
+    table = np.zeros(2**16, dtype=np.int8)
+    for bit in range(16):
+        table ^= ((np.arange(2**16) >> bit) & 1).astype(np.int8)
+    return table
+
+
+def _parity(values: np.ndarray) -> np.ndarray:
+    """Parity of number of set bits of every (non-negative) value."""
+    table = _parity_table()
+    parity = table[values & 0xFFFF]
+    values = values >> 16
+    while values.any():
+        parity ^= table[values & 0xFFFF]
+        values = values >> 16
+    return parity
+
+
+# Number of bits of amplitude index transformed at once by `walsh_hadamard`. Larger
+# blocks make fewer passes over the data at the cost of more arithmetic per pass.
+WALSH_HADAMARD_BLOCK_BITS = 4
+
+
+@lru_cache(maxsize=None)
+def _hadamard_matrix(n_bits: int) -> np.ndarray:
+    matrix = np.ones((1, 1))
+    for _ in range(n_bits):
+        matrix = np.block([[matrix, matrix], [matrix, -matrix]])
+    return matrix
+
+
+def walsh_hadamard(values: np.ndarray) -> np.ndarray:
+    """Unnormalized Walsh-Hadamard transform of complex vector, computed in place.
+
+    Entry z of the result is sum_i (-1)**popcount(i & z) values[i].
+    """
+    n_values = len(values)
+    n_bits = n_values.bit_length() - 1
+    # Real and imaginary parts are transformed together as pairs of floats.
+    pairs = values.view(np.float64)
+    done_bits = 0
+    while done_bits < n_bits:
+        block_bits = min(WALSH_HADAMARD_BLOCK_BITS, n_bits - done_bits)
+        blocks = pairs.reshape(-1, 2**block_bits, 2 ** (done_bits + 1))
+        blocks[...] = np.matmul(_hadamard_matrix(block_bits), blocks)
+        done_bits += block_bits
+    return values
+
+
+def _signed_sums(products, start, z_masks, indices):
+    """Compute sum_i (-1)**popcount(i & z) products[i - start] for each z mask.
+
+    `products` is overwritten.
+    """
+    chunk_size = len(products)
+    if len(z_masks) <= DIRECT_SUM_MAX_TERMS:
+        return np.array(
+            [
+                products.sum() - 2 * products[_parity(indices & z) == 1].sum()
+                for z in z_masks
+            ]
+        )
+    # Chunk is aligned to its size, so its indices share high bits with `start`
+    # and differ in the low ones.
+    transform = walsh_hadamard(products)
+    low_masks = z_masks & (chunk_size - 1)
+    high_signs = 1 - 2 * _parity(z_masks & start).astype(np.int64)
+    return high_signs * transform[low_masks]
+
+
+def expectation_values(
+    amplitudes: np.ndarray,
+    terms: PauliTerms,
+    chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+) -> np.ndarray:
+    """Compute expectation values of terms for a state vector.
+
+    Args:
+        amplitudes: state vector, in the qubit order the terms were encoded for.
+        terms: the terms.
+        chunk_size: maximum number of amplitudes processed at once, rounded down to
+            a power of two. None processes the whole state vector at once.
+
+    Returns:
+        Real parts of coefficient * <psi|P|psi> for each term P.
+    """
+    n_amplitudes = len(amplitudes)
+    if n_amplitudes & (n_amplitudes - 1) or n_amplitudes == 0:
+        raise ValueError("Length of state vector has to be a power of two.")
+    chunk_size = min(chunk_size or n_amplitudes, n_amplitudes)
+    chunk_size = 1 << (chunk_size.bit_length() - 1)
+
+    values = np.zeros(len(terms), dtype=complex)
+    # Masks fit into signed integers, which can be mixed with indices.
+    z_masks = terms.z_masks.astype(np.int64)
+    x_masks, group_of_term, group_sizes = np.unique(
+        terms.x_masks.astype(np.int64), return_inverse=True, return_counts=True
+    )
+    groups = np.split(np.argsort(group_of_term, kind="stable"), np.cumsum(group_sizes))
+    for start in range(0, n_amplitudes, chunk_size):
+        indices = np.arange(start, start + chunk_size, dtype=np.int64)
+        chunk = np.asarray(amplitudes[start : start + chunk_size], dtype=complex)
+        for x_mask, group in zip(x_masks, groups):
+            products = np.asarray(amplitudes[indices ^ x_mask], dtype=complex)
+            np.conj(products, out=products)
+            products *= chunk
+            values[group] += _signed_sums(products, start, z_masks[group], indices)
+    return np.real(terms.coefficients * terms.phases * values)
@@ -0,0 +1,126 @@
+"""Scratch space for files exchanged with the interpreter.
+
+Every simulation passes a circuit (and possibly an operator) to the interpreter and
+reads its results back through files. Creating and removing a temporary directory
+for each simulation is costly if the temporary directory lives on a slow or network
+backed filesystem, hence the following backends are available:
+
+- "tempdir": a new temporary directory for each simulation,
+- "shm": a single directory in `/dev/shm` (or other given directory) reused by all
+  simulations, which use unique file names,
+- "memfd": anonymous in-memory files, passed to the interpreter as
+  `/proc/<pid>/fd/<fd>` paths.
+"""
+import itertools
+import os
+import shutil
+import tempfile
+import weakref
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+SCRATCH_BACKENDS = ("tempdir", "shm", "memfd")
+
+DEFAULT_SHM_DIR = "/dev/shm"
+
+
+class ScratchSession:
+    """Files used by a single simulation, removed when the session ends."""
+
+    def path(self, name: str) -> str:
+        """Return path under which file `name` can be written and read."""
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        raise NotImplementedError()
+
+
+class _DirectorySession(ScratchSession):
+    def __init__(self, dir_path: str, prefix: str = ""):
+        self.dir_path = dir_path
+        self.prefix = prefix
+        self._paths: List[str] = []
+
+    def path(self, name):
+        path = os.path.join(self.dir_path, self.prefix + name)
+        self._paths.append(path)
+        return path
+
+    def close(self):
+        for path in self._paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class _MemfdSession(ScratchSession):
+    def __init__(self):
+        self._fds: List[int] = []
+
+    def path(self, name):
+        fd = os.memfd_create(name)
+        self._fds.append(fd)
+        # Other processes of the same user can open the file through this path as
+        # long as the descriptor is open in this process.
+        return f"/proc/{os.getpid()}/fd/{fd}"
+
+    def close(self):
+        for fd in self._fds:
+            os.close(fd)
+
+
+class Scratch:
+    """Factory of scratch sessions using one of `SCRATCH_BACKENDS`.
+
+    Args:
+        backend: one of `SCRATCH_BACKENDS`.
+        dir_path: parent directory of scratch files. For "tempdir" backend defaults
+            to the system's temporary directory, for "shm" backend to `/dev/shm`.
+    """
+
+    def __init__(self, backend: str = "tempdir", dir_path: Optional[str] = None):
+        if backend not in SCRATCH_BACKENDS:
+            raise ValueError(
+                f"Unknown scratch backend: {backend}. "
+                f"Supported backends are: {SCRATCH_BACKENDS}."
+            )
+        if backend == "memfd" and not hasattr(os, "memfd_create"):
+            raise ValueError("memfd scratch backend is not supported on this system.")
+        self.backend = backend
+        self.dir_path = dir_path
+        self._session_ids = itertools.count()
+        self._shared_dir: Optional[str] = None
+        self._finalizer = None
+        if backend == "shm":
+            self._shared_dir = tempfile.mkdtemp(
+                prefix="qeqhipster-", dir=dir_path or DEFAULT_SHM_DIR
+            )
+            self._finalizer = weakref.finalize(
+                self, shutil.rmtree, self._shared_dir, ignore_errors=True
+            )
+
+    @contextmanager
+    def session(self) -> Iterator[ScratchSession]:
+        if self.backend == "tempdir":
+            with tempfile.TemporaryDirectory(dir=self.dir_path) as dir_path:
+                yield _DirectorySession(dir_path)
+            return
+
+        session: ScratchSession
+        if self.backend == "shm":
+            assert self._shared_dir is not None
+            session = _DirectorySession(
+                self._shared_dir, f"{os.getpid()}-{next(self._session_ids)}-"
+            )
+        else:
+            session = _MemfdSession()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    def close(self) -> None:
+        """Remove directory shared by sessions, if there is one."""
+        if self._finalizer is not None:
+            self._finalizer()
@@ -1,24 +1,54 @@
-import os
-import subprocess
-import tempfile
+import io
+import logging
+import time
+import weakref
+from contextlib import nullcontext
+from functools import lru_cache, partial
+from typing import Dict, Optional
 
 import numpy as np
 from zquantum.core.circuits import Circuit
 from zquantum.core.interfaces.backend import QuantumSimulator, StateVector
-from zquantum.core.measurement import (
-    Measurements,
-    load_expectation_values,
-    load_wavefunction,
-    sample_from_wavefunction,
-)
-from zquantum.core.openfermion.ops import SymbolicOperator
-from zquantum.core.wavefunction import flip_wavefunction
 
-from .utils import (
-    convert_to_simplified_qasm,
-    make_circuit_qhipster_compatible,
-    save_symbolic_operator,
+from . import pauli, statevector
+from .batching import CoreBudget, available_cores, run_batch
+from .cache import ResultCache, make_cache_key
+from .gradients import GradientReport, ParameterShiftGradient
+from .instrumentation import (
+    DISABLED_CALL,
+    CallRecord,
+    ProcessUsage,
+    SimulationStats,
+    check_executable,
+    find_executable,
+    run_process,
+)
+from .memory import MemoryBudget, MemoryEstimate, default_memory_budget, estimate_memory
+from .mpi import MPIRUN, MPIConfig, load_sharded_wavefunction, reduce_expectation_values
+from .operators import MAX_CACHED_OPERATOR_BYTES, OperatorCache
+from .scratch import Scratch
+from .templates import BoundCircuitTemplate, CircuitTemplate
+from .threads import (
+    AUTO_THREADS,
+    binding_env,
+    default_core_allocator,
+    load_thread_profile,
+    set_affinity,
+    thread_chooser,
+)
+from .utils import save_simplified_qasm, simplify_circuit, write_simplified_qasm
+from .wavefunction import (
+    DEFAULT_SPARSE_THRESHOLD,
+    SparseAmplitudes,
+    bitstrings_from_counts,
+    convert_output,
+    load_binary_wavefunction,
+    reverse_qubit_order,
+    sample_counts,
 )
+from .worker import QHipsterWorker
+
+logger = logging.getLogger(__name__)
 
 # NOTE: The environment variables below are necessary for running qhipster with the
 # intel psxe runtime installation. They were obtained through sourcing the script
@@ -29,126 +59,911 @@ from .utils import (
 PSXE_BASE_PATH = "/opt/intel/psxe_runtime_2019.3.199/linux"
 
 
-PSXE_ENVS = {
-    "LD_LIBRARY_PATH": (
-        f"{PSXE_BASE_PATH}/daal/lib/intel64_lin:"
-        f"{PSXE_BASE_PATH}/compiler/lib/intel64_lin:"
-        f"{PSXE_BASE_PATH}/mkl/lib/intel64_lin:"
-        f"{PSXE_BASE_PATH}/tbb/lib/intel64/gcc4.7:"
-        f"{PSXE_BASE_PATH}/ipp/lib/intel64:"
-        f"{PSXE_BASE_PATH}/mpi/intel64/libfabric/lib:"
-        f"{PSXE_BASE_PATH}/mpi/intel64/lib/release:"
-        f"{PSXE_BASE_PATH}/mpi/intel64/lib:"
-        f"{PSXE_BASE_PATH}/compiler/lib/intel64_lin"
-    ),
-    "IPPROOT": f"{PSXE_BASE_PATH}/ipp",
-    "FI_PROVIDER_PATH": f"{PSXE_BASE_PATH}/mpi/intel64/libfabric/lib/prov",
-    "CLASSPATH": (
-        f"{PSXE_BASE_PATH}/daal/lib/daal.jar:"
-        f"{PSXE_BASE_PATH}/mpi/intel64/lib/mpi.jar"
-    ),
-    "CPATH": (
-        f"{PSXE_BASE_PATH}/daal/include:"
-        f"{PSXE_BASE_PATH}/mkl/include:"
-        f"{PSXE_BASE_PATH}/tbb/include:"
-        f"{PSXE_BASE_PATH}/ipp/include:"
-    ),
-    "NLSPATH": (
-        f"{PSXE_BASE_PATH}/mkl/lib/intel64_lin/locale/%l_%t/%N:"
-        f"{PSXE_BASE_PATH}/compiler/lib/intel64_lin/locale/%l_%t/%N"
-    ),
-    "LIBRARY_PATH": (
-        f"{PSXE_BASE_PATH}/daal/lib/intel64_lin:"
-        f"{PSXE_BASE_PATH}/compiler/lib/intel64_lin:"
-        f"{PSXE_BASE_PATH}/mkl/lib/intel64_lin:"
-        f"{PSXE_BASE_PATH}/tbb/lib/intel64/gcc4.7:"
-        f"{PSXE_BASE_PATH}/ipp/lib/intel64:"
-        f"{PSXE_BASE_PATH}/mpi/intel64/libfabric/lib:"
-        f"{PSXE_BASE_PATH}/compiler/lib/intel64_lin"
-    ),
-    "DAALROOT": f"{PSXE_BASE_PATH}/daal",
-    "MIC_LD_LIBRARY_PATH": f"{PSXE_BASE_PATH}/compiler/lib/intel64_lin_mic",
-    "MANPATH": f"{PSXE_BASE_PATH}/mpi/man:",
-    "CPLUS_INCLUDE_PATH": "/app/json_parser/include",
-    "MKLROOT": f"{PSXE_BASE_PATH}/mkl",
-    "PATH": (
-        f"{PSXE_BASE_PATH}/mpi/intel64/libfabric/bin:"
-        f"{PSXE_BASE_PATH}/mpi/intel64/bin:"
-        f"{PSXE_BASE_PATH}/bin:"
-        "/usr/local/sbin:"
-        "/usr/local/bin:"
-        "/usr/sbin:"
-        "/usr/bin:"
-        "/sbin:"
-        "/bin"
-    ),
-    "TBBROOT": f"{PSXE_BASE_PATH}/tbb",
-    "PKG_CONFIG_PATH": f"{PSXE_BASE_PATH}/mkl/bin/pkgconfig",
-    "I_MPI_ROOT": f"{PSXE_BASE_PATH}/mpi",
-}
+@lru_cache(maxsize=None)
+def psxe_env() -> Dict[str, str]:
+    """Environment of the interpreter, resolved on first use."""
+    return {
+        "LD_LIBRARY_PATH": (
+            f"{PSXE_BASE_PATH}/daal/lib/intel64_lin:"
+            f"{PSXE_BASE_PATH}/compiler/lib/intel64_lin:"
+            f"{PSXE_BASE_PATH}/mkl/lib/intel64_lin:"
+            f"{PSXE_BASE_PATH}/tbb/lib/intel64/gcc4.7:"
+            f"{PSXE_BASE_PATH}/ipp/lib/intel64:"
+            f"{PSXE_BASE_PATH}/mpi/intel64/libfabric/lib:"
+            f"{PSXE_BASE_PATH}/mpi/intel64/lib/release:"
+            f"{PSXE_BASE_PATH}/mpi/intel64/lib:"
+            f"{PSXE_BASE_PATH}/compiler/lib/intel64_lin"
+        ),
+        "IPPROOT": f"{PSXE_BASE_PATH}/ipp",
+        "FI_PROVIDER_PATH": f"{PSXE_BASE_PATH}/mpi/intel64/libfabric/lib/prov",
+        "CLASSPATH": (
+            f"{PSXE_BASE_PATH}/daal/lib/daal.jar:"
+            f"{PSXE_BASE_PATH}/mpi/intel64/lib/mpi.jar"
+        ),
+        "CPATH": (
+            f"{PSXE_BASE_PATH}/daal/include:"
+            f"{PSXE_BASE_PATH}/mkl/include:"
+            f"{PSXE_BASE_PATH}/tbb/include:"
+            f"{PSXE_BASE_PATH}/ipp/include:"
+        ),
+        "NLSPATH": (
+            f"{PSXE_BASE_PATH}/mkl/lib/intel64_lin/locale/%l_%t/%N:"
+            f"{PSXE_BASE_PATH}/compiler/lib/intel64_lin/locale/%l_%t/%N"
+        ),
+        "LIBRARY_PATH": (
+            f"{PSXE_BASE_PATH}/daal/lib/intel64_lin:"
+            f"{PSXE_BASE_PATH}/compiler/lib/intel64_lin:"
+            f"{PSXE_BASE_PATH}/mkl/lib/intel64_lin:"
+            f"{PSXE_BASE_PATH}/tbb/lib/intel64/gcc4.7:"
+            f"{PSXE_BASE_PATH}/ipp/lib/intel64:"
+            f"{PSXE_BASE_PATH}/mpi/intel64/libfabric/lib:"
+            f"{PSXE_BASE_PATH}/compiler/lib/intel64_lin"
+        ),
+        "DAALROOT": f"{PSXE_BASE_PATH}/daal",
+        "MIC_LD_LIBRARY_PATH": f"{PSXE_BASE_PATH}/compiler/lib/intel64_lin_mic",
+        "MANPATH": f"{PSXE_BASE_PATH}/mpi/man:",
+        "CPLUS_INCLUDE_PATH": "/app/json_parser/include",
+        "MKLROOT": f"{PSXE_BASE_PATH}/mkl",
+        "PATH": (
+            f"{PSXE_BASE_PATH}/mpi/intel64/libfabric/bin:"
+            f"{PSXE_BASE_PATH}/mpi/intel64/bin:"
+            f"{PSXE_BASE_PATH}/bin:"
+            "/usr/local/sbin:"
+            "/usr/local/bin:"
+            "/usr/sbin:"
+            "/usr/bin:"
+            "/sbin:"
+            "/bin"
+        ),
+        "TBBROOT": f"{PSXE_BASE_PATH}/tbb",
+        "PKG_CONFIG_PATH": f"{PSXE_BASE_PATH}/mkl/bin/pkgconfig",
+        "I_MPI_ROOT": f"{PSXE_BASE_PATH}/mpi",
+    }
+
+
+def __getattr__(name):
+    # PSXE_ENVS used to be built at import time, it is kept for backward compatibility.
+    if name == "PSXE_ENVS":
+        return psxe_env()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+WAVEFUNCTION_INTERPRETER = "/app/zapata/zapata_interpreter_no_mpi_get_wf.out"
+EXPECTATION_VALUES_INTERPRETER = (
+    "/app/zapata/zapata_interpreter_no_mpi_get_exp_vals.out"
+)
+# Interpreter writing the state vector as raw complex128 values, already in the qubit
+# order used by z-quantum-core.
+BINARY_WAVEFUNCTION_INTERPRETER = (
+    "/app/zapata/zapata_interpreter_no_mpi_get_wf_binary.out"
+)
+
+# Interpreters run under `mpirun`, writing results of each rank into its own file.
+# See `qeqhipster.mpi`.
+MPI_WAVEFUNCTION_INTERPRETER = "/app/zapata/zapata_interpreter_mpi_get_wf_binary.out"
+MPI_EXPECTATION_VALUES_INTERPRETER = (
+    "/app/zapata/zapata_interpreter_mpi_get_exp_vals.out"
+)
+
+WAVEFUNCTION_FORMATS = ("auto", "binary", "json")
+
+WAVEFUNCTION_PRECISIONS = ("complex128", "complex64")
+
+EXPECTATION_ENGINES = ("native", "numpy", "auto")
+# Circuits up to this size get expectation values from NumPy engine if the engine
+# is "auto".
+NUMPY_ENGINE_MAX_QUBITS = 20
+
+# Circuits of up to this many qubits and gates are simulated in process by
+# `qeqhipster.statevector` instead of the interpreter. Chosen after
+# `benchmarks/in_process_benchmark.py`: beyond them, simulating the circuit in
+# process takes longer than starting the interpreter and exchanging files with it.
+IN_PROCESS_MAX_QUBITS = 12
+IN_PROCESS_MAX_GATES = 300
+
+
+CIRCUIT_FILENAME = "temp_qhipster_circuit.txt"
+
+
+def _unpack_operators(qubit_operators):
+    """Split list or dictionary of operators into their names and operators."""
+    if isinstance(qubit_operators, dict):
+        return list(qubit_operators), list(qubit_operators.values())
+    return None, list(qubit_operators)
+
+
+def _pack_operator_results(names, results):
+    return dict(zip(names, results)) if names is not None else results
 
 
 class QHipsterSimulator(QuantumSimulator):
-    supports_batching = False
+    """qHiPSTER based simulator.
+
+    Args:
+        nthreads: number of threads used by the interpreter. If "auto", it is chosen
+            for each circuit from its size and number of available cores, using the
+            cost model from `thread_profile`. See `qeqhipster.threads`.
+        use_worker: if True, interpreter invocations are executed by a single
+            long-lived worker process instead of a new process per circuit. See
+            `qeqhipster.worker` for the protocol spoken by the worker.
+        worker_command: command starting the worker. Defaults to the reference
+            worker implementation shipped with this package, which still starts the
+            interpreter for every invocation.
+        worker_timeout: number of seconds after which an invocation run by the
+            worker is abandoned and the worker is restarted. None waits
+            indefinitely.
+        batch_size: maximum number of circuits simulated concurrently by
+            `run_circuitset_and_measure`.
+        max_cores: number of cores shared by concurrent simulations of a batch.
+            Defaults to all cores available to the process. Number of threads used
+            for each circuit of a batch is chosen based on its size, `nthreads` is
+            not used in batches.
+        thread_profile: path to thread profile used if `nthreads` is "auto".
+            Defaults to `qeqhipster/thread_profile.json` in the user's cache
+            directory. If there is no profile, a fixed heuristic is used.
+        bind_cores: if True, the simulator is given a set of cores disjoint from
+            sets of other simulators in this process (as long as there are enough
+            cores), and interpreter's threads are bound to these cores. Size of the
+            set is `max_cores`, or `nthreads` if `max_cores` is not given.
+            Concurrently running interpreters, e.g. of a batch, are bound to
+            disjoint subsets of the set, each having one core per thread.
+        memory_budget: memory (in bytes) that simulations may use at once. Each
+            simulation reserves its peak memory predicted by `estimate_memory`
+            before it starts. Simulations that would exceed the budget on their own
+            raise `qeqhipster.memory.MemoryBudgetExceeded`, others wait for
+            concurrently running ones. "auto" uses a budget shared by all simulators
+            of this process, sized after the memory available to it. Can also be a
+            `qeqhipster.memory.MemoryBudget` instance. None disables the checks.
+        instrument: if True, time spent in each stage of every call, resource usage
+            of the interpreter and sizes of exchanged files are accumulated in
+            `stats`. See `qeqhipster.instrumentation`.
+        wavefunction_format: format in which the interpreter passes state vectors
+            back. "binary" uses raw complex128 output that is memory-mapped without
+            parsing or copying, "json" uses the JSON output. "auto" uses binary
+            output if the binary-output interpreter is installed and falls back to
+            JSON otherwise.
+        wavefunction_precision: precision of amplitudes of returned wavefunctions,
+            "complex128" or "complex64". Single precision halves memory taken by
+            the result. Binary output is converted block by block, so it is never
+            held in memory in double precision. See also `get_probabilities` and
+            `get_sparse_amplitudes`.
+        native_qubit_order: if True, state vectors are returned in the qubit order
+            used natively by qHiPSTER (qubit 0 being the least significant bit of
+            amplitude index) instead of the order used by z-quantum-core. This spares
+            reordering the state vector after reading it from JSON output. Only use
+            it if you consume state vectors directly and handle the ordering
+            yourself.
+        cache_size: maximum number of results (state vectors and expectation values)
+            kept in cache. Results are keyed by digest of the circuit's QASM, so
+            resubmitting the same circuit doesn't rerun the simulation. Caching is
+            disabled if 0.
+        cache_max_bytes: maximum total size of results kept in cache in memory.
+        cache_dir: directory to which results evicted from memory are written. They
+            are reused from there on subsequent cache lookups.
+        operator_cache_dir: directory in which operators prepared for the
+            interpreter are stored, so that each distinct operator is prepared only
+            once. Defaults to `qeqhipster/operators` in the user's cache directory.
+        operator_cache_max_bytes: maximum total size of operators kept in
+            `operator_cache_dir`. Least recently used ones are evicted beyond it.
+            Unbounded if None.
+        expectation_engine: how expectation values are computed. "native" uses the
+            expectation values interpreter, "numpy" simulates the state vector
+            (which may then be served from cache) and computes expectation values
+            from it with `qeqhipster.pauli`. "auto" uses NumPy engine for circuits
+            of up to `NUMPY_ENGINE_MAX_QUBITS` qubits.
+        simplify_circuits: if True, gates that don't change the state are removed
+            from circuits before they are passed to the interpreter, see
+            `qeqhipster.utils.simplify_circuit`. Number of removed gates is
+            reported in `stats`.
+        scratch: backend of scratch space for files exchanged with the interpreter,
+            one of "tempdir", "shm" and "memfd". See `qeqhipster.scratch`.
+        scratch_dir: parent directory of scratch files of "tempdir" and "shm"
+            backends.
+        mpi_ranks: if given, the interpreter is run under `mpirun` with that many
+            ranks (a power of two), each of them holding a shard of the state
+            vector. See `qeqhipster.mpi`. `nthreads` is then the number of threads of
+            each rank. State vectors are always passed back in binary format.
+        mpi_ranks_per_node: number of ranks placed on each node.
+        mpirun_args: additional arguments of `mpirun`, e.g. a host file.
+        mpirun: command launching MPI programs.
+        in_process_max_qubits: circuits with at most this many qubits (and at most
+            `in_process_max_gates` gates) are simulated in process with NumPy, see
+            `qeqhipster.statevector`, which spares the fixed cost of running the
+            interpreter. Results, including qubit order, are the same. "auto" uses
+            `IN_PROCESS_MAX_QUBITS`, None always uses the interpreter.
+        in_process_max_gates: maximum number of gates of circuits simulated in
+            process. "auto" uses `IN_PROCESS_MAX_GATES`, None doesn't limit the
+            number of gates.
+    """
 
-    def __init__(self, nthreads=1):
+    supports_batching = True
+    batch_size = 64
+
+    def __init__(
+        self,
+        nthreads=1,
+        use_worker=False,
+        worker_command=None,
+        worker_timeout=None,
+        batch_size=None,
+        max_cores=None,
+        wavefunction_format="auto",
+        wavefunction_precision="complex128",
+        native_qubit_order=False,
+        expectation_engine="native",
+        simplify_circuits=True,
+        cache_size=0,
+        cache_max_bytes=None,
+        cache_dir=None,
+        operator_cache_dir=None,
+        operator_cache_max_bytes=MAX_CACHED_OPERATOR_BYTES,
+        scratch="tempdir",
+        scratch_dir=None,
+        thread_profile=None,
+        bind_cores=False,
+        memory_budget="auto",
+        instrument=True,
+        mpi_ranks=None,
+        mpi_ranks_per_node=None,
+        mpirun_args=(),
+        mpirun=MPIRUN,
+        in_process_max_qubits="auto",
+        in_process_max_gates="auto",
+    ):
+        if wavefunction_format not in WAVEFUNCTION_FORMATS:
+            raise ValueError(
+                f"Unknown wavefunction format: {wavefunction_format}. "
+                f"Supported formats are: {WAVEFUNCTION_FORMATS}."
+            )
+        if wavefunction_precision not in WAVEFUNCTION_PRECISIONS:
+            raise ValueError(
+                f"Unknown wavefunction precision: {wavefunction_precision}. "
+                f"Supported precisions are: {WAVEFUNCTION_PRECISIONS}."
+            )
+        if expectation_engine not in EXPECTATION_ENGINES:
+            raise ValueError(
+                f"Unknown expectation engine: {expectation_engine}. "
+                f"Supported engines are: {EXPECTATION_ENGINES}."
+            )
+        if mpi_ranks is not None and scratch == "memfd":
+            raise ValueError("MPI ranks cannot write their results into memfd scratch.")
+        if batch_size is not None:
+            self.batch_size = batch_size
         super().__init__()
+        self.mpi = (
+            MPIConfig(
+                mpi_ranks, mpi_ranks_per_node, mpirun, mpirun_args=tuple(mpirun_args)
+            )
+            if mpi_ranks is not None
+            else None
+        )
         self.nthreads = nthreads
+        self.max_cores = max_cores
+        self._thread_chooser = thread_chooser(
+            load_thread_profile(thread_profile) if nthreads == AUTO_THREADS else None
+        )
+        self.cores = None
+        self._env = psxe_env()
+        self._release_cores = None
+        self._core_budget = None
+        if bind_cores:
+            allocator = default_core_allocator()
+            self.cores = allocator.allocate(
+                max_cores
+                or (nthreads if nthreads != AUTO_THREADS else available_cores())
+            )
+            self._env = self._job_env(self.cores)
+            self._core_budget = CoreBudget(self.cores)
+            self._release_cores = weakref.finalize(self, allocator.release, self.cores)
+        self.last_batch_report = None
+        self.last_gradient_report = None
+        self.wavefunction_format = wavefunction_format
+        self.wavefunction_precision = wavefunction_precision
+        self.expectation_engine = expectation_engine
+        self.simplify_circuits = simplify_circuits
+        self.native_qubit_order = native_qubit_order
+        self.in_process_max_qubits = (
+            IN_PROCESS_MAX_QUBITS
+            if in_process_max_qubits == "auto"
+            else in_process_max_qubits
+        )
+        self.in_process_max_gates = (
+            IN_PROCESS_MAX_GATES
+            if in_process_max_gates == "auto"
+            else in_process_max_gates
+        )
+        self._operator_cache = OperatorCache(
+            operator_cache_dir, max_bytes=operator_cache_max_bytes
+        )
+        self._scratch = Scratch(scratch, scratch_dir)
+        if memory_budget == "auto":
+            memory_budget = default_memory_budget()
+        elif memory_budget is not None and not isinstance(memory_budget, MemoryBudget):
+            memory_budget = MemoryBudget(int(memory_budget))
+        self.memory_budget = memory_budget
+        self.stats = SimulationStats() if instrument else None
+        self._cache = (
+            ResultCache(cache_size, cache_max_bytes, cache_dir) if cache_size else None
+        )
+        self._worker = (
+            QHipsterWorker(worker_command, env=self._env, run_timeout=worker_timeout)
+            if use_worker
+            else None
+        )
+
+    def close(self):
+        """Release resources held by the simulator, i.e. shut down its worker,
+        remove its scratch space and give back its cores."""
+        if self._worker is not None:
+            self._worker.close()
+        self._scratch.close()
+        if self._release_cores is not None:
+            self._release_cores()
+
+    def _n_cores(self):
+        if self.cores is not None:
+            return len(self.cores)
+        return self.max_cores or available_cores()
+
+    def _choose_threads(self, n_qubits, n_cores):
+        """Choose total number of threads of a simulation, which are split evenly
+        between MPI ranks."""
+        if self.mpi is None:
+            return self._thread_chooser(n_qubits, n_cores)
+        return self.mpi.n_ranks * self._thread_chooser(
+            max(0, n_qubits - self.mpi.global_qubits),
+            max(1, n_cores // self.mpi.n_ranks),
+        )
+
+    def _threads_for(self, circuit):
+        if self.nthreads == AUTO_THREADS:
+            return self._choose_threads(circuit.n_qubits, self._n_cores())
+        return self.nthreads * (self.mpi.n_ranks if self.mpi is not None else 1)
+
+    def _threads_per_rank(self, nthreads):
+        return self.mpi.threads_per_rank(nthreads) if self.mpi is not None else nthreads
+
+    def estimate_memory(
+        self, circuit, kind="wavefunction", output=None
+    ) -> MemoryEstimate:
+        """Predict memory needed for simulating `circuit`.
+
+        Args:
+            circuit: circuit (or bound circuit template) to be simulated.
+            kind: one of "wavefunction", "expectation_values" and "measure".
+            output: form of the state vector returned by "wavefunction"
+                simulations, one of `qeqhipster.wavefunction.OUTPUT_MODES`. Defaults
+                to `wavefunction_precision`.
+        """
+        return self._estimate_memory(circuit.n_qubits, kind, output)
+
+    def _estimate_memory(self, n_qubits, kind, output=None):
+        output = output or self.wavefunction_precision
+        if kind == "expectation_values" and self._uses_numpy_engine(n_qubits):
+            kind, output = "wavefunction", "complex128"
+        binary = self._uses_binary_wavefunction()
+        return estimate_memory(
+            n_qubits,
+            kind,
+            binary=binary,
+            # Binary output is already in z-quantum-core order, JSON output is not.
+            # Sharded output is stitched into a copy, which is reordered in place.
+            reorder=binary == self.native_qubit_order and self.mpi is None,
+            in_memory_scratch=self._scratch.backend != "tempdir",
+            n_ranks=self.mpi.n_ranks if self.mpi is not None else 1,
+            output=output,
+        )
+
+    def _memory_needed(self, circuit, kind, output=None):
+        """Bytes to reserve for simulating `circuit`, or None without a budget."""
+        if self.memory_budget is None:
+            return None
+        return self.estimate_memory(circuit, kind, output).peak
+
+    def _reserve_memory(self, circuit, kind, output=None):
+        n_bytes = self._memory_needed(circuit, kind, output)
+        if n_bytes is None:
+            return nullcontext()
+        return self.memory_budget.reserve(n_bytes)
+
+    @property
+    def number_of_cache_hits(self):
+        return self._cache.hits if self._cache is not None else 0
+
+    @property
+    def number_of_cache_misses(self):
+        return self._cache.misses if self._cache is not None else 0
+
+    def _get_cached(self, key):
+        return self._cache.get(key) if self._cache is not None else None
+
+    def _put_cached(self, key, value):
+        if self._cache is not None:
+            self._cache.put(key, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _job_env(self, cores):
+        """Environment of interpreter invocation running on `cores`, with one
+        thread per core split between MPI ranks."""
+        return {
+            **psxe_env(),
+            **binding_env(cores, self._threads_per_rank(len(cores))),
+        }
+
+    def _run_interpreter(
+        self, argv, nthreads, allow_worker=True
+    ) -> Optional[ProcessUsage]:
+        check_executable(argv, self._env)
+        if allow_worker and self._worker is not None:
+            # Environment of the worker is fixed when it starts and binds it to all
+            # cores of the simulator.
+            with self._reserve_cores(self._n_cores()):
+                usage = self._worker.run(argv)
+            return ProcessUsage(**usage) if usage is not None else None
+        with self._reserve_cores(nthreads) as cores:
+            if cores is None:
+                return run_process(argv, self._env)
+            return run_process(
+                argv, self._job_env(cores), lambda pid: set_affinity(pid, cores)
+            )
+
+    def _reserve_cores(self, nthreads):
+        """Reserve cores for `nthreads` threads of a single interpreter invocation,
+        disjoint from cores of invocations running concurrently. Yields None if
+        threads are not bound to cores."""
+        if self._core_budget is None:
+            return nullcontext()
+        return self._core_budget.reserve(nthreads)
+
+    def _run_steps(self, steps, nthreads, allow_worker=True):
+        """Drive simulation steps to completion, returning their result.
+
+        Simulations are implemented as generators yielding command lines of
+        interpreter invocations they need, receiving resource usage of each
+        invocation, and returning their result. This lets
+        `qeqhipster.async_simulator` run the same simulations without blocking.
+        Each invocation runs with `nthreads` threads.
+        """
+        try:
+            argv = next(steps)
+            while True:
+                argv = steps.send(self._run_interpreter(argv, nthreads, allow_worker))
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            steps.close()
+
+    def _start_call(self, kind):
+        return CallRecord(kind) if self.stats is not None else DISABLED_CALL
+
+    def _finish_call(self, call, result, cached=False):
+        if self.stats is not None:
+            call.cached = cached
+            self.stats.record(call)
+        return result
+
+    def _scratch_path(self, call, scratch, name):
+        call.n_files += 1
+        return scratch.path(name)
+
+    def _output_paths(self, call, scratch, name):
+        """Return path of output file `name` passed to the interpreter and paths of
+        files it writes, i.e. of the file itself or of its shards written by MPI
+        ranks."""
+        if self.mpi is None:
+            path = self._scratch_path(call, scratch, name)
+            return path, [path]
+        shard_paths = [
+            self._scratch_path(call, scratch, f"{name}.{rank}")
+            for rank in range(self.mpi.n_ranks)
+        ]
+        return scratch.path(name), shard_paths
+
+    def _interpreter_argv(self, argv):
+        return self.mpi.argv(argv) if self.mpi is not None else argv
+
+    def _simplify(self, call, circuit):
+        if self.simplify_circuits and not isinstance(circuit, BoundCircuitTemplate):
+            with call.stage("simplify"):
+                circuit, call.n_removed_gates = simplify_circuit(circuit)
+        return circuit
+
+    def _save_circuit(self, call, circuit, scratch):
+        """Write circuit into scratch, returning its path and digest of its QASM."""
+        circuit_txt_path = self._scratch_path(call, scratch, CIRCUIT_FILENAME)
+        circuit = self._simplify(call, circuit)
+        with call.stage("qasm"):
+            if isinstance(circuit, BoundCircuitTemplate):
+                digest = circuit.save(circuit_txt_path)
+            else:
+                digest = save_simplified_qasm(circuit, circuit_txt_path)
+        call.add_file(circuit_txt_path, written=True)
+        return circuit_txt_path, digest
+
+    def _runs_in_process(self, circuit):
+        if self.in_process_max_qubits is None:
+            return False
+        n_gates = (
+            circuit.template.n_gates
+            if isinstance(circuit, BoundCircuitTemplate)
+            else len(circuit.operations)
+        )
+        return circuit.n_qubits <= self.in_process_max_qubits and (
+            self.in_process_max_gates is None or n_gates <= self.in_process_max_gates
+        )
+
+    def _parse_in_process(self, call, circuit):
+        """Compile circuit for simulating it in process, if it is small enough.
+
+        Returns:
+            Tuple (digest, n_qubits, operations) where digest is the digest of
+            circuit's QASM and the rest are arguments of `statevector.simulate`, or
+            None if the circuit has to be simulated by the interpreter.
+        """
+        if not self._runs_in_process(circuit):
+            return None
+        circuit = self._simplify(call, circuit)
+        qasm = io.StringIO()
+        with call.stage("qasm"):
+            if isinstance(circuit, BoundCircuitTemplate):
+                digest = circuit.write(qasm)
+            else:
+                digest = write_simplified_qasm(circuit, qasm)
+            try:
+                n_qubits, operations = statevector.parse_qasm(qasm.getvalue())
+            except statevector.UnsupportedGate as error:
+                logger.debug("Circuit is simulated by the interpreter: %s", error)
+                return None
+        call.in_process = True
+        return digest, n_qubits, operations
 
     def run_circuit_and_measure(self, circuit, n_samples):
-        wavefunction = self.get_wavefunction(circuit)
-        return Measurements(sample_from_wavefunction(wavefunction, n_samples))
+        self.number_of_circuits_run += 1
+        self.number_of_jobs_run += 1
+        with self._reserve_memory(circuit, "measure"):
+            return self._measure(circuit, n_samples, self._threads_for(circuit))
+
+    def run_circuitset_and_measure(self, circuits, n_samples):
+        # Base implementation only takes care of counting circuits and jobs.
+        super().run_circuitset_and_measure(circuits, n_samples)
+        circuits = list(circuits)
+        # Worker executes invocations sequentially, hence it is bypassed in batches.
+        return self._run_in_batches(
+            [
+                partial(self._measure, circuit, n, allow_worker=False)
+                for circuit, n in zip(circuits, n_samples)
+            ],
+            [circuit.n_qubits for circuit in circuits],
+            "measure",
+        )
+
+    def _run_in_batches(self, jobs, n_qubits, kind):
+        """Run jobs `batch_size` at a time, each job being called with number of
+        threads it should use. Jobs are simulations of given kind."""
+
+        def _memory_for(n):
+            return self._estimate_memory(n, kind).peak
+
+        results = []
+        for start in range(0, len(jobs), self.batch_size):
+            stop = start + self.batch_size
+            batch_results, self.last_batch_report = run_batch(
+                jobs[start:stop],
+                n_qubits[start:stop],
+                self._n_cores(),
+                self._choose_threads,
+                _memory_for,
+                self.memory_budget,
+            )
+            logger.debug(
+                "Simulated batch of %d circuits in %.3fs using %d cores.",
+                self.last_batch_report.n_jobs,
+                self.last_batch_report.wall_time,
+                self.last_batch_report.n_cores,
+            )
+            results.extend(batch_results)
+        return results
 
     def get_exact_expectation_values(self, circuit, qubit_operator):
         self.number_of_circuits_run += 1
         self.number_of_jobs_run += 1
-        circuit = make_circuit_qhipster_compatible(circuit)
+        with self._reserve_memory(circuit, "expectation_values"):
+            return self._expectation_values(
+                circuit, qubit_operator, self._threads_for(circuit)
+            )
+
+    def _expectation_values(
+        self, circuit, qubit_operator, nthreads, allow_worker=True, prepared=None
+    ):
+        return self._run_steps(
+            self._expectation_values_steps(circuit, qubit_operator, nthreads, prepared),
+            nthreads,
+            allow_worker,
+        )
+
+    def get_exact_expectation_values_of_operators(self, circuit, qubit_operators):
+        """Compute expectation values of terms of several operators from a single
+        simulation of `circuit`.
+
+        Pauli strings of all operators are passed to a single run of the
+        interpreter. Results are cached per operator, so subsequent calls with any
+        of the operators reuse them.
+
+        Args:
+            circuit: the circuit.
+            qubit_operators: list of operators, or dictionary mapping names to
+                operators.
 
-        with tempfile.TemporaryDirectory() as dir_path:
-            operator_json_path = os.path.join(dir_path, "temp_qhipster_operator.json")
-            operator_txt_path = os.path.join(dir_path, "temp_qhipster_operator.txt")
-            circuit_txt_path = os.path.join(dir_path, "temp_qhipster_circuit.txt")
-            expectation_values_json_path = os.path.join(
-                dir_path, "expectation_values.json"
+        Returns:
+            `ExpectationValues` of each operator, as a list in the order of
+            `qubit_operators` or as a dictionary with the same keys.
+        """
+        self.number_of_circuits_run += 1
+        self.number_of_jobs_run += 1
+        names, operators = _unpack_operators(qubit_operators)
+        nthreads = self._threads_for(circuit)
+        with self._reserve_memory(circuit, "expectation_values"):
+            expectation_values = self._run_steps(
+                self._operators_expectation_values_steps(circuit, operators, nthreads),
+                nthreads,
             )
+        return _pack_operator_results(names, expectation_values)
+
+    def _expectation_values_steps(
+        self, circuit, qubit_operator, nthreads, prepared=None
+    ):
+        (expectation_values,) = yield from self._operators_expectation_values_steps(
+            circuit, [qubit_operator], nthreads, prepared
+        )
+        return expectation_values
 
+    def _operators_expectation_values_steps(
+        self, circuit, qubit_operators, nthreads, prepared=None
+    ):
+        """Steps computing expectation values of terms of `qubit_operators`.
+
+        `prepared` are the operators already prepared by `OperatorCache.prepare_many`,
+        which spares hashing them again for each of many circuits.
+        """
+        from zquantum.core.measurement import ExpectationValues
+        from zquantum.core.openfermion.ops import SymbolicOperator
+
+        for qubit_operator in qubit_operators:
             if not isinstance(qubit_operator, SymbolicOperator):
                 raise TypeError(
                     f"Unsupported type: {type(qubit_operator)} QHipster "
                     "works only with openfermion.SymbolicOperator"
                 )
+        if self._uses_numpy_engine(circuit.n_qubits) or self._runs_in_process(circuit):
+            return (
+                yield from self._numpy_expectation_values_steps(
+                    circuit, qubit_operators, nthreads
+                )
+            )
+        call = self._start_call("expectation_values")
+        with call.stage("operator"):
+            operators = prepared or self._operator_cache.prepare_many(qubit_operators)
+
+        with self._scratch.session() as scratch:
+            circuit_txt_path, circuit_digest = self._save_circuit(
+                call, circuit, scratch
+            )
+            cache_keys = [
+                make_cache_key("expectation_values", circuit_digest, operator.hash)
+                for operator in operators.operators
+            ]
+            cached_values = [self._get_cached(key) for key in cache_keys]
+            if all(values is not None for values in cached_values):
+                return self._finish_call(
+                    call,
+                    [ExpectationValues(values) for values in cached_values],
+                    cached=True,
+                )
+
+            expectation_values_json_path, output_paths = self._output_paths(
+                call, scratch, "expectation_values.json"
+            )
+            with call.stage("simulation"):
+                call.usage = yield self._interpreter_argv(
+                    [
+                        MPI_EXPECTATION_VALUES_INTERPRETER
+                        if self.mpi is not None
+                        else EXPECTATION_VALUES_INTERPRETER,
+                        circuit_txt_path,
+                        str(self._threads_per_rank(nthreads)),
+                        operators.path,
+                        expectation_values_json_path,
+                    ]
+                )
+            with call.stage("load"):
+                # Contributions of ranks are summed without gathering the state.
+                expectation_values = reduce_expectation_values(output_paths)
+            for path in output_paths:
+                call.add_file(path, written=False)
+
+        values_of_operators = operators.rescale(expectation_values)
+        for key, values in zip(cache_keys, values_of_operators):
+            self._put_cached(key, values)
+        return self._finish_call(
+            call, [ExpectationValues(values) for values in values_of_operators]
+        )
+
+    def _uses_numpy_engine(self, n_qubits):
+        if self.expectation_engine == "auto":
+            return n_qubits <= NUMPY_ENGINE_MAX_QUBITS
+        return self.expectation_engine == "numpy"
+
+    def _numpy_expectation_values_steps(self, circuit, qubit_operators, nthreads):
+        from zquantum.core.measurement import ExpectationValues
+
+        amplitudes = yield from self._simulate_wavefunction_steps(
+            circuit, nthreads, "complex128"
+        )
+        n_qubits = len(amplitudes).bit_length() - 1
+        call = self._start_call("expectation_values")
+        with call.stage("operator"):
+            terms = [
+                self._operator_cache.pauli_terms(
+                    qubit_operator, n_qubits, self.native_qubit_order
+                )
+                for qubit_operator in qubit_operators
+            ]
+        with call.stage("pauli"):
+            expectation_values = [
+                ExpectationValues(pauli.expectation_values(amplitudes, operator_terms))
+                for operator_terms in terms
+            ]
+        return self._finish_call(call, expectation_values)
+
+    def compile_template(self, circuit, symbols=None) -> CircuitTemplate:
+        """Compile parametric circuit into a template that can be cheaply evaluated
+        for many values of its parameters.
+
+        If `simplify_circuits` is set, the template is simplified once, keeping its
+        symbolic gates, see `CircuitTemplate`. Results are cached under digest of
+        QASM of the bound template, which may then differ from the one of the bound
+        circuit passed directly.
+
+        Args:
+            circuit: circuit with symbolic parameters.
+            symbols: order of symbols in parameter vectors passed to methods
+                evaluating the template. Defaults to `circuit.free_symbols`.
+        """
+        return CircuitTemplate(circuit, symbols, simplify=self.simplify_circuits)
 
-            save_symbolic_operator(qubit_operator, operator_json_path)
+    def get_wavefunction_from_template(self, template, params):
+        """Compute wavefunction of circuit template bound to `params`.
 
-            with open(circuit_txt_path, "w") as qasm_file:
-                qasm_file.write(convert_to_simplified_qasm(circuit))
+        Args:
+            template: template returned by `compile_template`.
+            params: either a vector of values of template's symbols, or an array of
+                shape (n_points, n_params), in which case the points are simulated
+                as a batch and list of wavefunctions is returned.
+        """
+        from zquantum.core.wavefunction import Wavefunction
 
-            subprocess.run(
-                [
-                    "/app/json_parser/qubitop_to_paulistrings.o",
-                    operator_json_path,
-                ],
-                check=True,
+        def _simulate(circuit, nthreads, allow_worker=True):
+            return Wavefunction(
+                self._simulate_wavefunction(circuit, nthreads, allow_worker)
             )
-            # Run simulation
-            subprocess.run(
-                [
-                    "/app/zapata/zapata_interpreter_no_mpi_get_exp_vals.out",
-                    circuit_txt_path,
-                    str(self.nthreads),
-                    operator_txt_path,
-                    expectation_values_json_path,
-                ],
-                env=PSXE_ENVS,
-                check=True,
+
+        return self._evaluate_template(template, params, _simulate, "wavefunction")
+
+    def get_exact_expectation_values_from_template(
+        self, template, params, qubit_operator
+    ):
+        """Compute expectation values of operator's terms for circuit template bound
+        to `params`. See `get_wavefunction_from_template` for allowed `params`."""
+
+        def _simulate(circuit, nthreads, allow_worker=True):
+            return self._expectation_values(
+                circuit, qubit_operator, nthreads, allow_worker
             )
-            expectation_values = load_expectation_values(expectation_values_json_path)
 
-        for term_index, term in enumerate(qubit_operator.terms):
-            expectation_values.values[term_index] = np.real(
-                qubit_operator.terms[term] * expectation_values.values[term_index]
+        return self._evaluate_template(
+            template, params, _simulate, "expectation_values"
+        )
+
+    def run_template_and_measure(self, template, params, n_samples):
+        """Measure circuit template bound to `params`. See
+        `get_wavefunction_from_template` for allowed `params`."""
+
+        def _simulate(circuit, nthreads, allow_worker=True):
+            return self._measure(circuit, n_samples, nthreads, allow_worker)
+
+        return self._evaluate_template(template, params, _simulate, "measure")
+
+    def _evaluate_template(self, template, params, simulate, kind):
+        params = np.asarray(params, dtype=float)
+        if params.ndim < 2:
+            self.number_of_circuits_run += 1
+            self.number_of_jobs_run += 1
+            circuit = template.bind(params)
+            with self._reserve_memory(circuit, kind):
+                return simulate(circuit, self._threads_for(circuit))
+
+        bound_circuits = [template.bind(point) for point in params]
+        self.number_of_circuits_run += len(bound_circuits)
+        self.number_of_jobs_run += -(-len(bound_circuits) // self.batch_size)
+        return self._run_in_batches(
+            [
+                partial(simulate, circuit, allow_worker=False)
+                for circuit in bound_circuits
+            ],
+            [template.n_qubits] * len(bound_circuits),
+            kind,
+        )
+
+    def compile_gradient(self, circuit, symbols=None) -> ParameterShiftGradient:
+        """Compile parametric circuit for computing gradients with `get_gradient`.
+
+        Args:
+            circuit: circuit with symbolic parameters.
+            symbols: order of symbols in parameter vectors and gradients. Defaults to
+                `circuit.free_symbols`.
+        """
+        return ParameterShiftGradient(circuit, symbols)
+
+    def get_gradient(self, circuit, qubit_operator, params) -> np.ndarray:
+        """Compute gradient of expectation value of `qubit_operator` with respect to
+        circuit's symbols, using the parameter-shift rule.
+
+        All shifted circuits are simulated as a single batch, sharing one prepared
+        operator. Description of the evaluation, including its throughput,
+        is stored in `last_gradient_report`.
+
+        Args:
+            circuit: circuit with symbolic parameters, or gradient returned by
+                `compile_gradient`, which is cheaper when evaluated repeatedly.
+            qubit_operator: the operator.
+            params: values of circuit's symbols, in the order of `circuit.free_symbols`
+                or of symbols passed to `compile_gradient`.
+
+        Returns:
+            Vector of derivatives with respect to each symbol.
+        """
+        start = time.perf_counter()
+        gradient = (
+            circuit
+            if isinstance(circuit, ParameterShiftGradient)
+            else self.compile_gradient(circuit)
+        )
+        shifted = gradient.shifted_points(params)
+        values = []
+        if len(shifted.points):
+            prepared = (
+                None
+                if self._uses_numpy_engine(gradient.template.n_qubits)
+                else self._operator_cache.prepare_many([qubit_operator])
             )
-        return expectation_values
+
+            def _simulate(circuit, nthreads, allow_worker=True):
+                return self._expectation_values(
+                    circuit, qubit_operator, nthreads, allow_worker, prepared
+                )
+
+            values = [
+                np.sum(expectation_values.values)
+                for expectation_values in self._evaluate_template(
+                    gradient.template,
+                    shifted.points,
+                    _simulate,
+                    "expectation_values",
+                )
+            ]
+        result = shifted.gradient(values)
+        self.last_gradient_report = GradientReport(
+            n_params=gradient.n_params,
+            n_shifted_circuits=2 * gradient.n_gate_params,
+            n_circuits=len(shifted.points),
+            wall_time=time.perf_counter() - start,
+        )
+        return result
 
     def _get_wavefunction_from_native_circuit(
         self, circuit: Circuit, initial_state: StateVector
@@ -159,30 +974,221 @@ class QHipsterSimulator(QuantumSimulator):
                 "other than |0>. In particular, it currently does not support "
                 "non-native circuit components."
             )
+        with self._reserve_memory(circuit, "wavefunction"):
+            return self._simulate_wavefunction(circuit, self._threads_for(circuit))
+
+    def get_probabilities(self, circuit) -> np.ndarray:
+        """Compute probabilities of all basis states of circuit's final state.
 
-        with tempfile.TemporaryDirectory() as dir_path:
-            circuit_txt_path = os.path.join(dir_path, "temp_qhipster_circuit.txt")
-            wavefunction_json_path = os.path.join(
-                dir_path, "temp_qhipster_wavefunction.json"
+        Returns:
+            float32 array of probabilities, in the qubit order of wavefunctions
+            returned by the simulator. It takes a quarter of memory of the
+            complex128 state vector.
+        """
+        self.number_of_circuits_run += 1
+        self.number_of_jobs_run += 1
+        with self._reserve_memory(circuit, "wavefunction", "probabilities"):
+            return self._simulate_wavefunction(
+                circuit, self._threads_for(circuit), output="probabilities"
+            )
+
+    def get_sparse_amplitudes(
+        self, circuit, threshold=DEFAULT_SPARSE_THRESHOLD
+    ) -> SparseAmplitudes:
+        """Compute amplitudes of circuit's final state with magnitude above
+        `threshold`, in the qubit order of wavefunctions returned by the simulator.
+
+        Sparse results are not cached.
+        """
+        self.number_of_circuits_run += 1
+        self.number_of_jobs_run += 1
+        with self._reserve_memory(circuit, "wavefunction", "sparse"):
+            return self._simulate_wavefunction(
+                circuit,
+                self._threads_for(circuit),
+                output="sparse",
+                threshold=threshold,
             )
 
-            circuit = make_circuit_qhipster_compatible(circuit)
+    def _uses_binary_wavefunction(self):
+        if self.mpi is not None:
+            return True
+        if self.wavefunction_format == "auto":
+            return find_executable(BINARY_WAVEFUNCTION_INTERPRETER) is not None
+        return self.wavefunction_format == "binary"
 
-            with open(circuit_txt_path, "w") as qasm_file:
-                qasm_file.write(convert_to_simplified_qasm(circuit))
+    def _wavefunction_argv(self, call, circuit_txt_path, nthreads, scratch):
+        """Prepare interpreter invocation simulating circuit saved in
+        `circuit_txt_path` and writing its state vector into `scratch`.
 
-            # Run simulation
-            subprocess.run(
-                [
-                    "/app/zapata/zapata_interpreter_no_mpi_get_wf.out",
-                    circuit_txt_path,
-                    str(self.nthreads),
-                    wavefunction_json_path,
-                ],
-                env=PSXE_ENVS,
-                check=True,
+        Returns:
+            Tuple (argv, paths, binary) where argv is the interpreter's command line,
+            paths are paths to the state vector (or its shards) written by the
+            interpreter and binary tells if it is written in binary format.
+        """
+        binary = self._uses_binary_wavefunction()
+        wavefunction_path, output_paths = self._output_paths(
+            call,
+            scratch,
+            "temp_qhipster_wavefunction" + (".bin" if binary else ".json"),
+        )
+        if self.mpi is not None:
+            interpreter = MPI_WAVEFUNCTION_INTERPRETER
+        elif binary:
+            interpreter = BINARY_WAVEFUNCTION_INTERPRETER
+        else:
+            interpreter = WAVEFUNCTION_INTERPRETER
+        argv = self._interpreter_argv(
+            [
+                interpreter,
+                circuit_txt_path,
+                str(self._threads_per_rank(nthreads)),
+                wavefunction_path,
+            ]
+        )
+        return argv, output_paths, binary
+
+    def _native_order_output(self, binary):
+        """Tell if state vector written by the interpreter is in its native qubit
+        order. Only the non-MPI binary output is in z-quantum-core order."""
+        return not binary or self.mpi is not None
+
+    def _load_output(self, call, output_paths, binary):
+        """Load state vector written by the interpreter, without copying binary
+        output into memory."""
+        with call.stage("load"):
+            if self.mpi is not None:
+                amplitudes = load_sharded_wavefunction(output_paths)
+            elif binary:
+                amplitudes = load_binary_wavefunction(output_paths[0])
+            else:
+                from zquantum.core.measurement import load_wavefunction
+
+                amplitudes = load_wavefunction(output_paths[0]).amplitudes
+        for path in output_paths:
+            call.add_file(path, written=False)
+        return amplitudes
+
+    def _simulate_wavefunction(
+        self, circuit, nthreads, allow_worker=True, output=None, **kwargs
+    ):
+        return self._run_steps(
+            self._simulate_wavefunction_steps(circuit, nthreads, output, **kwargs),
+            nthreads,
+            allow_worker,
+        )
+
+    def _simulate_wavefunction_steps(
+        self, circuit, nthreads, output=None, threshold=DEFAULT_SPARSE_THRESHOLD
+    ):
+        """Steps simulating state vector of `circuit` and returning it in form given
+        by `output`, see `qeqhipster.wavefunction.convert_output`. Defaults to
+        `wavefunction_precision`."""
+        output = output or self.wavefunction_precision
+        call = self._start_call("wavefunction")
+        in_process = self._parse_in_process(call, circuit)
+        if in_process is not None:
+            circuit_digest, n_qubits, operations = in_process
+            cache_key = self._wavefunction_cache_key(circuit_digest, output)
+            cached_amplitudes = self._get_cached_wavefunction(cache_key, output)
+            if cached_amplitudes is not None:
+                return self._finish_call(call, cached_amplitudes, cached=True)
+            with call.stage("simulation"):
+                amplitudes = statevector.simulate(
+                    n_qubits, operations, self.native_qubit_order
+                )
+            if output != "complex128":
+                with call.stage("load"):
+                    amplitudes = convert_output(amplitudes, output, threshold)
+            return self._finish_wavefunction(call, cache_key, amplitudes, output)
+
+        with self._scratch.session() as scratch:
+            circuit_txt_path, circuit_digest = self._save_circuit(
+                call, circuit, scratch
+            )
+            cache_key = self._wavefunction_cache_key(circuit_digest, output)
+            cached_amplitudes = self._get_cached_wavefunction(cache_key, output)
+            if cached_amplitudes is not None:
+                return self._finish_call(call, cached_amplitudes, cached=True)
+
+            argv, output_paths, binary = self._wavefunction_argv(
+                call, circuit_txt_path, nthreads, scratch
             )
+            with call.stage("simulation"):
+                call.usage = yield argv
+            # Memory maps stay valid after the scratch files are removed.
+            amplitudes = self._load_output(call, output_paths, binary)
+            with call.stage("load"):
+                if output != "complex128":
+                    amplitudes = convert_output(amplitudes, output, threshold)
+                elif self.mpi is not None:
+                    amplitudes = amplitudes.to_array()
+                elif not binary:
+                    amplitudes = np.require(amplitudes, requirements=["C", "W"])
 
-            wavefunction = load_wavefunction(wavefunction_json_path)
+        if self._native_order_output(binary) != self.native_qubit_order:
+            with call.stage("reorder"):
+                if output == "sparse":
+                    amplitudes = amplitudes.reverse_qubit_order()
+                else:
+                    reverse_qubit_order(amplitudes, nthreads)
+        return self._finish_wavefunction(call, cache_key, amplitudes, output)
 
-        return flip_wavefunction(wavefunction)
+    def _wavefunction_cache_key(self, circuit_digest, output):
+        # Outputs other than complex128 are keyed by their mode.
+        return make_cache_key(
+            "wavefunction",
+            circuit_digest,
+            str(self.native_qubit_order),
+            *([output] if output != "complex128" else []),
+        )
+
+    def _get_cached_wavefunction(self, cache_key, output):
+        return self._get_cached(cache_key) if output != "sparse" else None
+
+    def _finish_wavefunction(self, call, cache_key, amplitudes, output):
+        if output != "sparse":
+            self._put_cached(cache_key, amplitudes)
+        return self._finish_call(call, amplitudes)
+
+    def _measure(self, circuit, n_samples, nthreads, allow_worker=True):
+        return self._run_steps(
+            self._measure_steps(circuit, n_samples, nthreads), nthreads, allow_worker
+        )
+
+    def _measure_steps(self, circuit, n_samples, nthreads):
+        # Samples are drawn directly from interpreter's output, so it never has to be
+        # reordered. Binary output, including shards written by MPI ranks, is
+        # streamed, never loaded into memory as a whole.
+        from zquantum.core.measurement import Measurements
+
+        call = self._start_call("measure")
+        in_process = self._parse_in_process(call, circuit)
+        if in_process is not None:
+            _, n_qubits, operations = in_process
+            with call.stage("simulation"):
+                amplitudes = statevector.simulate(n_qubits, operations)
+            with call.stage("sampling"):
+                counts = sample_counts(amplitudes, n_samples)
+            native_order = False
+        else:
+            with self._scratch.session() as scratch:
+                circuit_txt_path, _ = self._save_circuit(call, circuit, scratch)
+                argv, output_paths, binary = self._wavefunction_argv(
+                    call, circuit_txt_path, nthreads, scratch
+                )
+                with call.stage("simulation"):
+                    call.usage = yield argv
+                amplitudes = self._load_output(call, output_paths, binary)
+                with call.stage("sampling"):
+                    counts = sample_counts(amplitudes, n_samples)
+            native_order = self._native_order_output(binary)
+
+        n_qubits = len(amplitudes).bit_length() - 1
+        with call.stage("sampling"):
+            measurements = Measurements(
+                bitstrings_from_counts(
+                    counts, n_qubits, native_qubit_order=native_order
+                )
+            )
+        return self._finish_call(call, measurements)
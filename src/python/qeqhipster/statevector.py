@@ -0,0 +1,159 @@
+"""In-process simulation of small circuits with NumPy.
+
+For circuits of a few qubits, writing QASM into scratch space, starting the
+interpreter and reading its output back costs far more than the simulation itself.
+`simulate_qasm` simulates the simplified QASM read by the interpreter directly in
+this process, so it accepts exactly the circuits produced by
+`qeqhipster.utils.make_circuit_qhipster_compatible` and bound circuit templates.
+
+The state vector is viewed as a tensor with a separate axis of size 2 for every
+qubit. Each gate acts in place on the subtensors in which its qubits are fixed to 0
+or 1, so no gate allocates more than half of the state vector.
+"""
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .wavefunction import AMPLITUDE_DTYPE
+
+
+def _rotation(pauli: str) -> Callable[[float], np.ndarray]:
+    def _matrix(angle):
+        cos, sin = np.cos(angle / 2), np.sin(angle / 2)
+        if pauli == "X":
+            return np.array([[cos, -1j * sin], [-1j * sin, cos]])
+        if pauli == "Y":
+            return np.array([[cos, -sin], [sin, cos]])
+        return np.diag([np.exp(-0.5j * angle), np.exp(0.5j * angle)])
+
+    return _matrix
+
+
+# Matrices of single-qubit gates, keyed by their names in simplified QASM.
+SINGLE_QUBIT_GATES: Dict[str, Callable[..., np.ndarray]] = {
+    "X": lambda: np.array([[0, 1], [1, 0]]),
+    "Y": lambda: np.array([[0, -1j], [1j, 0]]),
+    "Z": lambda: np.diag([1, -1]),
+    "H": lambda: np.array([[1, 1], [1, -1]]) / np.sqrt(2),
+    "S": lambda: np.diag([1, 1j]),
+    "T": lambda: np.diag([1, np.exp(0.25j * np.pi)]),
+    "Rx": _rotation("X"),
+    "Ry": _rotation("Y"),
+    "Rz": _rotation("Z"),
+    "PHASE": lambda angle: np.diag([1, np.exp(1j * angle)]),
+}
+# Two-qubit gates applying a single-qubit gate to their second qubit if the first
+# one is set.
+CONTROLLED_GATES = {"CNOT": "X", "CZ": "Z", "CPHASE": "PHASE"}
+SUPPORTED_GATES = {*SINGLE_QUBIT_GATES, *CONTROLLED_GATES, "SWAP"}
+
+Operation = Tuple[str, Tuple[float, ...], Tuple[int, ...]]
+
+
+class UnsupportedGate(ValueError):
+    """Raised for circuits with gates the engine cannot simulate."""
+
+
+def parse_qasm(qasm: str) -> Tuple[int, List[Operation]]:
+    """Parse simplified QASM into number of qubits and list of operations, each
+    being a tuple (gate name, params, qubit indices).
+
+    Raises:
+        UnsupportedGate: if the circuit contains a gate not in `SUPPORTED_GATES`.
+    """
+    header, *lines = qasm.strip().split("\n")
+    operations = []
+    for line in lines:
+        name, *args = line.split()
+        if name not in SUPPORTED_GATES:
+            raise UnsupportedGate(
+                f"Gate {name} is not supported by the NumPy state vector engine. "
+                f"Supported gates are: {SUPPORTED_GATES}."
+            )
+        n_qubits = 1 if name in SINGLE_QUBIT_GATES else 2
+        operations.append(
+            (
+                name,
+                tuple(map(float, args[:-n_qubits])),
+                tuple(map(int, args[-n_qubits:])),
+            )
+        )
+    return int(header), operations
+
+
+def _subtensor(state: np.ndarray, bits: Dict[int, int]) -> np.ndarray:
+    """View of `state` in which axes given as keys of `bits` are fixed to values."""
+    # Slices rather than integers keep the result a view also if all axes are fixed.
+    index = [slice(None)] * state.ndim
+    for axis, bit in bits.items():
+        index[axis] = slice(bit, bit + 1)
+    return state[tuple(index)]
+
+
+def _apply(
+    state: np.ndarray, matrix: np.ndarray, target: int, controls: Sequence[int] = ()
+) -> None:
+    fixed = {control: 1 for control in controls}
+    zero = _subtensor(state, {**fixed, target: 0})
+    one = _subtensor(state, {**fixed, target: 1})
+    (m00, m01), (m10, m11) = matrix
+    if m01 == 0 and m10 == 0:
+        if m00 != 1:
+            zero *= m00
+        if m11 != 1:
+            one *= m11
+    elif m00 == 0 and m11 == 0:
+        zero_copy = zero.copy()
+        zero[...] = one
+        one[...] = zero_copy
+        if m01 != 1:
+            zero *= m01
+        if m10 != 1:
+            one *= m10
+    else:
+        new_zero = m00 * zero + m01 * one
+        one *= m11
+        one += m10 * zero
+        zero[...] = new_zero
+
+
+def simulate(
+    n_qubits: int, operations: Sequence[Operation], native_qubit_order: bool = False
+) -> np.ndarray:
+    """Simulate operations returned by `parse_qasm`, starting from |0...0>.
+
+    Args:
+        n_qubits: number of qubits of the circuit.
+        operations: the operations.
+        native_qubit_order: whether to return the state vector in the qubit order
+            native to qHiPSTER (qubit 0 being the least significant bit of amplitude
+            index) instead of the order used by z-quantum-core.
+
+    Returns:
+        State vector as complex128 array.
+    """
+    state = np.zeros((2,) * n_qubits, dtype=AMPLITUDE_DTYPE)
+    state[(0,) * n_qubits] = 1
+
+    def _axis(qubit):
+        return n_qubits - 1 - qubit if native_qubit_order else qubit
+
+    for name, params, qubits in operations:
+        axes = list(map(_axis, qubits))
+        if name == "SWAP":
+            first = _subtensor(state, {axes[0]: 0, axes[1]: 1})
+            second = _subtensor(state, {axes[0]: 1, axes[1]: 0})
+            first_copy = first.copy()
+            first[...] = second
+            second[...] = first_copy
+        elif name in CONTROLLED_GATES:
+            matrix = SINGLE_QUBIT_GATES[CONTROLLED_GATES[name]](*params)
+            _apply(state, matrix, axes[1], axes[:1])
+        else:
+            _apply(state, SINGLE_QUBIT_GATES[name](*params), axes[0])
+    return state.reshape(-1)
+
+
+def simulate_qasm(qasm: str, native_qubit_order: bool = False) -> np.ndarray:
+    """Simulate circuit given as simplified QASM, see `simulate`."""
+    return simulate(*parse_qasm(qasm), native_qubit_order)
@@ -0,0 +1,154 @@
+"""Parametric circuits compiled once into QASM with slots for gate parameters.
+
+Variational algorithms simulate the same circuit structure with many different
+parameter values. A `CircuitTemplate` validates the circuit and formats everything
+but its symbolic parameters once. Binding parameters afterwards only evaluates the
+parameters' expressions, vectorized over any number of points, and substitutes
+them into the precomputed skeleton.
+"""
+import hashlib
+import io
+from typing import Optional, Sequence, TextIO
+
+import numpy as np
+import sympy
+from zquantum.core import circuits
+
+from .utils import (
+    _qhipster_gate_name,
+    make_circuit_qhipster_compatible,
+    simplify_circuit,
+)
+
+# Format of parameters in QASM, identical to the one used by
+# `convert_to_simplified_qasm`.
+PARAM_FORMAT = "%.20f"
+
+
+class CircuitTemplate:
+    """Circuit compiled into simplified QASM with slots for its symbolic parameters.
+
+    Args:
+        circuit: circuit, possibly containing gates with symbolic parameters.
+        symbols: order in which values of free symbols are passed to `bind` and
+            `qasm`. Defaults to `circuit.free_symbols`.
+        simplify: whether to remove redundant gates with `simplify_circuit` before
+            compiling the circuit. Gates with symbolic parameters are kept, even if
+            their bound angles vanish or they could be merged with their neighbours
+            once bound. QASM of a simplified template may then differ from QASM of
+            the bound circuit simplified directly, although both describe the same
+            state.
+    """
+
+    def __init__(
+        self,
+        circuit: circuits.Circuit,
+        symbols: Optional[Sequence[sympy.Symbol]] = None,
+        simplify: bool = False,
+    ):
+        self.symbols = list(circuit.free_symbols if symbols is None else symbols)
+        self.n_qubits = circuit.n_qubits
+        self.n_gates = len(circuit.operations)
+        unbound_symbols = set(circuit.free_symbols) - set(self.symbols)
+        if unbound_symbols:
+            raise ValueError(
+                f"Symbols {unbound_symbols} of the circuit are not template's symbols."
+            )
+
+        self.n_removed_gates = 0
+        if simplify:
+            circuit, self.n_removed_gates = simplify_circuit(circuit)
+
+        expressions = []
+        lines = [str(self.n_qubits)]
+        for operation in make_circuit_qhipster_compatible(circuit).operations:
+            params = []
+            for param in operation.params:
+                if isinstance(param, sympy.Expr) and param.free_symbols:
+                    expressions.append(param)
+                    params.append(PARAM_FORMAT)
+                else:
+                    params.append(PARAM_FORMAT % float(param))
+            lines.append(
+                " ".join(
+                    [
+                        _qhipster_gate_name(operation.gate).replace("%", "%%"),
+                        *params,
+                        *map(str, operation.qubit_indices),
+                    ]
+                )
+            )
+        self._skeleton = "\n".join(lines) if circuit.operations else f"{lines[0]}\n"
+        self.n_slots = len(expressions)
+        self._evaluate = sympy.lambdify(self.symbols, expressions, modules="numpy")
+
+    @property
+    def n_params(self) -> int:
+        return len(self.symbols)
+
+    def slot_values(self, params) -> np.ndarray:
+        """Evaluate parameters of all gates for one or many points.
+
+        Args:
+            params: values of template's symbols, either a vector of length
+                `n_params` or an array of shape (n_points, n_params).
+
+        Returns:
+            Array of shape (n_slots,) or (n_points, n_slots) respectively.
+        """
+        params = np.asarray(params, dtype=float)
+        if params.shape[-1:] != (self.n_params,) or params.ndim > 2:
+            raise ValueError(
+                f"Expected {self.n_params} parameters per point, got array of shape "
+                f"{params.shape}."
+            )
+        points = np.atleast_2d(params)
+        values = np.empty((len(points), self.n_slots))
+        for slot, slot_values in enumerate(self._evaluate(*points.T)):
+            values[:, slot] = np.real(slot_values)
+        return values if params.ndim == 2 else values[0]
+
+    def qasm(self, params) -> str:
+        """Simplified QASM of the circuit bound to a single point."""
+        return self._skeleton % tuple(self.slot_values(params).tolist())
+
+    def bind(self, params) -> "BoundCircuitTemplate":
+        """Bind template to a single point, i.e. vector of values of its symbols."""
+        params = np.asarray(params, dtype=float)
+        if params.shape != (self.n_params,):
+            raise ValueError(
+                f"Expected vector of {self.n_params} parameters, got array of shape "
+                f"{params.shape}."
+            )
+        return BoundCircuitTemplate(self, params)
+
+
+class BoundCircuitTemplate:
+    """Circuit template bound to values of its symbols, ready to be simulated."""
+
+    def __init__(self, template: CircuitTemplate, params: np.ndarray):
+        self.template = template
+        self.params = params
+
+    @property
+    def n_qubits(self) -> int:
+        return self.template.n_qubits
+
+    def write(self, file: TextIO) -> str:
+        """Write QASM into text file.
+
+        Returns:
+            sha256 hex digest of the written text. For templates compiled without
+            `simplify`, it is the same as the one returned by `write_simplified_qasm`
+            for the equivalent bound circuit, so results cached for either are
+            shared. Simplified templates may produce a different digest, and hence
+            a separate cache entry, see `CircuitTemplate`.
+        """
+        qasm = self.template.qasm(self.params)
+        file.write(qasm)
+        return hashlib.sha256(qasm.encode()).hexdigest()
+
+    def save(self, filename: str) -> str:
+        """Write QASM into `filename` using `write`."""
+        with open(filename, "w", buffering=io.DEFAULT_BUFFER_SIZE * 16) as f:
+            return self.write(f)
@@ -0,0 +1,298 @@
+"""Choice of interpreter's thread count and placement of its threads on cores.
+
+Number of threads is chosen from a cost model of simulation time,
+
+    time(n_qubits, nthreads) = 2**n_qubits * (parallel / nthreads + serial)
+                               + overhead * nthreads,
+
+whose coefficients are fitted to timings measured on the machine. The fitted model
+is stored in a thread profile file, which is (re)generated by running
+
+    python -m qeqhipster.threads
+
+Without a profile the heuristic from `qeqhipster.batching.threads_for_circuit` is
+used.
+
+Simulators binding their threads to cores get disjoint sets of cores from a
+process-wide allocator, which prefers cores of a single NUMA node.
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from .batching import available_cores, threads_for_circuit
+
+AUTO_THREADS = "auto"
+
+
+def default_thread_profile_path() -> str:
+    cache_home = os.getenv("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "qeqhipster", "thread_profile.json")
+
+
+@dataclass
+class ThreadProfile:
+    """Cost model of simulation time fitted to measured timings.
+
+    Attributes:
+        parallel: time per amplitude of work split between threads.
+        serial: time per amplitude of work not split between threads.
+        overhead: time per thread of starting and synchronizing threads.
+        samples: measured timings as (n_qubits, nthreads, seconds) triples.
+    """
+
+    parallel: float
+    serial: float
+    overhead: float
+    samples: List[List[float]] = field(default_factory=list)
+
+    def predicted_time(self, n_qubits: int, nthreads) -> np.ndarray:
+        nthreads = np.asarray(nthreads, dtype=float)
+        return (
+            2.0**n_qubits * (self.parallel / nthreads + self.serial)
+            + self.overhead * nthreads
+        )
+
+    def threads_for(self, n_qubits: int, n_cores: int) -> int:
+        """Choose number of threads minimizing predicted simulation time."""
+        candidates = np.arange(1, n_cores + 1)
+        return int(candidates[np.argmin(self.predicted_time(n_qubits, candidates))])
+
+    @classmethod
+    def fit(cls, samples: Iterable[Sequence[float]]) -> "ThreadProfile":
+        samples = [list(map(float, sample)) for sample in samples]
+        n_qubits, nthreads, seconds = np.array(samples).T
+        design = np.stack([2**n_qubits / nthreads, 2**n_qubits, nthreads], axis=1)
+        coefficients, *_ = np.linalg.lstsq(design, seconds, rcond=None)
+        parallel, serial, overhead = np.maximum(coefficients, 0.0)
+        return cls(float(parallel), float(serial), float(overhead), samples)
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "parallel": self.parallel,
+                    "serial": self.serial,
+                    "overhead": self.overhead,
+                    "samples": self.samples,
+                },
+                f,
+                indent=2,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "ThreadProfile":
+        with open(path) as f:
+            return cls(**json.load(f))
+
+
+def load_thread_profile(path: Optional[str] = None) -> Optional[ThreadProfile]:
+    """Load thread profile, returning None if there is none."""
+    try:
+        return ThreadProfile.load(path or default_thread_profile_path())
+    except FileNotFoundError:
+        return None
+
+
+def thread_chooser(
+    profile: Optional[ThreadProfile],
+) -> Callable[[int, int], int]:
+    """Return function choosing number of threads from number of qubits and cores."""
+    return profile.threads_for if profile is not None else threads_for_circuit
+
+
+def calibrate(
+    simulate: Callable[[int, int], None],
+    qubit_counts: Sequence[int],
+    thread_counts: Sequence[int],
+    repeats: int = 3,
+) -> ThreadProfile:
+    """Fit thread profile to timings of `simulate(n_qubits, nthreads)`.
+
+    Each configuration is run `repeats` times and its fastest run is used.
+    """
+    samples = []
+    for n_qubits in qubit_counts:
+        for nthreads in thread_counts:
+            times = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                simulate(n_qubits, nthreads)
+                times.append(time.perf_counter() - start)
+            samples.append([n_qubits, nthreads, min(times)])
+    return ThreadProfile.fit(samples)
+
+
+def _parse_cpu_list(cpu_list: str) -> List[int]:
+    cores = []
+    for part in cpu_list.strip().split(","):
+        if part:
+            first, _, last = part.partition("-")
+            cores.extend(range(int(first), int(last or first) + 1))
+    return cores
+
+
+def numa_nodes() -> List[List[int]]:
+    """Return cores of each NUMA node, or all cores as a single node if NUMA
+    topology is unknown."""
+    nodes = []
+    paths = glob.glob("/sys/devices/system/node/node*/cpulist")
+    for path in sorted(paths, key=lambda p: int(re.findall(r"node(\d+)", p)[-1])):
+        with open(path) as f:
+            nodes.append(_parse_cpu_list(f.read()))
+    return nodes or [list(range(os.cpu_count() or 1))]
+
+
+class CoreAllocator:
+    """Hands out disjoint sets of cores to simulators.
+
+    Cores are handed out from the NUMA node with most unused cores first. Once all
+    cores are in use, the least used ones are shared.
+
+    Args:
+        cores: cores to allocate. Defaults to all cores available to the process.
+        nodes: cores of each NUMA node. Defaults to `numa_nodes()`.
+    """
+
+    def __init__(
+        self,
+        cores: Optional[Iterable[int]] = None,
+        nodes: Optional[Sequence[Sequence[int]]] = None,
+    ):
+        cores = sorted(os.sched_getaffinity(0) if cores is None else cores)
+        self._usage: Dict[int, int] = {core: 0 for core in cores}
+        self._node_of = {
+            core: index
+            for index, node in enumerate(nodes or numa_nodes())
+            for core in node
+        }
+        self._lock = threading.Lock()
+
+    def allocate(self, n_cores: int) -> List[int]:
+        with self._lock:
+            n_cores = min(n_cores, len(self._usage))
+            node_free_cores: Dict[int, int] = {}
+            for core, usage in self._usage.items():
+                node = self._node_of.get(core, 0)
+                node_free_cores[node] = node_free_cores.get(node, 0) + (usage == 0)
+            order = sorted(
+                self._usage,
+                key=lambda core: (
+                    self._usage[core],
+                    -node_free_cores[self._node_of.get(core, 0)],
+                    self._node_of.get(core, 0),
+                    core,
+                ),
+            )
+            cores = sorted(order[:n_cores])
+            for core in cores:
+                self._usage[core] += 1
+            return cores
+
+    def release(self, cores: Iterable[int]) -> None:
+        with self._lock:
+            for core in cores:
+                self._usage[core] -= 1
+
+
+_default_allocator: Optional[CoreAllocator] = None
+_default_allocator_lock = threading.Lock()
+
+
+def default_core_allocator() -> CoreAllocator:
+    global _default_allocator
+    with _default_allocator_lock:
+        if _default_allocator is None:
+            _default_allocator = CoreAllocator()
+        return _default_allocator
+
+
+def binding_env(cores: Sequence[int], nthreads: Optional[int] = None) -> Dict[str, str]:
+    """OpenMP and MKL variables binding interpreter's threads to `cores`.
+
+    Args:
+        cores: cores the threads may run on.
+        nthreads: number of threads of each process. Defaults to number of cores.
+    """
+    core_list = ",".join(map(str, cores))
+    nthreads = len(cores) if nthreads is None else nthreads
+    return {
+        "OMP_NUM_THREADS": str(nthreads),
+        "MKL_NUM_THREADS": str(nthreads),
+        "OMP_PLACES": ",".join(f"{{{core}}}" for core in cores),
+        "OMP_PROC_BIND": "close",
+        "KMP_AFFINITY": f"granularity=fine,proclist=[{core_list}],explicit",
+    }
+
+
+def set_affinity(pid: int, cores: Sequence[int]) -> None:
+    """Restrict process to `cores`, ignoring processes that have already exited."""
+    with contextlib.suppress(ProcessLookupError):
+        os.sched_setaffinity(pid, cores)
+
+
+def _random_circuit(n_qubits, n_layers=4, seed=0):
+    from zquantum.core import circuits
+
+    rng = np.random.default_rng(seed)
+    operations = []
+    for _ in range(n_layers):
+        operations.extend(circuits.H(qubit) for qubit in range(n_qubits))
+        operations.extend(
+            circuits.CNOT(qubit, qubit + 1) for qubit in range(n_qubits - 1)
+        )
+        operations.extend(
+            circuits.RZ(angle)(qubit)
+            for qubit, angle in enumerate(rng.uniform(0, 2 * np.pi, n_qubits))
+        )
+    return circuits.Circuit(operations, n_qubits=n_qubits)
+
+
+def main(argv=None):
+    from .simulator import QHipsterSimulator
+
+    parser = argparse.ArgumentParser(
+        description="Calibrate model used for choosing interpreter's thread count."
+    )
+    parser.add_argument("--min-qubits", type=int, default=12)
+    parser.add_argument("--max-qubits", type=int, default=24)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default=default_thread_profile_path())
+    args = parser.parse_args(argv)
+
+    n_cores = available_cores()
+    thread_counts = sorted({2**i for i in range(n_cores.bit_length())} | {n_cores})
+    # Small circuits would be simulated in process, without timing the interpreter.
+    simulator = QHipsterSimulator(in_process_max_qubits=None)
+    circuits = {
+        n: _random_circuit(n) for n in range(args.min_qubits, args.max_qubits + 1, 2)
+    }
+
+    profile = calibrate(
+        lambda n_qubits, nthreads: simulator._simulate_wavefunction(
+            circuits[n_qubits], nthreads
+        ),
+        sorted(circuits),
+        thread_counts,
+        args.repeats,
+    )
+    profile.save(args.output)
+    print(f"Thread profile written to {args.output}.")
+    for n_qubits in sorted(circuits):
+        print(f"{n_qubits} qubits: {profile.threads_for(n_qubits, n_cores)} threads")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,30 @@
+import hashlib
+import io
 import json
+from functools import lru_cache
+from numbers import Number
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, TextIO, Tuple
 
 import numpy as np
 from zquantum.core import circuits
-from zquantum.core.openfermion import SymbolicOperator
 
+if TYPE_CHECKING:
+    from zquantum.core.openfermion import SymbolicOperator
 
-def save_symbolic_operator(op: SymbolicOperator, filename: str) -> None:
+# Terms with coefficients smaller than this are omitted when serializing operators.
+NEGLIGIBLE_COEFFICIENT = 0.00000001
+
+# Number of Pauli strings formatted before they are flushed to the output file.
+PAULI_STRINGS_CHUNK_SIZE = 4096
+
+
+def save_symbolic_operator(op: "SymbolicOperator", filename: str) -> None:
     dictionary = {"expression": convert_symbolic_op_to_string(op)}
     with open(filename, "w") as f:
         f.write(json.dumps(dictionary, indent=2))
 
 
-def convert_symbolic_op_to_string(op: SymbolicOperator) -> str:
+def convert_symbolic_op_to_string(op: "SymbolicOperator") -> str:
     """Convert an openfermion SymbolicOperator to a string. This differs from the
     SymbolicOperator's __str__ method only in that we preserve the order of terms.
     Adapted from openfermion.
@@ -26,7 +39,7 @@ def convert_symbolic_op_to_string(op: SymbolicOperator) -> str:
         return "0"
     string_rep = ""
     for term, coeff in op.terms.items():
-        if np.abs(coeff) < 0.00000001:
+        if is_negligible_coefficient(coeff):
             continue
         tmp_string = "{} [".format(coeff)
         for factor in term:
@@ -40,24 +53,273 @@ def convert_symbolic_op_to_string(op: SymbolicOperator) -> str:
     return string_rep[:-3]
 
 
-QHIPSTER_UNSUPPORTED_GATES = {"ISWAP", "XX", "YY", "ZZ", "XY"}
+def is_negligible_coefficient(coefficient) -> bool:
+    return np.abs(coefficient) < NEGLIGIBLE_COEFFICIENT
 
 
-def make_circuit_qhipster_compatible(circuit: circuits.Circuit):
-    unsupported_operations = [
-        op for op in circuit.operations if op.gate.name in QHIPSTER_UNSUPPORTED_GATES
-    ]
-    if unsupported_operations:
-        raise NotImplementedError(
-            "ISWAP gates and two-qubit Pauli rotations are not supported by qHipster "
-            f"integration. Offending operations: {unsupported_operations}."
+def write_pauli_strings(op: "SymbolicOperator", filename: str) -> None:
+    """Write operator in the Pauli strings format read by the interpreter.
+
+    The output is identical to the one produced by `qubitop_to_paulistrings.o` from
+    JSON written by `save_symbolic_operator`: each term with non-negligible
+    coefficient is written in a separate line, as space separated factors like
+    "X0 Y3". Coefficients are not written, expectation values computed by the
+    interpreter are rescaled afterwards.
+
+    Args:
+        op: the operator.
+        filename: path to the output file.
+    """
+    tokens: Dict[Tuple[int, str], str] = {}
+    action_strings = dict(zip(op.actions, op.action_strings))
+
+    def _token(factor):
+        if factor not in tokens:
+            index, action = factor
+            tokens[factor] = (
+                f"{action_strings[action]}{index}"
+                if op.action_before_index
+                else f"{index}{action_strings[action]}"
+            )
+        return tokens[factor]
+
+    with open(filename, "w", buffering=io.DEFAULT_BUFFER_SIZE * 16) as f:
+        lines = []
+        for term, coefficient in op.terms.items():
+            if is_negligible_coefficient(coefficient):
+                continue
+            lines.append(" ".join(map(_token, term)))
+            if len(lines) == PAULI_STRINGS_CHUNK_SIZE:
+                f.write("\n".join(lines) + "\n")
+                lines.clear()
+        if lines:
+            f.write("\n".join(lines) + "\n")
+
+
+# Gates not supported by the interpreter, which are lowered into sequences of
+# supported gates.
+LOWERED_GATES = {"ISWAP", "XX", "YY", "ZZ", "XY"}
+
+# Lowerings are sequences of (gate, indices, angle). Gate acts on indices of the
+# lowered gate's qubits. If angle is not None, gate is a rotation and angle is the
+# function computing its angle from the angle of the lowered gate.
+_Lowering = Tuple[Tuple[object, Tuple[int, ...], Optional[Callable]], ...]
+
+# Angles of lowered gates without parameters.
+_FIXED_ANGLES = {"ISWAP": np.pi}
+
+
+def _with_angle(lowering: _Lowering, angle: Callable) -> _Lowering:
+    """Lowering with `angle(a)` substituted for angle a of the lowered gate."""
+    return tuple(
+        (gate, indices, (lambda a, f=f: f(angle(a))) if f is not None else None)
+        for gate, indices, f in lowering
+    )
+
+
+@lru_cache(maxsize=None)
+def _lowering(gate_name: str) -> _Lowering:
+    """Return supported gates equivalent to two-qubit gate, together with indices of
+    the gate's qubits they act on.
+
+    Lowerings don't depend on the angle of the gate, so that only one of them is
+    cached per gate.
+    """
+    if gate_name == "ZZ":
+        # exp(-i angle/2 Z0 Z1)
+        return (
+            (circuits.CNOT, (0, 1), None),
+            (circuits.RZ, (1,), lambda angle: angle),
+            (circuits.CNOT, (0, 1), None),
+        )
+    if gate_name == "XX":
+        hadamards = ((circuits.H, (0,), None), (circuits.H, (1,), None))
+        return hadamards + _lowering("ZZ") + hadamards
+    if gate_name == "YY":
+        # RX(pi/2) is applied first, and RX(-pi/2) Z RX(pi/2) = Y.
+        return (
+            (circuits.RX(np.pi / 2), (0,), None),
+            (circuits.RX(np.pi / 2), (1,), None),
+            *_lowering("ZZ"),
+            (circuits.RX(-np.pi / 2), (0,), None),
+            (circuits.RX(-np.pi / 2), (1,), None),
+        )
+    if gate_name == "XY":
+        # XX and YY commute, XY(angle) = exp(i angle/4 (X0 X1 + Y0 Y1)).
+        return _with_angle(_lowering("XX") + _lowering("YY"), lambda angle: -angle / 2)
+    if gate_name == "ISWAP":
+        return _lowering("XY")
+    raise ValueError(f"Gate {gate_name} cannot be lowered.")
+
+
+def lower_operation(operation: circuits.GateOperation) -> List[circuits.GateOperation]:
+    """Lower operation with one of `LOWERED_GATES` into CNOTs, rotations and basis
+    changes supported by the interpreter.
+
+    Lowerings are cached per gate, angles, including symbolic ones, are substituted
+    into them.
+    """
+    name = operation.gate.name
+    angle = operation.gate.params[0] if operation.gate.params else _FIXED_ANGLES[name]
+    qubits = operation.qubit_indices
+    return [
+        (gate(gate_angle(angle)) if gate_angle is not None else gate)(
+            *(qubits[index] for index in indices)
         )
-    return circuits.Circuit(
-        operations=[
-            circuits.RX(0)(*op.qubit_indices) if op.gate.name == "I" else op
-            for op in circuit.operations
-        ],
-        n_qubits=circuit.n_qubits,
+        for gate, indices, gate_angle in _lowering(name)
+    ]
+
+
+def make_circuit_qhipster_compatible(circuit: circuits.Circuit):
+    """Replace identities with zero-angle rotations and lower gates unsupported by
+    the interpreter, see `lower_operation`."""
+    operations = []
+    for op in circuit.operations:
+        if op.gate.name == "I":
+            operations.append(circuits.RX(0)(*op.qubit_indices))
+        elif op.gate.name in LOWERED_GATES:
+            operations.extend(lower_operation(op))
+        else:
+            operations.append(op)
+    return circuits.Circuit(operations=operations, n_qubits=circuit.n_qubits)
+
+
+# Gates equal to their own inverse, so that two of them acting on the same qubits
+# one right after another cancel out.
+SELF_INVERSE_GATES = {"X", "Y", "Z", "H", "CNOT", "CZ", "SWAP"}
+# Self-inverse gates whose action does not depend on the order of their qubits.
+SYMMETRIC_GATES = {"CZ", "SWAP"}
+# Rotations whose consecutive applications on the same qubits add up their angles.
+ADDITIVE_ROTATIONS = {
+    "RX": circuits.RX,
+    "RY": circuits.RY,
+    "RZ": circuits.RZ,
+    "PHASE": circuits.PHASE,
+    "CPHASE": circuits.CPHASE,
+}
+# Rotations by angles smaller than this are considered identities.
+NEGLIGIBLE_ANGLE = 1e-12
+
+
+def _is_negligible_rotation(operation: circuits.GateOperation) -> bool:
+    angle = operation.gate.params[0]
+    return isinstance(angle, Number) and abs(angle) < NEGLIGIBLE_ANGLE
+
+
+def _same_qubits(first: circuits.GateOperation, second: circuits.GateOperation):
+    if first.gate.name in SYMMETRIC_GATES:
+        return set(first.qubit_indices) == set(second.qubit_indices)
+    return first.qubit_indices == second.qubit_indices
+
+
+def _combine(
+    first: circuits.GateOperation,
+    second: circuits.GateOperation,
+    merge_symbolic: bool = False,
+):
+    """Combine two operations acting one right after another on the same qubits.
+
+    Returns:
+        Tuple (combined, removed): `combined` is a list of operations replacing both
+        operations, `removed` tells if they were combined at all.
+    """
+    name = first.gate.name
+    if name != second.gate.name or not _same_qubits(first, second):
+        return [first, second], False
+    if name in SELF_INVERSE_GATES:
+        return [], True
+    if name in ADDITIVE_ROTATIONS:
+        first_angle, second_angle = first.gate.params[0], second.gate.params[0]
+        if merge_symbolic or (
+            isinstance(first_angle, Number) and isinstance(second_angle, Number)
+        ):
+            merged = ADDITIVE_ROTATIONS[name](first_angle + second_angle)(
+                *first.qubit_indices
+            )
+            return ([] if _is_negligible_rotation(merged) else [merged]), True
+    return [first, second], False
+
+
+def _lowered_operations(circuit: circuits.Circuit):
+    for operation in circuit.operations:
+        if operation.gate.name in LOWERED_GATES:
+            yield from lower_operation(operation)
+        else:
+            yield operation
+
+
+def simplify_circuit(
+    circuit: circuits.Circuit, merge_symbolic: bool = False
+) -> Tuple[circuits.Circuit, int]:
+    """Remove gates that don't change the state, so that the interpreter makes fewer
+    passes over the state vector.
+
+    Gates unsupported by the interpreter are lowered first, see `lower_operation`.
+    Identities and rotations by zero angles are dropped, consecutive rotations about
+    the same axis acting on the same qubits are merged and adjacent pairs of
+    identical self-inverse gates cancel out. Operations are adjacent if no operation
+    acts on any of their qubits in between. Rotations are merged only if their
+    angles are numbers, not symbolic expressions, unless `merge_symbolic` is set.
+
+    The interpreter has no gate taking an arbitrary single-qubit unitary, so runs of
+    single-qubit gates about different axes are left as they are.
+
+    Args:
+        circuit: circuit to be simplified.
+        merge_symbolic: whether to merge rotations with symbolic angles into a
+            single rotation by the sum of their angles.
+
+    Returns:
+        Tuple (simplified, n_removed) where `simplified` is a circuit with the same
+        number of qubits and `n_removed` is the number of removed gates, counting
+        gates produced by lowering.
+    """
+    operations: List[Optional[circuits.GateOperation]] = []
+    # Indices (in `operations`) of operations acting on each qubit, in order.
+    qubit_operations: Dict[int, List[int]] = {}
+
+    def _remove(index):
+        for qubit in operations[index].qubit_indices:
+            qubit_operations[qubit].pop()
+        operations[index] = None
+
+    def _append(operation):
+        for qubit in operation.qubit_indices:
+            qubit_operations.setdefault(qubit, []).append(len(operations))
+        operations.append(operation)
+
+    n_operations = 0
+    for operation in _lowered_operations(circuit):
+        n_operations += 1
+        name = operation.gate.name
+        if name == "I" or (
+            name in ADDITIVE_ROTATIONS and _is_negligible_rotation(operation)
+        ):
+            continue
+        last_indices = {
+            qubit_operations[qubit][-1] if qubit_operations.get(qubit) else None
+            for qubit in operation.qubit_indices
+        }
+        last_index = last_indices.pop() if len(last_indices) == 1 else None
+        if last_index is not None and len(operations[last_index].qubit_indices) == len(
+            operation.qubit_indices
+        ):
+            combined, removed = _combine(
+                operations[last_index], operation, merge_symbolic
+            )
+            if removed:
+                _remove(last_index)
+                # Combined operation acts on the same qubits as the removed one, and
+                # nothing acts on them after it, so it can be appended at the end.
+                for combined_operation in combined:
+                    _append(combined_operation)
+                continue
+        _append(operation)
+
+    simplified_operations = [op for op in operations if op is not None]
+    return (
+        circuits.Circuit(simplified_operations, n_qubits=circuit.n_qubits),
+        n_operations - len(simplified_operations),
     )
 
 
@@ -89,3 +351,74 @@ def convert_to_simplified_qasm(circuit: circuits.Circuit):
         if circuit.operations
         else "0\n"
     )
+
+
+# Number of QASM lines formatted before they are flushed to the output file.
+QASM_CHUNK_SIZE = 4096
+
+_IDENTITY_REPLACEMENT = f"{_qhipster_gate_name(circuits.RX(0))} {0:.20f}"
+
+
+def write_simplified_qasm(circuit: circuits.Circuit, file: TextIO) -> str:
+    """Write circuit as simplified QASM read by the interpreter, in a single pass.
+
+    This is a streaming counterpart of `make_circuit_qhipster_compatible` followed by
+    `convert_to_simplified_qasm`: unsupported gates are lowered and identities are
+    replaced with zero-angle rotations while lines are written, without building
+    intermediate circuits or strings. The only difference is that the header always
+    contains `circuit.n_qubits`, also for circuits not acting on their last qubits.
+
+    Args:
+        circuit: circuit to be written.
+        file: text file the QASM is written to.
+
+    Returns:
+        sha256 hex digest of the written text.
+    """
+    digest = hashlib.sha256()
+    gate_names: Dict[str, str] = {}
+
+    def _write(text):
+        file.write(text)
+        digest.update(text.encode())
+
+    def _line(operation):
+        gate = operation.gate
+        if gate.name not in gate_names:
+            gate_names[gate.name] = _qhipster_gate_name(gate)
+        return " ".join(
+            [
+                gate_names[gate.name],
+                *["%.20f" % param for param in gate.params],
+                *map(str, operation.qubit_indices),
+            ]
+        )
+
+    _write(str(circuit.n_qubits))
+    lines = [""]
+    for operation in circuit.operations:
+        gate = operation.gate
+        if gate.name == "I":
+            lines.append(f"{_IDENTITY_REPLACEMENT} {operation.qubit_indices[0]}")
+        elif gate.name in LOWERED_GATES:
+            lines.extend(map(_line, lower_operation(operation)))
+        else:
+            lines.append(_line(operation))
+        if len(lines) > QASM_CHUNK_SIZE:
+            _write("\n".join(lines))
+            lines = [""]
+    if len(lines) > 1:
+        _write("\n".join(lines))
+    if not circuit.operations:
+        _write("\n")
+    return digest.hexdigest()
+
+
+def save_simplified_qasm(circuit: circuits.Circuit, filename: str) -> str:
+    """Write circuit into `filename` using `write_simplified_qasm`.
+
+    Returns:
+        sha256 hex digest of the written text.
+    """
+    with open(filename, "w", buffering=io.DEFAULT_BUFFER_SIZE * 16) as f:
+        return write_simplified_qasm(circuit, f)
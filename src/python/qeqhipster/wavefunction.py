@@ -0,0 +1,307 @@
+"""Transport of state vectors produced by the interpreter."""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+AMPLITUDE_DTYPE = np.dtype(np.complex128)
+
+
+def save_binary_wavefunction(amplitudes: np.ndarray, path: str) -> None:
+    """Save amplitudes as raw complex128 values, i.e. in the format produced by
+    binary-output interpreter."""
+    np.asarray(amplitudes, dtype=AMPLITUDE_DTYPE).tofile(path)
+
+
+def load_binary_wavefunction(path: str) -> np.ndarray:
+    """Load state vector stored as raw complex128 values.
+
+    The file is memory-mapped instead of being read, so no copy of the state vector
+    is made until it is modified. Amplitudes are expected to already be stored in
+    the qubit order used by z-quantum-core.
+
+    Args:
+        path: path to the file written by the interpreter.
+
+    Returns:
+        copy-on-write memory map of amplitudes.
+    """
+    size = os.path.getsize(path)
+    n_amplitudes, remainder = divmod(size, AMPLITUDE_DTYPE.itemsize)
+    if remainder or n_amplitudes & (n_amplitudes - 1) or n_amplitudes == 0:
+        raise ValueError(
+            f"File {path} of size {size}B does not contain a valid state vector."
+        )
+    return np.memmap(path, dtype=AMPLITUDE_DTYPE, mode="c", shape=(n_amplitudes,))
+
+
+# Reversal of qubit order is done on square tiles of 2**TILE_BITS x 2**TILE_BITS
+# amplitudes. Rows of such tile are contiguous in memory and big enough to make good
+# use of cache lines, while the whole tile still fits in L1/L2 cache.
+TILE_BITS = 6
+# Number of amplitudes copied at once when reversing qubit order.
+DEFAULT_CHUNK_SIZE = 2**14
+
+_BYTE_REVERSAL_TABLE = np.array(
+    [int(f"{i:08b}"[::-1], 2) for i in range(256)], dtype=np.uint64
+)
+
+
+def reverse_bits(values: np.ndarray, n_bits: int) -> np.ndarray:
+    """Reverse order of the lowest `n_bits` bits of every value."""
+    values = np.asarray(values, dtype=np.uint64)
+    result = np.zeros_like(values)
+    for byte_index in range(8):
+        byte = (values >> np.uint64(8 * byte_index)) & np.uint64(255)
+        result |= _BYTE_REVERSAL_TABLE[byte] << np.uint64(56 - 8 * byte_index)
+    return (result >> np.uint64(64 - n_bits)) if n_bits else np.zeros_like(values)
+
+
+def reverse_qubit_order(
+    amplitudes: np.ndarray, nthreads: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> np.ndarray:
+    """Reverse qubit order of a state vector in place.
+
+    This is the same permutation as the one done by `flip_wavefunction` from
+    z-quantum-core, but it needs only O(chunk_size) additional memory instead of a
+    whole copy of the state vector.
+
+    Index of every amplitude is split into `TILE_BITS` high bits, `TILE_BITS` low
+    bits and the middle bits. Reversing the index maps all amplitudes sharing middle
+    bits m onto a single tile with middle bits reverse(m). Pairs of such tiles are
+    swapped (and the tiles themselves permuted), a chunk of tiles at a time.
+
+    Args:
+        amplitudes: C-contiguous, one dimensional state vector.
+        nthreads: number of threads used for swapping tiles.
+        chunk_size: approximate number of amplitudes processed at once by each
+            thread.
+
+    Returns:
+        `amplitudes`, with qubit order reversed.
+    """
+    n_amplitudes = len(amplitudes)
+    n_qubits = n_amplitudes.bit_length() - 1
+    if n_amplitudes != 2**n_qubits:
+        raise ValueError("Length of state vector has to be a power of two.")
+    if not amplitudes.flags.c_contiguous or not amplitudes.flags.writeable:
+        raise ValueError("State vector has to be writeable and C-contiguous.")
+
+    tile_bits = min(TILE_BITS, n_qubits // 2)
+    middle_bits = n_qubits - 2 * tile_bits
+    tiles = amplitudes.reshape(2**tile_bits, 2**middle_bits, 2**tile_bits)
+    tile_permutation = reverse_bits(np.arange(2**tile_bits), tile_bits).astype(int)
+
+    def _permute_tiles(chunk):
+        # P(T)[x, y] = T[rev(y), rev(x)]
+        return chunk[tile_permutation][:, :, tile_permutation].transpose(2, 1, 0)
+
+    def _swap_tiles(middle_indices):
+        reversed_indices = reverse_bits(middle_indices, middle_bits).astype(int)
+        chunk = tiles[:, middle_indices, :]
+        reversed_chunk = tiles[:, reversed_indices, :]
+        tiles[:, reversed_indices, :] = _permute_tiles(chunk)
+        tiles[:, middle_indices, :] = _permute_tiles(reversed_chunk)
+
+    middle_indices = np.arange(2**middle_bits)
+    middle_indices = middle_indices[
+        middle_indices <= reverse_bits(middle_indices, middle_bits)
+    ]
+    tiles_per_chunk = max(1, chunk_size // 4**tile_bits)
+    chunks = [
+        middle_indices[start : start + tiles_per_chunk]
+        for start in range(0, len(middle_indices), tiles_per_chunk)
+    ]
+
+    if nthreads > 1:
+        with ThreadPoolExecutor(max_workers=nthreads) as executor:
+            list(executor.map(_swap_tiles, chunks))
+    else:
+        for chunk in chunks:
+            _swap_tiles(chunk)
+
+    return amplitudes
+
+
+# Number of amplitudes read at once when sampling from a state vector.
+DEFAULT_BLOCK_SIZE = 2**16
+
+
+def _block_probabilities(amplitudes, start, block_size):
+    block = amplitudes[start : start + block_size]
+    return block.real**2 + block.imag**2
+
+
+def sample_counts(
+    amplitudes: np.ndarray,
+    n_samples: int,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    seed=None,
+) -> Dict[int, int]:
+    """Sample measurement outcomes from state vector, one block at a time.
+
+    Only a single block of probabilities is held in memory at any time, hence the
+    state vector can be a memory map that is never read into memory as a whole.
+    First pass computes total probability of every block and distributes samples
+    between blocks. Second pass distributes samples of each block between its
+    outcomes.
+
+    Args:
+        amplitudes: state vector to sample from.
+        n_samples: number of samples to draw.
+        block_size: number of amplitudes processed at once.
+        seed: seed passed to `np.random.default_rng`.
+
+    Returns:
+        Dictionary mapping indices of sampled amplitudes to number of their
+        occurrences.
+    """
+    if n_samples < 1:
+        raise ValueError("Number of samples has to be positive.")
+    rng = np.random.default_rng(seed)
+    block_starts = range(0, len(amplitudes), block_size)
+    block_weights = np.array(
+        [
+            _block_probabilities(amplitudes, start, block_size).sum()
+            for start in block_starts
+        ]
+    )
+    block_counts = rng.multinomial(n_samples, block_weights / block_weights.sum())
+
+    counts = {}
+    for start, block_count in zip(block_starts, block_counts):
+        if block_count == 0:
+            continue
+        probabilities = _block_probabilities(amplitudes, start, block_size)
+        outcome_counts = rng.multinomial(
+            block_count, probabilities / probabilities.sum()
+        )
+        for index in np.flatnonzero(outcome_counts):
+            counts[start + int(index)] = int(outcome_counts[index])
+    return counts
+
+
+def bitstrings_from_counts(
+    counts: Dict[int, int], n_qubits: int, native_qubit_order=False, seed=None
+) -> List[Tuple[int, ...]]:
+    """Convert sampled amplitude indices into shuffled list of bitstrings.
+
+    Args:
+        counts: dictionary mapping amplitude indices to number of occurrences.
+        n_qubits: number of qubits of the sampled state vector.
+        native_qubit_order: whether indices come from a state vector in the qubit
+            order used by z-quantum-core (False) or by qHiPSTER (True).
+        seed: seed passed to `np.random.default_rng` used for shuffling.
+
+    Returns:
+        List of bitstrings, i-th entry of each bitstring being state of i-th qubit.
+    """
+    bitstrings = []
+    for index, count in counts.items():
+        bits = f"{index:0{n_qubits}b}" if n_qubits else ""
+        if native_qubit_order:
+            bits = bits[::-1]
+        bitstrings.extend([tuple(map(int, bits))] * count)
+    np.random.default_rng(seed).shuffle(bitstrings)
+    return bitstrings
+
+
+# Outputs into which state vectors can be converted, see `convert_output`.
+OUTPUT_MODES = ("complex128", "complex64", "probabilities", "sparse")
+# Data types of dense outputs.
+OUTPUT_DTYPES = {
+    "complex128": AMPLITUDE_DTYPE,
+    "complex64": np.dtype(np.complex64),
+    "probabilities": np.dtype(np.float32),
+}
+# Amplitudes with magnitude at most this are omitted from sparse output by default.
+DEFAULT_SPARSE_THRESHOLD = 1e-8
+
+
+@dataclass
+class SparseAmplitudes:
+    """Amplitudes of a state vector with magnitude above a threshold.
+
+    Attributes:
+        n_qubits: number of qubits of the state vector.
+        indices: sorted indices of the amplitudes.
+        values: the amplitudes.
+    """
+
+    n_qubits: int
+    indices: np.ndarray
+    values: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        return self.indices.nbytes + self.values.nbytes
+
+    def to_dense(self) -> np.ndarray:
+        amplitudes = np.zeros(2**self.n_qubits, dtype=self.values.dtype)
+        amplitudes[self.indices] = self.values
+        return amplitudes
+
+    def reverse_qubit_order(self) -> "SparseAmplitudes":
+        """Return the same amplitudes with qubit order reversed."""
+        indices = reverse_bits(self.indices, self.n_qubits).astype(np.int64)
+        order = np.argsort(indices)
+        return SparseAmplitudes(self.n_qubits, indices[order], self.values[order])
+
+
+def _convert_block(block, mode):
+    if mode == "probabilities":
+        return block.real**2 + block.imag**2
+    return block
+
+
+def convert_output(
+    amplitudes: np.ndarray,
+    mode: str,
+    threshold: float = DEFAULT_SPARSE_THRESHOLD,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+):
+    """Convert state vector into a more compact output, one block at a time.
+
+    Only a single block of complex128 amplitudes is held in memory at any time, so
+    for memory-mapped interpreter output the peak memory is the size of the
+    converted output.
+
+    Args:
+        amplitudes: state vector, e.g. memory map of binary interpreter output.
+        mode: one of `OUTPUT_MODES`: "complex64" amplitudes, "probabilities" as
+            float32 values, or "sparse" `SparseAmplitudes` holding complex128
+            amplitudes with magnitude above `threshold`. "complex128" makes a plain
+            copy.
+        threshold: magnitude threshold of sparse output.
+        block_size: number of amplitudes converted at once.
+
+    Returns:
+        Converted output, in the qubit order of `amplitudes`.
+    """
+    if mode not in OUTPUT_MODES:
+        raise ValueError(
+            f"Unknown output mode: {mode}. Supported modes are: {OUTPUT_MODES}."
+        )
+    n_amplitudes = len(amplitudes)
+    if mode == "sparse":
+        indices, values = [], []
+        for start in range(0, n_amplitudes, block_size):
+            block = np.asarray(amplitudes[start : start + block_size])
+            (block_indices,) = np.nonzero(
+                _convert_block(block, "probabilities") > threshold**2
+            )
+            indices.append(block_indices + start)
+            values.append(block[block_indices])
+        return SparseAmplitudes(
+            n_amplitudes.bit_length() - 1,
+            np.concatenate(indices).astype(np.int64),
+            np.concatenate(values).astype(AMPLITUDE_DTYPE),
+        )
+
+    output = np.empty(n_amplitudes, dtype=OUTPUT_DTYPES[mode])
+    for start in range(0, n_amplitudes, block_size):
+        block = np.asarray(amplitudes[start : start + block_size])
+        output[start : start + len(block)] = _convert_block(block, mode)
+    return output
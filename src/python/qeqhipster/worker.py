@@ -0,0 +1,285 @@
+"""Long-lived worker process for running qHiPSTER interpreter invocations.
+
+Starting the native interpreter is expensive: every invocation pays fork/exec, the
+dynamic loading of the whole PSXE/MKL runtime and thread-pool startup. The worker
+keeps a single process alive across many simulations and talks to it through a
+line-based protocol over its stdin/stdout:
+
+- every request is a single line containing a JSON object,
+- every response is a single line containing a JSON object.
+
+Supported requests:
+
+- ``{"command": "ping"}`` - health check, answered with
+  ``{"status": "ok", "protocol": PROTOCOL_VERSION}``.
+- ``{"command": "run", "argv": [...]}`` - run interpreter invocation described by
+  ``argv`` (exactly the argument vector one would pass to ``subprocess.run``).
+  Answered with ``{"status": "ok"}`` or
+  ``{"status": "error", "returncode": ..., "message": ...}``. Successful responses
+  may also report resource usage of the invocation as
+  ``"usage": {"max_rss": ..., "user_time": ..., "system_time": ...}``, with peak
+  RSS in bytes and CPU times in seconds.
+- ``{"command": "shutdown"}`` - stop the worker. No response is sent.
+
+Any executable speaking this protocol can be used as a worker, in particular a native
+build of the interpreter that keeps the runtime loaded between requests. Only such a
+native worker saves the interpreter's startup. The reference implementation in this
+module (``python -m qeqhipster.worker``) still starts a new interpreter process for
+every request, so it amortizes nothing but its own Python startup; it serves as a
+specification of the protocol and as a fallback.
+"""
+import json
+import os
+import select
+import signal
+import subprocess
+import sys
+import threading
+import weakref
+from dataclasses import asdict
+from typing import IO, Dict, List, Optional, Sequence
+
+from .instrumentation import run_process
+
+PROTOCOL_VERSION = 1
+
+DEFAULT_WORKER_COMMAND = [sys.executable, "-m", "qeqhipster.worker"]
+
+
+class WorkerError(RuntimeError):
+    """Raised when the worker process misbehaves or cannot be (re)started."""
+
+
+class WorkerTimeout(WorkerError):
+    """Raised when the worker doesn't answer a request in time."""
+
+
+def worker_env(env: Optional[Dict[str, str]]) -> Optional[Dict[str, str]]:
+    """Environment of a worker started with `env`, which is merged into the
+    environment of this process, so that e.g. PYTHONPATH of a virtualenv is kept.
+    Directories of PATH of this process are searched after those of `env`."""
+    if env is None:
+        return None
+    merged = {**os.environ, **env}
+    if "PATH" in env and "PATH" in os.environ:
+        merged["PATH"] = f"{env['PATH']}{os.pathsep}{os.environ['PATH']}"
+    return merged
+
+
+def _shutdown_process(process: subprocess.Popen, timeout: float) -> None:
+    if process.poll() is not None:
+        return
+    try:
+        assert process.stdin is not None
+        process.stdin.write(json.dumps({"command": "shutdown"}) + "\n")
+        process.stdin.flush()
+        process.stdin.close()
+        process.wait(timeout=timeout)
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        process.kill()
+        process.wait()
+
+
+class QHipsterWorker:
+    """Client side of the worker protocol.
+
+    The worker process is started lazily on first use. If it dies (or stops
+    responding in a sensible way) it is restarted transparently, at most
+    `max_restarts` times in a row.
+
+    Args:
+        command: command starting the worker process.
+        env: variables set in the environment of the worker process on top of the
+            environment of this process, see `worker_env`. Interpreter invocations
+            inherit them.
+        startup_timeout: number of seconds to wait for the worker to answer the
+            initial health check.
+        max_restarts: maximum number of consecutive restarts before giving up.
+        run_timeout: number of seconds to wait for the result of an invocation. If
+            it expires, the worker and its children are killed, `WorkerTimeout` is
+            raised and a new worker is started for the next invocation. None waits
+            indefinitely.
+    """
+
+    def __init__(
+        self,
+        command: Optional[Sequence[str]] = None,
+        env: Optional[Dict[str, str]] = None,
+        startup_timeout: float = 30.0,
+        max_restarts: int = 3,
+        run_timeout: Optional[float] = None,
+    ):
+        self.command = list(command or DEFAULT_WORKER_COMMAND)
+        self.env = env
+        self.startup_timeout = startup_timeout
+        self.max_restarts = max_restarts
+        self.run_timeout = run_timeout
+        self.number_of_restarts = 0
+        self._process: Optional[subprocess.Popen] = None
+        self._finalizer: Optional[weakref.finalize] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if not self.is_alive():
+                self._start()
+
+    def _start(self) -> None:
+        self._process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=worker_env(self.env),
+            text=True,
+            bufsize=1,
+            # Own process group, so that a hung invocation can be killed with it.
+            start_new_session=True,
+        )
+        self._finalizer = weakref.finalize(
+            self, _shutdown_process, self._process, self.startup_timeout
+        )
+        if not self._ping(self.startup_timeout):
+            self._stop()
+            raise WorkerError(
+                f"Worker started with {self.command} did not pass the health check."
+            )
+
+    def _kill(self) -> None:
+        assert self._process is not None
+        try:
+            os.killpg(self._process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self._process.wait()
+        self._stop()
+
+    def _stop(self) -> None:
+        if self._finalizer is not None:
+            self._finalizer()
+        self._process = None
+        self._finalizer = None
+
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def ping(self, timeout: float = 5.0) -> bool:
+        """Check that the worker is alive and responding."""
+        with self._lock:
+            return self.is_alive() and self._ping(timeout)
+
+    def _ping(self, timeout: float) -> bool:
+        try:
+            self._send({"command": "ping"})
+            response = self._receive(timeout)
+        except WorkerError:
+            return False
+        return (
+            response.get("status") == "ok"
+            and response.get("protocol") == PROTOCOL_VERSION
+        )
+
+    def run(self, argv: Sequence[str]) -> Optional[dict]:
+        """Run a single interpreter invocation in the worker.
+
+        Mirrors `subprocess.run(argv, check=True)`: `subprocess.CalledProcessError`
+        is raised if the invocation fails. Invocations interrupted by a worker crash
+        are retried after restarting the worker, invocations exceeding
+        `run_timeout` are not.
+
+        Returns:
+            Resource usage of the invocation reported by the worker, if any.
+        """
+        request = {"command": "run", "argv": list(argv)}
+        with self._lock:
+            while True:
+                try:
+                    if not self.is_alive():
+                        self._start()
+                    self._send(request)
+                    response = self._receive(self.run_timeout)
+                    break
+                except WorkerTimeout:
+                    self._kill()
+                    raise
+                except WorkerError:
+                    self._stop()
+                    if self.number_of_restarts >= self.max_restarts:
+                        raise
+                    self.number_of_restarts += 1
+            self.number_of_restarts = 0
+
+        if response.get("status") != "ok":
+            raise subprocess.CalledProcessError(
+                response.get("returncode", -1),
+                list(argv),
+                stderr=response.get("message"),
+            )
+        return response.get("usage")
+
+    def close(self) -> None:
+        """Shut down the worker process, if it is running."""
+        with self._lock:
+            self._stop()
+
+    def _send(self, message: dict) -> None:
+        assert self._process is not None and self._process.stdin is not None
+        try:
+            self._process.stdin.write(json.dumps(message) + "\n")
+            self._process.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise WorkerError("Unable to send request to the worker.") from e
+
+    def _receive(self, timeout: Optional[float] = None) -> dict:
+        assert self._process is not None and self._process.stdout is not None
+        stdout = self._process.stdout
+        if timeout is not None:
+            ready, _, _ = select.select([stdout], [], [], timeout)
+            if not ready:
+                raise WorkerTimeout(f"Worker did not respond within {timeout}s.")
+        line = stdout.readline()
+        if not line:
+            raise WorkerError("Worker terminated unexpectedly.")
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError as e:
+            raise WorkerError(f"Malformed response from the worker: {line!r}") from e
+
+
+def _handle_run(argv: List[str]) -> dict:
+    try:
+        usage = run_process(argv)
+    except OSError as e:
+        return {"status": "error", "returncode": -1, "message": str(e)}
+    except subprocess.CalledProcessError as e:
+        return {
+            "status": "error",
+            "returncode": e.returncode,
+            "message": f"{argv[0]} exited with code {e.returncode}.",
+        }
+    return {"status": "ok", "usage": asdict(usage)}
+
+
+def serve(stdin: IO[str], stdout: IO[str]) -> None:
+    """Serve worker protocol requests read from `stdin` until shutdown or EOF."""
+    for line in stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        command = request.get("command")
+        if command == "shutdown":
+            break
+        elif command == "ping":
+            response = {"status": "ok", "protocol": PROTOCOL_VERSION}
+        elif command == "run":
+            response = _handle_run(request["argv"])
+        else:
+            response = {"status": "error", "message": f"Unknown command: {command}"}
+        stdout.write(json.dumps(response) + "\n")
+        stdout.flush()
+
+
+if __name__ == "__main__":
+    # Interpreters write progress to stdout, which is reserved for the protocol.
+    protocol_out = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    serve(sys.stdin, protocol_out)
@@ -0,0 +1,226 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+import pytest
+from qeqhipster import async_simulator as async_simulator_module
+from qeqhipster import simulator as simulator_module
+from qeqhipster import threads as threads_module
+from qeqhipster.async_simulator import AsyncQHipsterSimulator
+from zquantum.core.circuits import Circuit, I, X
+from zquantum.core.openfermion import QubitOperator
+
+
+@pytest.fixture(autouse=True)
+def interpreter_only(monkeypatch):
+    monkeypatch.setattr(simulator_module, "IN_PROCESS_MAX_QUBITS", None)
+
+
+@pytest.fixture
+def slow_interpreter(tmp_path, monkeypatch):
+    """Interpreter that logs its start and end and never produces any output."""
+    log_path = tmp_path / "log.txt"
+    script_path = tmp_path / "interpreter.sh"
+    script_path.write_text(
+        f"#!/bin/sh\necho start >> {log_path}\nsleep 0.2\necho end >> {log_path}\n"
+    )
+    script_path.chmod(0o755)
+    monkeypatch.setattr(simulator_module, "WAVEFUNCTION_INTERPRETER", str(script_path))
+    return script_path, log_path
+
+
+class TestAsyncQHipster:
+    def test_wavefunction_matches_synchronous_simulator(self):
+        circuit = Circuit([X(0), I(1)])
+
+        async def _simulate():
+            async with AsyncQHipsterSimulator() as simulator:
+                return await simulator.get_wavefunction(circuit)
+
+        wavefunction = asyncio.run(_simulate())
+
+        np.testing.assert_array_almost_equal(
+            wavefunction.amplitudes,
+            simulator_module.QHipsterSimulator().get_wavefunction(circuit).amplitudes,
+        )
+
+    def test_concurrent_simulations_return_their_own_results(self):
+        circuits = [Circuit([X(0), I(1)]), Circuit([I(0), X(1)])]
+        operator = QubitOperator("Z0") + QubitOperator("Z1")
+
+        async def _simulate():
+            simulator = AsyncQHipsterSimulator(max_processes=2)
+            return await asyncio.gather(
+                *[
+                    simulator.get_exact_expectation_values(circuit, operator)
+                    for circuit in circuits
+                ],
+                simulator.run_circuit_and_measure(circuits[0], 10),
+            )
+
+        first, second, measurements = asyncio.run(_simulate())
+
+        np.testing.assert_array_almost_equal(first.values, [-1, 1])
+        np.testing.assert_array_almost_equal(second.values, [1, -1])
+        assert set(measurements.bitstrings) == {(1, 0)}
+
+    def test_many_operators_are_evaluated_from_single_simulation(self):
+        circuit = Circuit([X(0), I(1)])
+
+        async def _simulate():
+            async with AsyncQHipsterSimulator() as simulator:
+                return await simulator.get_exact_expectation_values_of_operators(
+                    circuit, {"z0": QubitOperator("Z0"), "z1": QubitOperator("Z1")}
+                )
+
+        values = asyncio.run(_simulate())
+
+        np.testing.assert_array_almost_equal(values["z0"].values, [-1])
+        np.testing.assert_array_almost_equal(values["z1"].values, [1])
+
+    def test_small_circuits_are_simulated_without_interpreter(self, slow_interpreter):
+        _, log_path = slow_interpreter
+
+        async def _simulate():
+            async with AsyncQHipsterSimulator(
+                wavefunction_format="json", in_process_max_qubits=2
+            ) as simulator:
+                return await simulator.get_wavefunction(Circuit([X(0), I(1)]))
+
+        wavefunction = asyncio.run(_simulate())
+
+        np.testing.assert_array_almost_equal(wavefunction.amplitudes, [0, 0, 1, 0])
+        assert not log_path.exists()
+
+    def test_number_of_concurrent_processes_is_bounded(self, slow_interpreter):
+        script_path, log_path = slow_interpreter
+        simulator = AsyncQHipsterSimulator(max_processes=2, max_cores=8)
+
+        async def _run():
+            await asyncio.gather(
+                *[simulator._run_interpreter([str(script_path)], 1) for _ in range(4)]
+            )
+
+        asyncio.run(_run())
+
+        running, max_running = 0, 0
+        for line in log_path.read_text().split():
+            running += 1 if line == "start" else -1
+            max_running = max(max_running, running)
+        assert max_running == 2
+
+    def test_concurrent_threads_do_not_exceed_core_budget(self, slow_interpreter):
+        script_path, log_path = slow_interpreter
+        simulator = AsyncQHipsterSimulator(max_processes=4, max_cores=4)
+
+        async def _run():
+            await asyncio.gather(
+                *[simulator._run_interpreter([str(script_path)], 3) for _ in range(2)]
+            )
+
+        asyncio.run(_run())
+
+        assert log_path.read_text().split() == ["start", "end", "start", "end"]
+
+    def test_cancellation_kills_interpreter_and_removes_scratch_files(
+        self, slow_interpreter, tmp_path
+    ):
+        script_path, log_path = slow_interpreter
+        script_path.write_text("#!/bin/sh\nexec sleep 30\n")
+        scratch_dir = tmp_path / "scratch"
+        scratch_dir.mkdir()
+        simulator = AsyncQHipsterSimulator(
+            wavefunction_format="json", scratch="shm", scratch_dir=str(scratch_dir)
+        )
+
+        async def _cancel():
+            task = asyncio.ensure_future(simulator.get_wavefunction(Circuit([X(0)])))
+            await asyncio.sleep(0.5)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        start = time.perf_counter()
+        asyncio.run(_cancel())
+
+        assert time.perf_counter() - start < 10
+        (shared_dir,) = scratch_dir.iterdir()
+        assert os.listdir(shared_dir) == []
+        simulator.close()
+
+    def test_simulation_steps_do_not_block_event_loop(self, slow_interpreter):
+        script_path, _ = slow_interpreter
+        simulator = AsyncQHipsterSimulator()
+
+        def _steps():
+            time.sleep(0.3)
+            yield [str(script_path)]
+            time.sleep(0.3)
+            return "result"
+
+        async def _run():
+            ticks = []
+
+            async def _tick():
+                while True:
+                    ticks.append(time.perf_counter())
+                    await asyncio.sleep(0.01)
+
+            ticker = asyncio.ensure_future(_tick())
+            result = await simulator._run_steps(_steps(), 1)
+            ticker.cancel()
+            return result, ticks
+
+        result, ticks = asyncio.run(_run())
+
+        assert result == "result"
+        assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.2
+
+    def test_simulator_can_be_used_in_many_event_loops(self, slow_interpreter):
+        script_path, log_path = slow_interpreter
+        simulator = AsyncQHipsterSimulator(max_processes=1, max_cores=2)
+
+        async def _run():
+            await asyncio.gather(
+                *[simulator._run_interpreter([str(script_path)], 1) for _ in range(2)]
+            )
+
+        asyncio.run(_run())
+        asyncio.run(_run())
+
+        assert log_path.read_text().split() == ["start", "end"] * 4
+
+    def test_concurrent_jobs_are_bound_to_disjoint_cores(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(
+            threads_module, "_default_allocator", threads_module.CoreAllocator(range(4))
+        )
+        affinities = []
+        monkeypatch.setattr(
+            async_simulator_module,
+            "set_affinity",
+            lambda pid, cores: affinities.append(cores),
+        )
+        log_path = tmp_path / "env.txt"
+        script_path = tmp_path / "interpreter.sh"
+        script_path.write_text(
+            "#!/bin/sh\n"
+            f'echo "$OMP_NUM_THREADS;$OMP_PLACES;$KMP_AFFINITY" >> {log_path}\n'
+            "sleep 0.2\n"
+        )
+        script_path.chmod(0o755)
+        simulator = AsyncQHipsterSimulator(max_cores=4, bind_cores=True)
+
+        async def _run():
+            await asyncio.gather(
+                *[simulator._run_interpreter([str(script_path)], 2) for _ in range(2)]
+            )
+
+        asyncio.run(_run())
+        simulator.close()
+
+        first, second = [line.split(";") for line in log_path.read_text().split()]
+        assert first[0] == second[0] == "2"
+        assert set(first[1].split(",")).isdisjoint(second[1].split(","))
+        assert first[2] != second[2]
+        assert set(affinities[0]).isdisjoint(affinities[1])
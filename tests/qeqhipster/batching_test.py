@@ -0,0 +1,177 @@
+import asyncio
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from qeqhipster.batching import (
+    AsyncCoreBudget,
+    CoreBudget,
+    run_batch,
+    threads_for_circuit,
+)
+from qeqhipster.memory import MemoryBudget, MemoryBudgetExceeded
+
+
+class TestThreadsForCircuit:
+    @pytest.mark.parametrize("n_qubits", [1, 8, 16])
+    def test_small_circuits_are_simulated_with_single_thread(self, n_qubits):
+        assert threads_for_circuit(n_qubits, n_cores=32) == 1
+
+    def test_number_of_threads_grows_with_number_of_qubits(self):
+        threads = [threads_for_circuit(n, n_cores=1024) for n in range(16, 30)]
+
+        assert threads == sorted(threads)
+        assert threads[-1] > threads[0]
+
+    @pytest.mark.parametrize("n_cores", [1, 3, 8])
+    def test_number_of_threads_does_not_exceed_number_of_cores(self, n_cores):
+        assert threads_for_circuit(34, n_cores) == n_cores
+
+
+class TestCoreBudget:
+    def test_reservations_exceeding_budget_wait_for_release(self):
+        budget = CoreBudget(4)
+        acquired = threading.Event()
+
+        def _reserve():
+            with budget.reserve(2):
+                acquired.set()
+
+        with budget.reserve(3):
+            thread = threading.Thread(target=_reserve)
+            thread.start()
+            assert not acquired.wait(0.1)
+        thread.join(timeout=5)
+
+        assert acquired.is_set()
+
+    def test_reservation_larger_than_budget_is_clipped(self):
+        budget = CoreBudget(2)
+
+        with budget.reserve(8):
+            pass
+
+    def test_concurrent_reservations_get_disjoint_cores(self):
+        budget = CoreBudget([4, 5, 6, 7])
+
+        with budget.reserve(2) as first, budget.reserve(2) as second:
+            assert sorted(first + second) == [4, 5, 6, 7]
+        with budget.reserve(4) as cores:
+            assert cores == [4, 5, 6, 7]
+
+
+class TestAsyncCoreBudget:
+    def test_reservations_exceeding_budget_wait_for_release(self):
+        events = []
+
+        async def _reserve(budget, name, n_cores):
+            async with budget.reserve(n_cores):
+                events.append(f"{name} start")
+                await asyncio.sleep(0.01)
+                events.append(f"{name} end")
+
+        async def _run():
+            budget = AsyncCoreBudget(4)
+            await asyncio.gather(
+                _reserve(budget, "a", 3),
+                _reserve(budget, "b", 2),
+                _reserve(budget, "c", 1),
+            )
+
+        asyncio.run(_run())
+
+        assert events == ["a start", "c start", "a end", "c end", "b start", "b end"]
+
+    def test_asyncio_is_not_imported_by_synchronous_scheduling(self):
+        code = (
+            "import sys, qeqhipster.batching, qeqhipster.memory\n"
+            "assert 'asyncio' not in sys.modules"
+        )
+
+        subprocess.run([sys.executable, "-c", code], check=True)
+
+
+class TestRunBatch:
+    def test_results_are_returned_in_input_order(self):
+        n_qubits = [2, 24, 10, 30, 2]
+        jobs = [lambda nthreads, i=i: (i, nthreads) for i in range(len(n_qubits))]
+
+        results, report = run_batch(jobs, n_qubits, n_cores=8)
+
+        assert [i for i, _ in results] == list(range(len(n_qubits)))
+        assert [nthreads for _, nthreads in results] == report.threads
+
+    def test_concurrently_used_threads_do_not_exceed_core_budget(self):
+        n_cores = 4
+        lock = threading.Lock()
+        in_use = [0]
+        max_in_use = [0]
+
+        def _job(nthreads):
+            with lock:
+                in_use[0] += nthreads
+                max_in_use[0] = max(max_in_use[0], in_use[0])
+            time.sleep(0.01)
+            with lock:
+                in_use[0] -= nthreads
+
+        run_batch([_job] * 16, [2] * 8 + [20] * 8, n_cores=n_cores)
+
+        assert max_in_use[0] <= n_cores
+
+    def test_small_jobs_run_concurrently(self):
+        barrier = threading.Barrier(4, timeout=5)
+
+        run_batch([lambda _: barrier.wait()] * 4, [2] * 4, n_cores=4)
+
+    def test_report_contains_timing_of_each_job(self):
+        _, report = run_batch([lambda _: time.sleep(0.01)] * 3, [2] * 3, n_cores=2)
+
+        assert report.n_jobs == 3
+        assert all(job_time >= 0.01 for job_time in report.job_times)
+        assert report.wall_time >= max(report.job_times)
+        assert report.jobs_per_second > 0
+
+    def test_concurrently_used_memory_does_not_exceed_memory_budget(self):
+        lock = threading.Lock()
+        in_use = [0]
+        max_in_use = [0]
+
+        def _job(n_bytes):
+            def _run(nthreads):
+                with lock:
+                    in_use[0] += n_bytes
+                    max_in_use[0] = max(max_in_use[0], in_use[0])
+                time.sleep(0.01)
+                with lock:
+                    in_use[0] -= n_bytes
+
+            return _run
+
+        n_qubits = [10, 9, 8, 7] * 4
+        _, report = run_batch(
+            [_job(2**n) for n in n_qubits],
+            n_qubits,
+            n_cores=8,
+            memory_for=lambda n: 2**n,
+            memory_budget=MemoryBudget(2**11),
+        )
+
+        assert report.memory == [2**n for n in n_qubits]
+        assert max_in_use[0] <= 2**11
+
+    def test_batch_with_job_exceeding_memory_budget_is_rejected(self):
+        started = []
+
+        with pytest.raises(MemoryBudgetExceeded):
+            run_batch(
+                [started.append] * 2,
+                [4, 12],
+                n_cores=2,
+                memory_for=lambda n: 2**n,
+                memory_budget=MemoryBudget(2**10),
+            )
+
+        assert started == []
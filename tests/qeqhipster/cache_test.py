@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from qeqhipster.cache import ResultCache, make_cache_key
+
+
+class TestMakeCacheKey:
+    def test_keys_of_equal_parts_are_equal(self):
+        assert make_cache_key("wavefunction", "X 0") == make_cache_key(
+            "wavefunction", "X 0"
+        )
+
+    @pytest.mark.parametrize(
+        "parts, other_parts",
+        [(("a", "X 0"), ("a", "X 1")), (("ab", "c"), ("a", "bc"))],
+    )
+    def test_keys_of_different_parts_differ(self, parts, other_parts):
+        assert make_cache_key(*parts) != make_cache_key(*other_parts)
+
+
+class TestResultCache:
+    def test_stored_value_is_returned(self):
+        cache = ResultCache()
+
+        cache.put("key", np.arange(4))
+
+        np.testing.assert_array_equal(cache.get("key"), np.arange(4))
+
+    def test_hits_and_misses_are_counted(self):
+        cache = ResultCache()
+        cache.put("key", np.arange(4))
+
+        cache.get("key")
+        cache.get("key")
+        cache.get("other-key")
+
+        assert (cache.hits, cache.misses) == (2, 1)
+
+    def test_modifying_returned_value_does_not_modify_cache(self):
+        cache = ResultCache()
+        cache.put("key", np.zeros(2))
+
+        cache.get("key")[0] = 1
+
+        np.testing.assert_array_equal(cache.get("key"), np.zeros(2))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ResultCache(max_entries=2)
+        cache.put("a", np.zeros(1))
+        cache.put("b", np.zeros(1))
+        cache.get("a")
+
+        cache.put("c", np.zeros(1))
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+
+    def test_entries_are_evicted_to_fit_byte_budget(self):
+        cache = ResultCache(max_bytes=3 * 8)
+        cache.put("a", np.zeros(2))
+
+        cache.put("b", np.zeros(2))
+
+        assert cache.get("a") is None
+        assert cache.total_bytes == 2 * 8
+
+    def test_evicted_entries_are_loaded_from_spill_directory(self, tmp_path):
+        cache = ResultCache(max_entries=1, spill_dir=str(tmp_path / "spill"))
+        cache.put("a", np.arange(3))
+        cache.put("b", np.arange(4))
+
+        np.testing.assert_array_equal(cache.get("a"), np.arange(3))
+        assert cache.hits == 1
+        assert len(cache) == 1
@@ -0,0 +1,123 @@
+"""Stand-ins for `mpirun` and the MPI interpreters, writing outputs of each rank in
+the format described in `qeqhipster.mpi`.
+
+Usage:
+    fake_mpi.py mpirun -n NRANKS [-ppn NRANKS_PER_NODE] PROGRAM [ARGS...]
+    fake_mpi.py wavefunction CIRCUIT NTHREADS OUTPUT
+    fake_mpi.py expectation_values CIRCUIT NTHREADS OPERATOR OUTPUT
+
+`mpirun` starts NRANKS copies of PROGRAM, passing rank and number of ranks in
+PMI_RANK and PMI_SIZE like Intel MPI does. Interpreters simulate the whole circuit
+in every rank with `qeqhipster.statevector` and write only the part of the result
+belonging to the rank into OUTPUT.<rank>.
+"""
+import json
+import os
+import stat
+import subprocess
+import sys
+
+import numpy as np
+import qeqhipster
+from qeqhipster.statevector import simulate_qasm
+from qeqhipster.wavefunction import save_binary_wavefunction
+
+
+def _rank():
+    return int(os.environ["PMI_RANK"]), int(os.environ["PMI_SIZE"])
+
+
+def _simulate(circuit_path):
+    with open(circuit_path) as f:
+        return simulate_qasm(f.read(), native_qubit_order=True)
+
+
+def _apply_pauli_string(pauli_string, state):
+    """Apply product of Pauli operators like "X0 Y3" to state in native order."""
+    indices = np.arange(len(state))
+    x_mask, phases = 0, np.ones(len(state), dtype=complex)
+    for factor in pauli_string.split():
+        action, qubit = factor[0], int(factor[1:])
+        signs = 1 - 2 * ((indices >> qubit) & 1)
+        if action in "XY":
+            x_mask |= 1 << qubit
+        if action == "Y":
+            phases *= -1j * signs
+        elif action == "Z":
+            phases *= signs
+    return phases * state[indices ^ x_mask]
+
+
+def _write_wavefunction_shard(circuit_path, output_path):
+    rank, size = _rank()
+    shard = np.split(_simulate(circuit_path), size)[rank]
+    save_binary_wavefunction(shard, f"{output_path}.{rank}")
+
+
+def _write_expectation_value_contributions(circuit_path, operator_path, output_path):
+    rank, size = _rank()
+    state = _simulate(circuit_path)
+    part = np.split(np.arange(len(state)), size)[rank]
+    with open(operator_path) as f:
+        pauli_strings = f.read().splitlines()
+    contributions = [
+        float(np.real(np.vdot(state[part], _apply_pauli_string(line, state)[part])))
+        for line in pauli_strings
+    ]
+    with open(f"{output_path}.{rank}", "w") as f:
+        json.dump(
+            {
+                "schema": "zapata-v1-expectation_values",
+                "expectation_values": {"real": contributions},
+            },
+            f,
+        )
+
+
+def _mpirun(argv):
+    n_ranks = None
+    while argv[0].startswith("-"):
+        option, value, *argv = argv
+        if option == "-n":
+            n_ranks = int(value)
+    processes = [
+        subprocess.Popen(
+            argv, env={**os.environ, "PMI_RANK": str(rank), "PMI_SIZE": str(n_ranks)}
+        )
+        for rank in range(n_ranks)
+    ]
+    return max(process.wait() for process in processes)
+
+
+def make_executable(path, mode):
+    """Write shell script running the stand-in in given mode and return its path.
+
+    Interpreters are started with the environment of the simulator, hence the
+    script itself points Python to the package.
+    """
+    script = os.path.abspath(__file__)
+    package_path = os.path.dirname(os.path.dirname(qeqhipster.__file__))
+    with open(path, "w") as f:
+        f.write(
+            "#!/bin/sh\n"
+            f'PYTHONPATH={package_path} exec {sys.executable} {script} {mode} "$@"\n'
+        )
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    return path
+
+
+def main(argv):
+    mode, *rest = argv
+    if mode == "mpirun":
+        sys.exit(_mpirun(rest))
+    circuit_path, _nthreads, *rest = rest
+    if mode == "wavefunction":
+        _write_wavefunction_shard(circuit_path, *rest)
+    elif mode == "expectation_values":
+        _write_expectation_value_contributions(circuit_path, *rest)
+    else:
+        raise ValueError(f"Unknown mode: {mode}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
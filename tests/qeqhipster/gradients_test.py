@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+import sympy
+from qeqhipster.gradients import ParameterShiftGradient
+from zquantum.core import circuits
+
+ALPHA, BETA = sympy.symbols("alpha beta")
+
+# Observable Z0 + 0.5 X1 of two qubits, qubit 0 being the most significant bit.
+OBSERVABLE = np.kron(np.diag([1, -1]), np.eye(2)) + 0.5 * np.kron(
+    np.eye(2), np.array([[0, 1], [1, 0]])
+)
+
+
+def _expectation_value(circuit):
+    state = circuit.to_unitary()[:, 0]
+    return np.real(np.conj(state) @ OBSERVABLE @ state)
+
+
+def _template_expectation_values(gradient, points):
+    return [
+        _expectation_value(
+            gradient.circuit.bind(dict(zip(gradient.template.symbols, point)))
+        )
+        for point in points
+    ]
+
+
+def _finite_differences(circuit, symbols, params, step=1e-6):
+    def _value(point):
+        return _expectation_value(circuit.bind(dict(zip(symbols, point))))
+
+    return np.array(
+        [
+            (_value(params + step * unit) - _value(params - step * unit)) / (2 * step)
+            for unit in np.eye(len(params))
+        ]
+    )
+
+
+@pytest.fixture
+def circuit():
+    return circuits.Circuit(
+        [
+            circuits.RY(ALPHA)(0),
+            circuits.H(1),
+            circuits.XX(2 * BETA - ALPHA)(0, 1),
+            circuits.RZ(BETA**2)(1),
+            circuits.XY(ALPHA)(0, 1),
+            circuits.CPHASE(BETA)(0, 1),
+            circuits.RX(0.3)(1),
+        ]
+    )
+
+
+class TestParameterShiftGradient:
+    @pytest.mark.parametrize("params", [[0.1, 0.2], [np.pi / 3, -1.5], [0.0, 0.0]])
+    def test_gradient_matches_finite_differences(self, circuit, params):
+        gradient = ParameterShiftGradient(circuit, [ALPHA, BETA])
+        shifted = gradient.shifted_points(params)
+
+        values = _template_expectation_values(gradient, shifted.points)
+
+        np.testing.assert_allclose(
+            shifted.gradient(values),
+            _finite_differences(circuit, [ALPHA, BETA], np.array(params)),
+            atol=1e-6,
+        )
+
+    def test_gate_parameters_with_vanishing_derivative_are_not_shifted(self):
+        circuit = circuits.Circuit([circuits.RX(ALPHA**2)(0), circuits.RY(BETA)(1)])
+        gradient = ParameterShiftGradient(circuit, [ALPHA, BETA])
+
+        shifted = gradient.shifted_points([0.0, 0.5])
+
+        assert list(shifted.active) == [1]
+        assert len(shifted.points) == 2
+
+    def test_consecutive_rotations_are_shifted_once(self):
+        circuit = circuits.Circuit(
+            [circuits.RX(ALPHA)(0), circuits.RX(2 * ALPHA)(0), circuits.RZ(ALPHA)(0)]
+        )
+        gradient = ParameterShiftGradient(circuit)
+
+        shifted = gradient.shifted_points([0.25])
+
+        assert gradient.n_gate_params == 3
+        assert len(shifted.points) == 4
+        np.testing.assert_allclose(shifted.jacobian, [[3], [1]])
+
+    def test_circuit_without_symbols_has_empty_gradient_and_no_shifts(self):
+        gradient = ParameterShiftGradient(circuits.Circuit([circuits.X(0)]))
+
+        shifted = gradient.shifted_points([])
+
+        assert len(shifted.points) == 0
+        assert shifted.gradient([]).shape == (0,)
+
+    def test_gates_without_two_term_shift_rule_are_rejected(self):
+        circuit = circuits.Circuit([circuits.RX(ALPHA).controlled(1)(0, 1)])
+
+        with pytest.raises(ValueError):
+            ParameterShiftGradient(circuit)
+
+    def test_wrong_number_of_parameters_raises_error(self, circuit):
+        gradient = ParameterShiftGradient(circuit)
+
+        with pytest.raises(ValueError):
+            gradient.shifted_points([0.1])
@@ -0,0 +1,169 @@
+import subprocess
+import sys
+import time
+
+import pytest
+from qeqhipster.instrumentation import (
+    DISABLED_CALL,
+    CallRecord,
+    ExecutableNotFound,
+    ProcessUsage,
+    SimulationStats,
+    check_executable,
+    find_executable,
+    make_tracing_hook,
+    run_process,
+)
+
+
+class TestRunProcess:
+    def test_resource_usage_of_process_is_returned(self):
+        started = []
+
+        usage = run_process([sys.executable, "-c", "pass"], on_start=started.append)
+
+        assert len(started) == 1
+        assert usage.max_rss > 0
+        assert usage.user_time >= 0
+
+    def test_failed_process_raises_called_process_error(self):
+        with pytest.raises(subprocess.CalledProcessError) as error:
+            run_process([sys.executable, "-c", "raise SystemExit(3)"])
+
+        assert error.value.returncode == 3
+
+
+class TestCheckExecutable:
+    def test_installed_program_passes_check(self):
+        check_executable([sys.executable, "-c", "pass"])
+
+    def test_program_is_searched_in_path_of_given_environment(self, tmp_path):
+        program = tmp_path / "interpreter.out"
+        program.write_text("#!/bin/sh\n")
+        program.chmod(0o755)
+
+        check_executable(["interpreter.out"], {"PATH": str(tmp_path)})
+        with pytest.raises(ExecutableNotFound):
+            check_executable(["interpreter.out"], {"PATH": "/nonexistent"})
+
+    def test_missing_program_raises_error_before_it_is_run(self, tmp_path):
+        with pytest.raises(ExecutableNotFound, match="missing.out"):
+            check_executable([str(tmp_path / "missing.out")])
+
+    def test_filesystem_is_probed_once(self, tmp_path):
+        program = tmp_path / "late.out"
+        assert find_executable(str(program)) is None
+        program.write_text("#!/bin/sh\n")
+        program.chmod(0o755)
+
+        assert find_executable(str(program)) is None
+        find_executable.cache_clear()
+        assert find_executable(str(program)) == str(program)
+
+
+class TestCallRecord:
+    def test_time_spent_in_stage_is_accumulated(self):
+        call = CallRecord("wavefunction")
+
+        for _ in range(2):
+            with call.stage("load"):
+                time.sleep(0.01)
+
+        assert call.stages["load"] >= 0.02
+
+    def test_file_sizes_are_counted(self, tmp_path):
+        path = tmp_path / "circuit.txt"
+        path.write_text("1\nX 0\n")
+        call = CallRecord("wavefunction")
+
+        call.add_file(str(path), written=True)
+
+        assert call.bytes_written == 6
+        assert call.bytes_read == 0
+
+    def test_disabled_record_ignores_everything(self, tmp_path):
+        with DISABLED_CALL.stage("simulation"):
+            DISABLED_CALL.usage = ProcessUsage(1, 0.0, 0.0)
+        DISABLED_CALL.n_files += 1
+        DISABLED_CALL.add_file(str(tmp_path / "missing.txt"), written=True)
+
+        assert DISABLED_CALL.usage is None
+        assert DISABLED_CALL.n_files == 0
+
+
+def _call(kind, cached=False, max_rss=0):
+    call = CallRecord(kind, cached=cached)
+    call.stages = {"qasm": 0.5, "simulation": 2.0, "load": 0.25}
+    call.usage = ProcessUsage(max_rss, 1.0, 0.5) if not cached else None
+    call.bytes_written = 10
+    call.bytes_read = 20
+    call.n_files = 2
+    return call
+
+
+class TestSimulationStats:
+    def test_calls_are_accumulated(self):
+        stats = SimulationStats()
+
+        stats.record(_call("wavefunction", max_rss=100))
+        stats.record(_call("wavefunction", max_rss=300))
+        stats.record(_call("wavefunction", cached=True))
+
+        assert stats.n_calls == 3
+        assert stats.n_cached_calls == 1
+        assert stats.n_files == 6
+        assert stats.io_time == pytest.approx(2.25)
+        assert stats.simulation_time == pytest.approx(6.0)
+        assert stats.bytes_written == 30
+        assert stats.bytes_read == 60
+        assert stats.child_user_time == pytest.approx(2.0)
+        assert stats.child_system_time == pytest.approx(1.0)
+        assert stats.max_child_rss == 300
+
+    def test_hooks_are_called_with_finished_calls(self):
+        stats = SimulationStats()
+        calls = []
+        stats.add_hook(calls.append)
+        call = _call("measure")
+
+        stats.record(call)
+
+        assert calls == [call]
+        assert stats.last_call is call
+        assert call.end_time_ns >= call.start_time_ns
+
+
+class _FakeSpan:
+    def __init__(self, name, start_time, attributes):
+        self.name = name
+        self.start_time = start_time
+        self.attributes = attributes
+        self.end_time = None
+
+    def end(self, end_time=None):
+        self.end_time = end_time
+
+
+class _FakeTracer:
+    def __init__(self):
+        self.spans = []
+
+    def start_span(self, name, start_time=None, attributes=None):
+        span = _FakeSpan(name, start_time, attributes)
+        self.spans.append(span)
+        return span
+
+
+def test_tracing_hook_exports_calls_as_spans():
+    tracer = _FakeTracer()
+    stats = SimulationStats()
+    stats.add_hook(make_tracing_hook(tracer))
+    call = _call("expectation_values", max_rss=100)
+
+    stats.record(call)
+
+    (span,) = tracer.spans
+    assert span.name == "qhipster.expectation_values"
+    assert (span.start_time, span.end_time) == (call.start_time_ns, call.end_time_ns)
+    assert span.attributes["qhipster.stage.simulation"] == 2.0
+    assert span.attributes["qhipster.child.max_rss"] == 100
@@ -0,0 +1,134 @@
+import asyncio
+import threading
+
+import pytest
+from qeqhipster.memory import (
+    AMPLITUDE_BYTES,
+    NATIVE_BASE_BYTES,
+    AsyncMemoryBudget,
+    MemoryBudget,
+    MemoryBudgetExceeded,
+    estimate_memory,
+    memory_limit,
+)
+
+
+class TestEstimateMemory:
+    def test_native_process_holds_state_vector(self):
+        estimate = estimate_memory(20, "wavefunction")
+
+        assert estimate.native == NATIVE_BASE_BYTES + AMPLITUDE_BYTES * 2**20
+
+    def test_expectation_values_need_copy_of_state_and_no_python_memory(self):
+        estimate = estimate_memory(20, "expectation_values")
+
+        assert estimate.native == NATIVE_BASE_BYTES + 2 * AMPLITUDE_BYTES * 2**20
+        assert estimate.python == 0
+
+    def test_json_output_needs_more_memory_than_binary_output(self):
+        binary = estimate_memory(24, "wavefunction", binary=True, reorder=False)
+        json = estimate_memory(24, "wavefunction", binary=False, reorder=True)
+
+        assert json.python > 4 * binary.python
+        assert json.peak > binary.peak
+
+    def test_sampling_from_binary_output_needs_no_copy_of_state(self):
+        assert estimate_memory(24, "measure", binary=True).python == 0
+        assert estimate_memory(24, "measure", binary=True, reorder=True).python > 0
+
+    def test_in_memory_scratch_files_are_added_to_peak(self):
+        on_disk = estimate_memory(24, "wavefunction")
+        in_memory = estimate_memory(24, "wavefunction", in_memory_scratch=True)
+
+        assert in_memory.peak - on_disk.peak == AMPLITUDE_BYTES * 2**24
+
+    def test_peak_grows_with_number_of_qubits(self):
+        peaks = [
+            estimate_memory(n, "measure", binary=False).peak for n in range(20, 30)
+        ]
+
+        assert peaks == sorted(peaks)
+
+    def test_mpi_ranks_need_exchange_buffers_and_base_memory_each(self):
+        single = estimate_memory(24, "wavefunction")
+        distributed = estimate_memory(24, "wavefunction", n_ranks=4)
+
+        assert distributed.native - single.native == (
+            3 * NATIVE_BASE_BYTES + AMPLITUDE_BYTES * 2**24
+        )
+
+    @pytest.mark.parametrize(
+        "output, python", [("complex64", 8), ("probabilities", 4), ("sparse", 0)]
+    )
+    def test_compact_output_needs_less_python_memory(self, output, python):
+        estimate = estimate_memory(20, "wavefunction", output=output)
+
+        assert estimate.python == python * 2**20
+        assert estimate.native == estimate_memory(20, "wavefunction").native
+
+    def test_unknown_output_mode_raises_error(self):
+        with pytest.raises(ValueError):
+            estimate_memory(4, "wavefunction", output="float16")
+
+    def test_unknown_kind_raises_error(self):
+        with pytest.raises(ValueError):
+            estimate_memory(4, "density_matrix")
+
+
+def test_memory_limit_is_positive():
+    assert memory_limit() > 0
+
+
+class TestMemoryBudget:
+    def test_reservations_exceeding_budget_wait_for_release(self):
+        budget = MemoryBudget(100)
+        acquired = threading.Event()
+
+        def _reserve():
+            with budget.reserve(60):
+                acquired.set()
+
+        with budget.reserve(50):
+            thread = threading.Thread(target=_reserve)
+            thread.start()
+            assert not acquired.wait(0.1)
+        thread.join(timeout=5)
+
+        assert acquired.is_set()
+
+    def test_reservation_larger_than_budget_is_rejected(self):
+        budget = MemoryBudget(100)
+
+        with pytest.raises(MemoryBudgetExceeded):
+            with budget.reserve(101):
+                pass
+
+    def test_default_limit_is_fraction_of_available_memory(self):
+        assert 0 < MemoryBudget().limit < memory_limit()
+
+
+class TestAsyncMemoryBudget:
+    def test_reservations_exceeding_budget_wait_for_release(self):
+        events = []
+
+        async def _reserve(budget, name, n_bytes):
+            async with budget.reserve(n_bytes):
+                events.append(f"{name} start")
+                await asyncio.sleep(0.01)
+                events.append(f"{name} end")
+
+        async def _run():
+            budget = AsyncMemoryBudget(100)
+            await asyncio.gather(_reserve(budget, "a", 70), _reserve(budget, "b", 40))
+
+        asyncio.run(_run())
+
+        assert events == ["a start", "a end", "b start", "b end"]
+
+    def test_reservation_larger_than_budget_is_rejected(self):
+        async def _run():
+            async with AsyncMemoryBudget(100).reserve(101):
+                pass
+
+        with pytest.raises(MemoryBudgetExceeded):
+            asyncio.run(_run())
@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+from qeqhipster.mpi import (
+    MPIConfig,
+    ShardedStateVector,
+    load_sharded_wavefunction,
+    reduce_expectation_values,
+)
+from qeqhipster.pauli import PauliTerms, expectation_values
+from qeqhipster.wavefunction import sample_counts, save_binary_wavefunction
+from zquantum.core.measurement import ExpectationValues, save_expectation_values
+
+
+def _random_state(n_qubits, seed=0):
+    rng = np.random.default_rng(seed)
+    amplitudes = rng.normal(size=2**n_qubits) + 1j * rng.normal(size=2**n_qubits)
+    return amplitudes / np.linalg.norm(amplitudes)
+
+
+def _sharded(amplitudes, n_shards):
+    return ShardedStateVector(np.split(amplitudes, n_shards))
+
+
+class TestMPIConfig:
+    def test_interpreter_is_launched_with_mpirun(self):
+        config = MPIConfig(4, ranks_per_node=2, mpirun_args=("-hostfile", "hosts"))
+
+        argv = config.argv(["interpreter.out", "circuit.txt", "1", "wf.bin"])
+
+        assert argv == [
+            "mpirun",
+            "-n",
+            "4",
+            "-ppn",
+            "2",
+            "-hostfile",
+            "hosts",
+            "interpreter.out",
+            "circuit.txt",
+            "1",
+            "wf.bin",
+        ]
+
+    @pytest.mark.parametrize("n_ranks", [0, 3, 6])
+    def test_number_of_ranks_has_to_be_power_of_two(self, n_ranks):
+        with pytest.raises(ValueError):
+            MPIConfig(n_ranks)
+
+    def test_threads_are_split_between_ranks(self):
+        config = MPIConfig(4)
+
+        assert config.threads_per_rank(8) == 2
+        assert config.threads_per_rank(2) == 1
+
+    def test_circuit_smaller_than_number_of_ranks_cannot_be_split(self):
+        config = MPIConfig(8)
+
+        assert config.local_qubits(5) == 2
+        with pytest.raises(ValueError):
+            config.local_qubits(2)
+
+
+class TestShardedStateVector:
+    @pytest.mark.parametrize(
+        "key",
+        [
+            slice(None),
+            slice(3, 5),
+            slice(5, 13),
+            slice(1, 15, 3),
+            np.array([0, 15, 4, 9, 4]),
+            np.arange(8, 12),
+            7,
+            -1,
+        ],
+    )
+    def test_indexing_matches_indexing_stitched_state(self, key):
+        amplitudes = _random_state(4)
+
+        np.testing.assert_array_equal(_sharded(amplitudes, 4)[key], amplitudes[key])
+
+    def test_shards_are_stitched_in_order(self):
+        amplitudes = _random_state(5)
+        sharded = _sharded(amplitudes, 8)
+
+        np.testing.assert_array_equal(sharded.to_array(), amplitudes)
+        np.testing.assert_array_equal(np.asarray(sharded), amplitudes)
+        assert len(sharded) == len(amplitudes)
+
+    @pytest.mark.parametrize("shards", [[], [np.ones(2), np.ones(4)], [np.ones(3)]])
+    def test_invalid_shards_raise_error(self, shards):
+        with pytest.raises(ValueError):
+            ShardedStateVector(shards)
+
+    def test_expectation_values_can_be_computed_without_stitching(self):
+        amplitudes = _random_state(6)
+        terms = PauliTerms(
+            x_masks=np.array([0, 0b100001, 0b110000], dtype=np.uint64),
+            z_masks=np.array([0b000011, 0b100000, 0b010001], dtype=np.uint64),
+            phases=np.array([1, 1j, 1j]),
+            coefficients=np.array([1.0, 0.5, -2.0]),
+        )
+
+        np.testing.assert_allclose(
+            expectation_values(_sharded(amplitudes, 4), terms, chunk_size=8),
+            expectation_values(amplitudes, terms),
+            atol=1e-12,
+        )
+
+    def test_samples_can_be_drawn_without_stitching(self):
+        amplitudes = np.zeros(16, dtype=complex)
+        amplitudes[[2, 13]] = 1 / np.sqrt(2)
+
+        counts = sample_counts(_sharded(amplitudes, 4), 100, block_size=4)
+
+        assert set(counts) == {2, 13}
+        assert sum(counts.values()) == 100
+
+
+def test_shards_written_by_ranks_are_memory_mapped(tmp_path):
+    amplitudes = _random_state(4)
+    paths = [str(tmp_path / f"wavefunction.bin.{rank}") for rank in range(2)]
+    for path, shard in zip(paths, np.split(amplitudes, 2)):
+        save_binary_wavefunction(shard, path)
+
+    sharded = load_sharded_wavefunction(paths)
+
+    assert all(isinstance(shard, np.memmap) for shard in sharded.shards)
+    np.testing.assert_array_equal(sharded.to_array(), amplitudes)
+
+
+def test_contributions_of_ranks_are_summed(tmp_path):
+    paths = [str(tmp_path / f"expectation_values.json.{rank}") for rank in range(2)]
+    save_expectation_values(ExpectationValues(np.array([0.25, -1.0])), paths[0])
+    save_expectation_values(ExpectationValues(np.array([0.5, 0.5])), paths[1])
+
+    np.testing.assert_allclose(reduce_expectation_values(paths), [0.75, -0.5])
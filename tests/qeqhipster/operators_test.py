@@ -0,0 +1,212 @@
+import os
+import stat
+import sys
+import time
+
+import numpy as np
+import pytest
+from qeqhipster import operators
+from qeqhipster.operators import OperatorCache, hash_operator
+from qeqhipster.utils import write_pauli_strings
+from zquantum.core.openfermion import QubitOperator
+
+# Stand-in for qubitop_to_paulistrings.o: writes the txt file expected next to the
+# JSON input and logs each invocation.
+STAND_IN_CONVERTER = f"""#!{sys.executable}
+import json
+import sys
+
+json_path = sys.argv[1]
+with open(json_path) as f:
+    expression = json.load(f)["expression"]
+with open(json_path.replace(".json", ".txt"), "w") as f:
+    f.write(expression)
+with open({{log_path!r}}, "a") as f:
+    f.write("invoked\\n")
+"""
+
+
+@pytest.fixture
+def converter_log(tmp_path, monkeypatch):
+    log_path = tmp_path / "invocations.log"
+    converter_path = tmp_path / "converter"
+    converter_path.write_text(STAND_IN_CONVERTER.format(log_path=str(log_path)))
+    converter_path.chmod(converter_path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(operators, "PAULI_STRINGS_CONVERTER", str(converter_path))
+    return log_path
+
+
+def _mark_used(prepared, seconds_ago):
+    used_at = time.time() - seconds_ago
+    os.utime(os.path.dirname(prepared.path), (used_at, used_at))
+
+
+@pytest.fixture
+def written_operators(monkeypatch):
+    written_operators = []
+
+    def _write_pauli_strings(op, filename):
+        written_operators.append(op)
+        write_pauli_strings(op, filename)
+
+    monkeypatch.setattr(operators, "write_pauli_strings", _write_pauli_strings)
+    return written_operators
+
+
+class TestHashOperator:
+    def test_equal_operators_have_equal_hashes(self):
+        assert hash_operator(QubitOperator("X0 Y1", 0.5)) == hash_operator(
+            QubitOperator("X0 Y1", 0.5)
+        )
+
+    @pytest.mark.parametrize(
+        "other_operator",
+        [
+            QubitOperator("X0 Y1", 0.25) + QubitOperator("Z2"),
+            QubitOperator("X0 Z1", 0.5) + QubitOperator("Z2"),
+            QubitOperator("Z2") + QubitOperator("X0 Y1", 0.5),
+        ],
+    )
+    def test_operators_differing_in_terms_or_their_order_have_different_hashes(
+        self, other_operator
+    ):
+        operator = QubitOperator("X0 Y1", 0.5) + QubitOperator("Z2")
+
+        assert hash_operator(operator) != hash_operator(other_operator)
+
+
+class TestOperatorCache:
+    def test_prepared_operator_contains_coefficients_in_term_order(self, tmp_path):
+        operator = QubitOperator("X0", 0.5) + QubitOperator("Z1", -2.0)
+
+        prepared = OperatorCache(str(tmp_path / "cache")).prepare(operator)
+
+        assert os.path.exists(prepared.path)
+        np.testing.assert_array_equal(prepared.coefficients, [0.5, -2.0])
+
+    def test_terms_with_negligible_coefficients_get_zero_expectation_value(
+        self, tmp_path
+    ):
+        operator = (
+            QubitOperator("X0", 0.5)
+            + QubitOperator("Z1", 1e-10)
+            + QubitOperator("Y2", -2.0)
+        )
+
+        prepared = OperatorCache(str(tmp_path / "cache")).prepare(operator)
+
+        np.testing.assert_array_equal(prepared.rescale([0.5, 0.25]), [0.25, 0, -0.5])
+
+    def test_operator_is_prepared_once_per_process(self, tmp_path, written_operators):
+        cache = OperatorCache(str(tmp_path / "cache"))
+
+        first = cache.prepare(QubitOperator("X0 Y1", 0.5))
+        second = cache.prepare(QubitOperator("X0 Y1", 0.5))
+
+        assert first is second
+        assert len(written_operators) == 1
+
+    def test_prepared_operators_are_reused_across_cache_instances(
+        self, tmp_path, written_operators
+    ):
+        cache_dir = str(tmp_path / "cache")
+
+        first = OperatorCache(cache_dir).prepare(QubitOperator("X0 Y1", 0.5))
+        second = OperatorCache(cache_dir).prepare(QubitOperator("X0 Y1", 0.5))
+
+        assert first.path == second.path
+        assert len(written_operators) == 1
+
+    def test_distinct_operators_are_prepared_separately(
+        self, tmp_path, written_operators
+    ):
+        cache = OperatorCache(str(tmp_path / "cache"))
+
+        first = cache.prepare(QubitOperator("X0", 0.5))
+        second = cache.prepare(QubitOperator("Y0", 0.5))
+
+        assert first.path != second.path
+        assert len(written_operators) == 2
+
+    def test_native_converter_can_be_used(self, tmp_path, converter_log):
+        cache = OperatorCache(str(tmp_path / "cache"), use_native_converter=True)
+
+        prepared = cache.prepare(QubitOperator("X0", 0.5))
+
+        assert os.path.exists(prepared.path)
+        assert len(converter_log.read_text().splitlines()) == 1
+
+    def test_operator_set_concatenates_pauli_strings_of_operators(self, tmp_path):
+        cache = OperatorCache(str(tmp_path / "cache"))
+        first = QubitOperator("X0", 0.5) + QubitOperator("Z1", 1e-10)
+        second = QubitOperator("Y0 Z1", 2.0) + QubitOperator("Z0", -1.0)
+
+        prepared = cache.prepare_many([first, second])
+
+        with open(prepared.path) as f:
+            assert f.read().split("\n")[:3] == ["X0", "Y0 Z1", "Z0"]
+        first_values, second_values = prepared.rescale(np.array([0.5, 0.25, 1.0]))
+        np.testing.assert_array_equal(first_values, [0.25, 0])
+        np.testing.assert_array_equal(second_values, [0.5, -1.0])
+
+    def test_operator_set_is_prepared_once(self, tmp_path):
+        cache_dir = str(tmp_path / "cache")
+        operators = [QubitOperator("X0"), QubitOperator("Y0")]
+
+        first = OperatorCache(cache_dir).prepare_many(operators)
+        second = OperatorCache(cache_dir).prepare_many(operators)
+        reversed_set = OperatorCache(cache_dir).prepare_many(operators[::-1])
+
+        assert first.path == second.path
+        assert first.hash != reversed_set.hash
+
+    def test_set_of_single_operator_uses_its_file(self, tmp_path):
+        cache = OperatorCache(str(tmp_path / "cache"))
+
+        prepared = cache.prepare_many([QubitOperator("X0")])
+
+        assert prepared.path == cache.prepare(QubitOperator("X0")).path
+
+
+class TestOperatorCacheEviction:
+    def test_least_recently_used_operator_is_evicted(self, tmp_path):
+        cache = OperatorCache(str(tmp_path / "cache"), max_entries=2)
+        first = cache.prepare(QubitOperator("X0"))
+        second = cache.prepare(QubitOperator("Y0"))
+        _mark_used(first, 20)
+        _mark_used(second, 10)
+
+        cache.prepare(QubitOperator("X0"))
+        third = cache.prepare(QubitOperator("Z0"))
+
+        assert os.path.exists(first.path)
+        assert not os.path.exists(second.path)
+        assert os.path.exists(third.path)
+
+    def test_cache_is_bounded_by_total_size(self, tmp_path):
+        cache_dir = tmp_path / "cache"
+        cache = OperatorCache(str(cache_dir), max_bytes=0)
+
+        for operator in ["X0", "Y0", "Z0"]:
+            last = cache.prepare(QubitOperator(operator))
+
+        assert os.listdir(cache_dir) == [os.path.basename(os.path.dirname(last.path))]
+
+    def test_evicted_operator_is_prepared_again(self, tmp_path, written_operators):
+        cache = OperatorCache(str(tmp_path / "cache"), max_entries=1)
+
+        cache.prepare(QubitOperator("X0"))
+        cache.prepare(QubitOperator("Y0"))
+        prepared = cache.prepare(QubitOperator("X0"))
+
+        assert os.path.exists(prepared.path)
+        assert len(written_operators) == 3
+
+    def test_unbounded_cache_keeps_all_operators(self, tmp_path):
+        cache_dir = tmp_path / "cache"
+        cache = OperatorCache(str(cache_dir), max_entries=None, max_bytes=None)
+
+        for operator in ["X0", "Y0", "Z0"]:
+            cache.prepare(QubitOperator(operator))
+
+        assert len(os.listdir(cache_dir)) == 3
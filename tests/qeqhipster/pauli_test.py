@@ -0,0 +1,112 @@
+import itertools
+
+import numpy as np
+import pytest
+from qeqhipster.pauli import PauliTerms, expectation_values, walsh_hadamard
+from zquantum.core.openfermion import QubitOperator
+
+PAULI_MATRICES = {
+    "I": np.eye(2),
+    "X": np.array([[0, 1], [1, 0]]),
+    "Y": np.array([[0, -1j], [1j, 0]]),
+    "Z": np.diag([1, -1]),
+}
+
+
+def _dense(pauli_string):
+    # First letter acts on qubit 0, the most significant bit of amplitude index.
+    matrix = np.ones((1, 1))
+    for letter in pauli_string:
+        matrix = np.kron(matrix, PAULI_MATRICES[letter])
+    return matrix
+
+
+def _terms(pauli_strings, coefficients=None):
+    n_qubits = len(pauli_strings[0])
+    x_masks, z_masks, n_ys = [], [], []
+    for pauli_string in pauli_strings:
+        bits = [1 << (n_qubits - 1 - qubit) for qubit in range(n_qubits)]
+        x_masks.append(sum(b for b, p in zip(bits, pauli_string) if p in "XY"))
+        z_masks.append(sum(b for b, p in zip(bits, pauli_string) if p in "YZ"))
+        n_ys.append(pauli_string.count("Y"))
+    if coefficients is None:
+        coefficients = np.ones(len(pauli_strings))
+    return PauliTerms(
+        np.array(x_masks, dtype=np.uint64),
+        np.array(z_masks, dtype=np.uint64),
+        1j ** np.array(n_ys),
+        np.asarray(coefficients, dtype=complex),
+    )
+
+
+def _random_state(n_qubits, seed=0):
+    rng = np.random.default_rng(seed)
+    state = rng.normal(size=2**n_qubits) + 1j * rng.normal(size=2**n_qubits)
+    return state / np.linalg.norm(state)
+
+
+def test_walsh_hadamard_matches_hadamard_matrix():
+    values = _random_state(5)
+    hadamard = np.array([[1, 1], [1, -1]])
+    matrix = np.ones((1, 1))
+    for _ in range(5):
+        matrix = np.kron(matrix, hadamard)
+
+    np.testing.assert_array_almost_equal(walsh_hadamard(values.copy()), matrix @ values)
+
+
+class TestExpectationValues:
+    @pytest.mark.parametrize("chunk_size", [None, 1, 4, 32])
+    def test_all_pauli_strings_match_dense_computation(self, chunk_size):
+        state = _random_state(4)
+        pauli_strings = ["".join(p) for p in itertools.product("IXYZ", repeat=4)]
+
+        values = expectation_values(state, _terms(pauli_strings), chunk_size)
+
+        np.testing.assert_array_almost_equal(
+            values,
+            [np.vdot(state, _dense(p) @ state).real for p in pauli_strings],
+        )
+
+    def test_values_are_scaled_by_coefficients(self):
+        state = np.array([0, 0, 1, 0], dtype=complex)
+
+        values = expectation_values(state, _terms(["ZI", "IZ", "XI"], [0.5, -2, 3]))
+
+        np.testing.assert_array_almost_equal(values, [-0.5, -2, 0])
+
+    def test_state_vector_of_invalid_length_raises_error(self):
+        with pytest.raises(ValueError):
+            expectation_values(np.ones(3, dtype=complex), _terms(["Z"]))
+
+
+class TestPauliTermsFromOperator:
+    @pytest.mark.parametrize("native_qubit_order", [False, True])
+    def test_encoded_operator_matches_dense_computation(self, native_qubit_order):
+        operator = (
+            QubitOperator("X0 Y2", 0.5) + QubitOperator("Z1", -1.0) + QubitOperator("")
+        )
+        state = _random_state(3)
+        if native_qubit_order:
+            native_state = state.reshape(2, 2, 2).transpose(2, 1, 0).reshape(8)
+        else:
+            native_state = state
+
+        values = expectation_values(
+            native_state, PauliTerms.from_operator(operator, 3, native_qubit_order)
+        )
+
+        np.testing.assert_array_almost_equal(
+            values,
+            [
+                0.5 * np.vdot(state, _dense("XIY") @ state).real,
+                -np.vdot(state, _dense("IZI") @ state).real,
+                1,
+            ],
+        )
+
+    @pytest.mark.parametrize("native_qubit_order", [False, True])
+    @pytest.mark.parametrize("term", ["Z3", "X3", "Z0 Y2"])
+    def test_qubits_beyond_state_vector_raise_error(self, native_qubit_order, term):
+        with pytest.raises(ValueError, match="qubit [23].* 2 qubits"):
+            PauliTerms.from_operator(QubitOperator(term), 2, native_qubit_order)
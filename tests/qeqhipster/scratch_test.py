@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from qeqhipster.scratch import SCRATCH_BACKENDS, Scratch
+
+AVAILABLE_BACKENDS = [
+    backend
+    for backend in SCRATCH_BACKENDS
+    if backend != "memfd" or hasattr(os, "memfd_create")
+]
+
+
+@pytest.fixture(params=AVAILABLE_BACKENDS)
+def scratch(request, tmp_path):
+    scratch = Scratch(request.param, str(tmp_path))
+    yield scratch
+    scratch.close()
+
+
+class TestScratch:
+    def test_unknown_backend_raises_error(self):
+        with pytest.raises(ValueError):
+            Scratch("nfs")
+
+    def test_files_can_be_written_and_read_back(self, scratch):
+        with scratch.session() as session:
+            path = session.path("circuit.txt")
+            with open(path, "w") as f:
+                f.write("1\nX 0")
+            with open(path) as f:
+                assert f.read() == "1\nX 0"
+
+    def test_files_can_be_written_by_other_process(self, scratch):
+        with scratch.session() as session:
+            path = session.path("result.json")
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-c",
+                    f"open({path!r}, 'w').write('[1, 2]')",
+                ],
+                check=True,
+            )
+            with open(path) as f:
+                assert f.read() == "[1, 2]"
+
+    def test_files_of_concurrent_sessions_do_not_collide(self, scratch):
+        with scratch.session() as first, scratch.session() as second:
+            assert first.path("circuit.txt") != second.path("circuit.txt")
+
+    @pytest.mark.parametrize("backend", ["tempdir", "shm"])
+    def test_directory_backends_leave_no_files_behind(self, backend, tmp_path):
+        scratch = Scratch(backend, str(tmp_path))
+
+        with scratch.session() as session:
+            with open(session.path("circuit.txt"), "w") as f:
+                f.write("0\n")
+        scratch.close()
+
+        assert os.listdir(tmp_path) == []
+
+    def test_shm_backend_reuses_single_directory(self, tmp_path):
+        scratch = Scratch("shm", str(tmp_path))
+
+        for _ in range(3):
+            with scratch.session() as session:
+                open(session.path("circuit.txt"), "w").close()
+
+        assert len(os.listdir(tmp_path)) == 1
+        scratch.close()
@@ -1,10 +1,35 @@
+import os
+import threading
+
+import numpy as np
 import pytest
+import sympy
+from fake_mpi import make_executable
+from qeqhipster import simulator as simulator_module
+from qeqhipster import threads as threads_module
+from qeqhipster.instrumentation import ExecutableNotFound
+from qeqhipster.memory import MemoryBudgetExceeded
 from qeqhipster.simulator import QHipsterSimulator
 from qeqhipster.utils import make_circuit_qhipster_compatible
+from zquantum.core.circuits import CNOT, RX, XY, Circuit, H, I, X
 from zquantum.core.interfaces.backend_test import (
     QuantumSimulatorGatesTest,
     QuantumSimulatorTests,
 )
+from zquantum.core.openfermion import QubitOperator
+
+
+@pytest.fixture(autouse=True)
+def interpreter_only(monkeypatch):
+    # Tests run circuits with the interpreter unless they opt into simulating them in
+    # process.
+    monkeypatch.setattr(simulator_module, "IN_PROCESS_MAX_QUBITS", None)
+
+
+def _in_process_simulator(**kwargs):
+    return QHipsterSimulator(
+        in_process_max_qubits=16, in_process_max_gates=None, **kwargs
+    )
 
 
 @pytest.fixture
@@ -24,5 +49,683 @@ class TestQHipster(QuantumSimulatorTests):
 
 
 class TestQHipsterGates(QuantumSimulatorGatesTest):
-    gates_to_exclude = ["XX", "YY", "ZZ", "XY", "ISWAP"]
-    pass
+    gates_to_exclude = []
+
+
+class TestQHipsterWithWorker(QuantumSimulatorTests):
+    @pytest.fixture
+    def backend(self):
+        with QHipsterSimulator(use_worker=True) as simulator:
+            yield simulator
+
+    @pytest.fixture
+    def wf_simulator(self):
+        with QHipsterSimulator(use_worker=True) as simulator:
+            yield simulator
+
+    @pytest.mark.xfail
+    def test_get_wavefunction_uses_provided_initial_state(self, wf_simulator):
+        super().test_get_wavefunction_uses_provided_initial_state(wf_simulator)
+
+
+class TestQHipsterInProcess(QuantumSimulatorTests):
+    @pytest.fixture
+    def backend(self):
+        return _in_process_simulator()
+
+    @pytest.fixture
+    def wf_simulator(self):
+        return _in_process_simulator()
+
+    @pytest.mark.xfail
+    def test_get_wavefunction_uses_provided_initial_state(self, wf_simulator):
+        super().test_get_wavefunction_uses_provided_initial_state(wf_simulator)
+
+
+class TestQHipsterInProcessGates(QuantumSimulatorGatesTest):
+    gates_to_exclude = []
+
+    @pytest.fixture
+    def wf_simulator(self):
+        return _in_process_simulator()
+
+
+class TestQHipsterInProcessDispatch:
+    @pytest.fixture
+    def circuit(self):
+        return Circuit([H(0), RX(0.3)(1), CNOT(0, 2), XY(0.7)(1, 2), RX(1.2)(2)])
+
+    @pytest.mark.parametrize("native_qubit_order", [False, True])
+    def test_wavefunction_matches_interpreter(self, circuit, native_qubit_order):
+        simulator = _in_process_simulator(native_qubit_order=native_qubit_order)
+
+        wavefunction = simulator.get_wavefunction(circuit)
+
+        np.testing.assert_allclose(
+            wavefunction.amplitudes,
+            QHipsterSimulator(native_qubit_order=native_qubit_order)
+            .get_wavefunction(circuit)
+            .amplitudes,
+            atol=1e-12,
+        )
+        assert simulator.stats.n_in_process_calls == 1
+        assert simulator.stats.n_files == 0
+
+    def test_expectation_values_match_interpreter(self, circuit):
+        operator = QubitOperator("Z0") + QubitOperator("X1 Y2", 0.5)
+        simulator = _in_process_simulator()
+
+        values = simulator.get_exact_expectation_values(circuit, operator)
+
+        np.testing.assert_allclose(
+            values.values,
+            QHipsterSimulator().get_exact_expectation_values(circuit, operator).values,
+            atol=1e-12,
+        )
+        assert simulator.stats.n_files == 0
+
+    def test_measurements_are_sampled_in_z_quantum_core_order(self):
+        simulator = _in_process_simulator(native_qubit_order=True)
+
+        measurements = simulator.run_circuit_and_measure(Circuit([X(0), I(1)]), 10)
+
+        assert set(measurements.bitstrings) == {(1, 0)}
+
+    def test_template_is_simulated_in_process(self, circuit):
+        alpha = sympy.Symbol("alpha")
+        simulator = _in_process_simulator()
+        template = simulator.compile_template(
+            Circuit([*circuit.operations, RX(alpha)(0)])
+        )
+
+        wavefunction = simulator.get_wavefunction_from_template(template, [0.4])
+
+        np.testing.assert_allclose(
+            wavefunction.amplitudes,
+            QHipsterSimulator()
+            .get_wavefunction(Circuit([*circuit.operations, RX(0.4)(0)]))
+            .amplitudes,
+            atol=1e-12,
+        )
+        assert simulator.stats.last_call.in_process
+
+    @pytest.mark.parametrize(
+        "max_qubits, max_gates, in_process",
+        [(3, None, True), (2, None, False), (3, 4, False), (None, None, False)],
+    )
+    def test_threshold_decides_which_circuits_run_in_process(
+        self, circuit, max_qubits, max_gates, in_process
+    ):
+        simulator = QHipsterSimulator(
+            in_process_max_qubits=max_qubits, in_process_max_gates=max_gates
+        )
+
+        simulator.get_wavefunction(circuit)
+
+        assert simulator.stats.last_call.in_process == in_process
+
+
+class TestQHipsterBatches:
+    def test_measurements_of_batch_are_returned_in_input_order(self):
+        simulator = QHipsterSimulator(batch_size=2, max_cores=2)
+        circuits = [
+            Circuit([X(0), X(1)]),
+            Circuit([X(0), I(1)]),
+            Circuit([I(0), X(1)]),
+        ]
+
+        measurements_set = simulator.run_circuitset_and_measure(circuits, [5, 10, 15])
+
+        assert [len(m.bitstrings) for m in measurements_set] == [5, 10, 15]
+        assert [set(m.bitstrings) for m in measurements_set] == [
+            {(1, 1)},
+            {(1, 0)},
+            {(0, 1)},
+        ]
+        assert simulator.number_of_circuits_run == 3
+        assert simulator.last_batch_report.n_jobs == 1
+
+
+class TestQHipsterWavefunctionFormats:
+    def test_unknown_wavefunction_format_raises_error(self):
+        with pytest.raises(ValueError):
+            QHipsterSimulator(wavefunction_format="csv")
+
+    def test_json_is_used_if_binary_interpreter_is_not_installed(self, monkeypatch):
+        monkeypatch.setattr(
+            simulator_module, "BINARY_WAVEFUNCTION_INTERPRETER", "/nonexistent.out"
+        )
+        simulator = QHipsterSimulator()
+
+        wavefunction = simulator.get_wavefunction(Circuit([X(0), I(1)]))
+
+        np.testing.assert_array_almost_equal(wavefunction.amplitudes, [0, 0, 1, 0])
+
+    def test_wavefunction_can_be_returned_in_native_qubit_order(self):
+        simulator = QHipsterSimulator(native_qubit_order=True)
+
+        wavefunction = simulator.get_wavefunction(Circuit([X(0), I(1)]))
+
+        np.testing.assert_array_almost_equal(wavefunction.amplitudes, [0, 1, 0, 0])
+
+    def test_missing_interpreter_raises_clear_error(self, monkeypatch):
+        for attribute in [
+            "WAVEFUNCTION_INTERPRETER",
+            "BINARY_WAVEFUNCTION_INTERPRETER",
+        ]:
+            monkeypatch.setattr(simulator_module, attribute, "/nonexistent.out")
+
+        with pytest.raises(ExecutableNotFound, match="/nonexistent.out"):
+            QHipsterSimulator().get_wavefunction(Circuit([X(0)]))
+
+
+class TestQHipsterOutputPrecision:
+    @pytest.fixture
+    def circuit(self):
+        return Circuit([H(0), RX(0.3)(1), CNOT(0, 2), RX(1.2)(2)])
+
+    @pytest.mark.parametrize("native_qubit_order", [False, True])
+    def test_single_precision_wavefunction_matches_double_precision_one(
+        self, circuit, native_qubit_order
+    ):
+        expected = QHipsterSimulator(native_qubit_order=native_qubit_order)
+        simulator = QHipsterSimulator(
+            wavefunction_precision="complex64", native_qubit_order=native_qubit_order
+        )
+
+        wavefunction = simulator.get_wavefunction(circuit)
+
+        np.testing.assert_allclose(
+            wavefunction.amplitudes,
+            expected.get_wavefunction(circuit).amplitudes,
+            atol=1e-7,
+        )
+
+    def test_probabilities_match_double_precision_wavefunction(self, circuit):
+        simulator = QHipsterSimulator()
+
+        probabilities = simulator.get_probabilities(circuit)
+
+        assert probabilities.dtype == np.float32
+        np.testing.assert_allclose(
+            probabilities,
+            np.abs(simulator.get_wavefunction(circuit).amplitudes) ** 2,
+            atol=1e-7,
+        )
+
+    @pytest.mark.parametrize("native_qubit_order", [False, True])
+    def test_sparse_amplitudes_match_double_precision_wavefunction(
+        self, native_qubit_order
+    ):
+        simulator = QHipsterSimulator(native_qubit_order=native_qubit_order)
+        circuit = Circuit([H(0), CNOT(0, 1), X(2)])
+
+        sparse = simulator.get_sparse_amplitudes(circuit)
+
+        assert len(sparse.indices) == 2
+        np.testing.assert_allclose(
+            sparse.to_dense(),
+            simulator.get_wavefunction(circuit).amplitudes,
+            atol=1e-12,
+        )
+
+    def test_outputs_are_cached_separately(self, circuit):
+        simulator = QHipsterSimulator(cache_size=4)
+
+        simulator.get_wavefunction(circuit)
+        probabilities = simulator.get_probabilities(circuit)
+
+        assert probabilities.dtype == np.float32
+        assert simulator.number_of_cache_hits == 0
+
+    def test_unknown_precision_raises_error(self):
+        with pytest.raises(ValueError):
+            QHipsterSimulator(wavefunction_precision="float16")
+
+
+class TestQHipsterCache:
+    def test_resubmitted_circuit_is_served_from_cache(self):
+        simulator = QHipsterSimulator(cache_size=4)
+        circuit = Circuit([X(0), I(1)])
+
+        first_wavefunction = simulator.get_wavefunction(circuit)
+        second_wavefunction = simulator.get_wavefunction(circuit)
+
+        np.testing.assert_array_equal(
+            first_wavefunction.amplitudes, second_wavefunction.amplitudes
+        )
+        assert simulator.number_of_cache_hits == 1
+        assert simulator.number_of_cache_misses == 1
+
+    def test_expectation_values_are_cached(self):
+        simulator = QHipsterSimulator(cache_size=4)
+        circuit = Circuit([X(0), I(1)])
+        operator = QubitOperator("Z0") + QubitOperator("Z1", 2.0)
+
+        first_values = simulator.get_exact_expectation_values(circuit, operator)
+        second_values = simulator.get_exact_expectation_values(circuit, operator)
+
+        np.testing.assert_array_almost_equal(first_values.values, [-1, 2])
+        np.testing.assert_array_equal(first_values.values, second_values.values)
+        assert simulator.number_of_cache_hits == 1
+
+    def test_cache_is_disabled_by_default(self):
+        simulator = QHipsterSimulator()
+        circuit = Circuit([X(0)])
+
+        simulator.get_wavefunction(circuit)
+        simulator.get_wavefunction(circuit)
+
+        assert simulator.number_of_cache_hits == 0
+
+
+class TestQHipsterManyOperators:
+    def test_values_of_each_operator_are_returned_in_order(self):
+        simulator = QHipsterSimulator()
+        circuit = Circuit([X(0), I(1)])
+        operators = [
+            QubitOperator("Z0") + QubitOperator("Z1", 2.0),
+            QubitOperator("X0"),
+        ]
+
+        first, second = simulator.get_exact_expectation_values_of_operators(
+            circuit, operators
+        )
+
+        np.testing.assert_array_almost_equal(first.values, [-1, 2])
+        np.testing.assert_array_almost_equal(second.values, [0])
+        assert simulator.stats.n_calls == 1
+
+    def test_named_operators_give_named_values(self):
+        simulator = QHipsterSimulator()
+        circuit = Circuit([X(0), I(1)])
+
+        values = simulator.get_exact_expectation_values_of_operators(
+            circuit, {"z0": QubitOperator("Z0"), "z1": QubitOperator("Z1")}
+        )
+
+        assert list(values) == ["z0", "z1"]
+        np.testing.assert_array_almost_equal(values["z0"].values, [-1])
+        np.testing.assert_array_almost_equal(values["z1"].values, [1])
+
+    def test_values_are_cached_per_operator(self):
+        simulator = QHipsterSimulator(cache_size=4)
+        circuit = Circuit([X(0), I(1)])
+        operators = [QubitOperator("Z0"), QubitOperator("Z1")]
+
+        simulator.get_exact_expectation_values_of_operators(circuit, operators)
+        values = simulator.get_exact_expectation_values(circuit, operators[1])
+
+        np.testing.assert_array_almost_equal(values.values, [1])
+        assert simulator.stats.n_cached_calls == 1
+
+
+class TestQHipsterNumpyEngine:
+    @pytest.mark.parametrize("native_qubit_order", [False, True])
+    def test_numpy_engine_matches_native_interpreter(self, native_qubit_order):
+        circuit = Circuit([H(0), CNOT(0, 1), RX(0.3)(2), CNOT(1, 2), X(3), RX(1.1)(0)])
+        operator = (
+            QubitOperator("Z0 Z1", 0.5)
+            + QubitOperator("X0 X1 Y2", -1.5)
+            + QubitOperator("Y1 Z3")
+            + QubitOperator("X2", 0.25)
+            + QubitOperator("Z3", 1e-12)
+        )
+
+        native = QHipsterSimulator(expectation_engine="native")
+        numpy_engine = QHipsterSimulator(
+            expectation_engine="numpy", native_qubit_order=native_qubit_order
+        )
+
+        np.testing.assert_array_almost_equal(
+            numpy_engine.get_exact_expectation_values(circuit, operator).values,
+            native.get_exact_expectation_values(circuit, operator).values,
+        )
+
+    def test_numpy_engine_reuses_cached_wavefunction(self):
+        simulator = QHipsterSimulator(expectation_engine="numpy", cache_size=4)
+        circuit = Circuit([X(0), I(1)])
+
+        simulator.get_wavefunction(circuit)
+        values = simulator.get_exact_expectation_values(circuit, QubitOperator("Z0"))
+
+        np.testing.assert_array_almost_equal(values.values, [-1])
+        assert simulator.number_of_cache_hits == 1
+
+    def test_unknown_engine_raises_error(self):
+        with pytest.raises(ValueError):
+            QHipsterSimulator(expectation_engine="gpu")
+
+
+class TestQHipsterTemplates:
+    @pytest.fixture
+    def circuit(self):
+        theta = sympy.Symbol("theta")
+        return Circuit([RX(theta)(0), X(1)])
+
+    def test_template_wavefunction_matches_wavefunction_of_bound_circuit(self, circuit):
+        simulator = QHipsterSimulator()
+        template = simulator.compile_template(circuit)
+
+        wavefunction = simulator.get_wavefunction_from_template(template, [0.3])
+
+        np.testing.assert_array_almost_equal(
+            wavefunction.amplitudes,
+            simulator.get_wavefunction(
+                circuit.bind({circuit.free_symbols[0]: 0.3})
+            ).amplitudes,
+        )
+
+    def test_many_points_are_evaluated_as_batch(self, circuit):
+        simulator = QHipsterSimulator(batch_size=2)
+        template = simulator.compile_template(circuit)
+        operator = QubitOperator("Z0") + QubitOperator("Z1")
+
+        expectation_values = simulator.get_exact_expectation_values_from_template(
+            template, [[0.0], [np.pi / 2], [np.pi]], operator
+        )
+
+        np.testing.assert_array_almost_equal(
+            [values.values for values in expectation_values],
+            [[1, -1], [0, -1], [-1, -1]],
+        )
+        assert simulator.number_of_circuits_run == 3
+        assert simulator.number_of_jobs_run == 2
+
+    def test_template_can_be_measured(self, circuit):
+        simulator = QHipsterSimulator()
+        template = simulator.compile_template(circuit)
+
+        measurements = simulator.run_template_and_measure(template, [np.pi], 10)
+
+        assert set(measurements.bitstrings) == {(1, 1)}
+
+
+class TestQHipsterScratch:
+    @pytest.mark.parametrize("scratch", ["tempdir", "shm", "memfd"])
+    def test_results_do_not_depend_on_scratch_backend(self, scratch):
+        with QHipsterSimulator(scratch=scratch) as simulator:
+            wavefunction = simulator.get_wavefunction(Circuit([X(0), I(1)]))
+            expectation_values = simulator.get_exact_expectation_values(
+                Circuit([X(0)]), QubitOperator("Z0")
+            )
+
+        np.testing.assert_array_almost_equal(wavefunction.amplitudes, [0, 0, 1, 0])
+        np.testing.assert_array_almost_equal(expectation_values.values, [-1])
+
+
+class TestQHipsterInstrumentation:
+    def test_time_spent_on_io_and_simulation_is_reported(self):
+        simulator = QHipsterSimulator()
+
+        simulator.get_wavefunction(Circuit([X(0)]))
+
+        assert simulator.stats.n_files == 2
+        assert simulator.stats.io_time > 0
+        assert simulator.stats.simulation_time > 0
+        assert simulator.stats.bytes_written > 0
+        assert simulator.stats.bytes_read > 0
+        assert simulator.stats.max_child_rss > 0
+
+    def test_hooks_receive_record_of_every_call(self):
+        simulator = QHipsterSimulator(cache_size=1)
+        calls = []
+        simulator.stats.add_hook(calls.append)
+
+        simulator.get_wavefunction(Circuit([X(0)]))
+        simulator.get_wavefunction(Circuit([X(0)]))
+        simulator.get_exact_expectation_values(Circuit([X(0)]), QubitOperator("Z0"))
+
+        assert [(call.kind, call.cached) for call in calls] == [
+            ("wavefunction", False),
+            ("wavefunction", True),
+            ("expectation_values", False),
+        ]
+        assert "simulation" in calls[0].stages
+        assert "simulation" not in calls[1].stages
+        assert simulator.stats.n_cached_calls == 1
+
+    def test_number_of_removed_gates_is_reported(self):
+        simulator = QHipsterSimulator()
+
+        wavefunction = simulator.get_wavefunction(
+            Circuit([X(0), I(1), H(1), H(1), RX(0.5)(0), RX(-0.5)(0)])
+        )
+
+        np.testing.assert_array_almost_equal(wavefunction.amplitudes, [0, 0, 1, 0])
+        assert simulator.stats.n_removed_gates == 5
+
+    def test_instrumentation_can_be_disabled(self):
+        simulator = QHipsterSimulator(instrument=False)
+
+        wavefunction = simulator.get_wavefunction(Circuit([X(0), I(1)]))
+
+        assert simulator.stats is None
+        np.testing.assert_array_almost_equal(wavefunction.amplitudes, [0, 0, 1, 0])
+
+
+class TestQHipsterMemory:
+    def test_circuit_exceeding_memory_budget_is_rejected_before_simulation(self):
+        simulator = QHipsterSimulator(memory_budget=2**20)
+        circuit = Circuit([X(0)], n_qubits=30)
+
+        with pytest.raises(MemoryBudgetExceeded):
+            simulator.get_wavefunction(circuit)
+
+        assert simulator.stats.n_calls == 0
+
+    def test_batch_exceeding_memory_budget_is_rejected(self):
+        simulator = QHipsterSimulator(memory_budget=2**30)
+        circuits = [Circuit([X(0)]), Circuit([X(0)], n_qubits=30)]
+
+        with pytest.raises(MemoryBudgetExceeded):
+            simulator.run_circuitset_and_measure(circuits, [10, 10])
+
+    def test_estimate_reflects_output_format(self):
+        circuit = Circuit([X(0)], n_qubits=20)
+
+        binary = QHipsterSimulator(wavefunction_format="binary")
+        json = QHipsterSimulator(wavefunction_format="json")
+
+        assert json.estimate_memory(circuit).peak > binary.estimate_memory(circuit).peak
+
+    def test_estimate_reflects_output_precision(self):
+        circuit = Circuit([X(0)], n_qubits=20)
+
+        double = QHipsterSimulator(wavefunction_format="binary")
+        single = QHipsterSimulator(
+            wavefunction_format="binary", wavefunction_precision="complex64"
+        )
+
+        assert 2 * single.estimate_memory(circuit).python == (
+            double.estimate_memory(circuit).python
+        )
+
+    def test_small_circuits_run_within_budget(self):
+        simulator = QHipsterSimulator(memory_budget=2**28)
+
+        wavefunction = simulator.get_wavefunction(Circuit([X(0), I(1)]))
+
+        np.testing.assert_array_almost_equal(wavefunction.amplitudes, [0, 0, 1, 0])
+
+
+@pytest.fixture
+def mpi_simulator(tmp_path, monkeypatch):
+    """Factory of simulators running stand-ins for `mpirun` and MPI interpreters."""
+    for name, mode in [
+        ("MPI_WAVEFUNCTION_INTERPRETER", "wavefunction"),
+        ("MPI_EXPECTATION_VALUES_INTERPRETER", "expectation_values"),
+    ]:
+        monkeypatch.setattr(
+            simulator_module, name, make_executable(str(tmp_path / mode), mode)
+        )
+    mpirun = make_executable(str(tmp_path / "mpirun"), "mpirun")
+
+    def _simulator(**kwargs):
+        return QHipsterSimulator(mpirun=mpirun, **kwargs)
+
+    return _simulator
+
+
+class TestQHipsterMPI:
+    @pytest.fixture
+    def circuit(self):
+        return Circuit([H(0), CNOT(0, 1), RX(0.5)(2), X(3)])
+
+    @pytest.mark.parametrize("native_qubit_order", [False, True])
+    def test_wavefunction_matches_single_process_simulation(
+        self, circuit, native_qubit_order, mpi_simulator
+    ):
+        simulator = mpi_simulator(mpi_ranks=2, native_qubit_order=native_qubit_order)
+
+        wavefunction = simulator.get_wavefunction(circuit)
+
+        np.testing.assert_array_almost_equal(
+            wavefunction.amplitudes,
+            _in_process_simulator(native_qubit_order=native_qubit_order)
+            .get_wavefunction(circuit)
+            .amplitudes,
+        )
+        assert simulator.stats.last_call.n_files == 3
+
+    def test_expectation_values_are_reduced_from_ranks(self, circuit, mpi_simulator):
+        simulator = mpi_simulator(
+            mpi_ranks=4, mpi_ranks_per_node=4, expectation_engine="native"
+        )
+        operator = (
+            QubitOperator("Z0 Z1") + QubitOperator("Z2", 0.5) + QubitOperator("Z3")
+        )
+
+        expectation_values = simulator.get_exact_expectation_values(circuit, operator)
+
+        np.testing.assert_array_almost_equal(
+            expectation_values.values, [1, 0.5 * np.cos(0.5), -1]
+        )
+
+    def test_samples_are_drawn_from_shards(self, circuit, mpi_simulator):
+        simulator = mpi_simulator(mpi_ranks=2)
+
+        measurements = simulator.run_circuit_and_measure(circuit, 100)
+
+        assert {bitstring[:2] for bitstring in measurements.bitstrings} <= {
+            (0, 0),
+            (1, 1),
+        }
+        assert all(bitstring[3] == 1 for bitstring in measurements.bitstrings)
+
+
+class TestQHipsterMPIOptions:
+    def test_number_of_ranks_has_to_be_power_of_two(self):
+        with pytest.raises(ValueError):
+            QHipsterSimulator(mpi_ranks=3)
+
+    def test_memfd_scratch_cannot_be_used_with_mpi(self):
+        with pytest.raises(ValueError):
+            QHipsterSimulator(mpi_ranks=2, scratch="memfd")
+
+    def test_threads_are_counted_for_all_ranks(self):
+        simulator = QHipsterSimulator(nthreads=2, mpi_ranks=4)
+
+        assert simulator._threads_for(Circuit([X(0)], n_qubits=4)) == 8
+
+
+class TestQHipsterGradients:
+    @pytest.fixture
+    def circuit(self):
+        alpha, beta = sympy.symbols("alpha beta")
+        return Circuit(
+            [RX(alpha)(0), H(1), CNOT(0, 1), RX(2 * beta - alpha)(1), RX(beta)(1)]
+        )
+
+    @pytest.mark.parametrize("expectation_engine", ["native", "numpy"])
+    def test_gradient_matches_finite_differences(self, circuit, expectation_engine):
+        simulator = QHipsterSimulator(expectation_engine=expectation_engine)
+        operator = QubitOperator("Z0") + QubitOperator("Y1", 0.5)
+        params = np.array([0.3, -0.7])
+
+        def _value(point):
+            bound = circuit.bind(dict(zip(circuit.free_symbols, point)))
+            return np.sum(
+                simulator.get_exact_expectation_values(bound, operator).values
+            )
+
+        step = 1e-4
+        expected_gradient = [
+            (_value(params + step * unit) - _value(params - step * unit)) / (2 * step)
+            for unit in np.eye(2)
+        ]
+
+        gradient = simulator.get_gradient(circuit, operator, params)
+
+        np.testing.assert_allclose(gradient, expected_gradient, atol=1e-6)
+
+    def test_shifted_circuits_are_simulated_as_single_batch(self, circuit):
+        simulator = QHipsterSimulator()
+        gradient = simulator.compile_gradient(circuit)
+
+        simulator.get_gradient(gradient, QubitOperator("Z1"), [0.3, -0.7])
+
+        report = simulator.last_gradient_report
+        # Consecutive rotations of qubit 1 are shifted once.
+        assert (report.n_shifted_circuits, report.n_circuits) == (6, 4)
+        assert report.circuits_per_second > 0
+        assert simulator.last_batch_report.n_jobs == 4
+        assert simulator.number_of_jobs_run == 1
+
+
+class TestQHipsterThreads:
+    def test_automatic_number_of_threads_gives_correct_results(self, tmp_path):
+        simulator = QHipsterSimulator(
+            nthreads="auto", thread_profile=str(tmp_path / "missing.json")
+        )
+
+        wavefunction = simulator.get_wavefunction(Circuit([X(0), I(1)]))
+
+        np.testing.assert_array_almost_equal(wavefunction.amplitudes, [0, 0, 1, 0])
+
+    def test_simulators_binding_cores_get_disjoint_cores(self):
+        with QHipsterSimulator(nthreads=1, bind_cores=True) as first:
+            with QHipsterSimulator(nthreads=1, bind_cores=True) as second:
+                assert len(first.cores) == len(second.cores) == 1
+                if len(os.sched_getaffinity(0)) > 1:
+                    assert first.cores != second.cores
+                wavefunction = second.get_wavefunction(Circuit([X(0), I(1)]))
+
+        np.testing.assert_array_almost_equal(wavefunction.amplitudes, [0, 0, 1, 0])
+
+    def test_concurrent_jobs_are_bound_to_disjoint_cores(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(
+            threads_module, "_default_allocator", threads_module.CoreAllocator(range(4))
+        )
+        affinities = []
+        monkeypatch.setattr(
+            simulator_module,
+            "set_affinity",
+            lambda pid, cores: affinities.append(cores),
+        )
+        log_path = tmp_path / "env.txt"
+        script_path = tmp_path / "interpreter.sh"
+        script_path.write_text(
+            "#!/bin/sh\n"
+            f'echo "$OMP_NUM_THREADS;$OMP_PLACES;$KMP_AFFINITY" >> {log_path}\n'
+            "sleep 0.2\n"
+        )
+        script_path.chmod(0o755)
+
+        with QHipsterSimulator(max_cores=4, bind_cores=True) as simulator:
+            threads = [
+                threading.Thread(
+                    target=simulator._run_interpreter, args=([str(script_path)], 2)
+                )
+                for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        first, second = [line.split(";") for line in log_path.read_text().split()]
+        assert first[0] == second[0] == "2"
+        assert set(first[1].split(",")).isdisjoint(second[1].split(","))
+        assert first[2] != second[2]
+        assert set(affinities[0]).isdisjoint(affinities[1])
@@ -0,0 +1,95 @@
+import io
+
+import numpy as np
+import pytest
+from qeqhipster.statevector import UnsupportedGate, parse_qasm, simulate_qasm
+from qeqhipster.utils import write_simplified_qasm
+from qeqhipster.wavefunction import reverse_qubit_order
+from zquantum.core import circuits
+
+SINGLE_QUBIT_GATES = [
+    circuits.X,
+    circuits.Y,
+    circuits.Z,
+    circuits.H,
+    circuits.S,
+    circuits.T,
+    circuits.I,
+]
+ROTATIONS = [circuits.RX, circuits.RY, circuits.RZ, circuits.PHASE]
+TWO_QUBIT_GATES = [circuits.CNOT, circuits.CZ, circuits.SWAP, circuits.ISWAP]
+TWO_QUBIT_ROTATIONS = [
+    circuits.CPHASE,
+    circuits.XX,
+    circuits.YY,
+    circuits.ZZ,
+    circuits.XY,
+]
+
+
+def _random_circuit(n_qubits, n_gates, seed=0):
+    rng = np.random.default_rng(seed)
+    operations = []
+    for _ in range(n_gates):
+        kind = rng.integers(4)
+        angle = rng.uniform(-np.pi, np.pi)
+        qubit = int(rng.integers(n_qubits))
+        qubits = tuple(map(int, rng.choice(n_qubits, 2, replace=False)))
+        if kind == 0:
+            operations.append(SINGLE_QUBIT_GATES[rng.integers(7)](qubit))
+        elif kind == 1:
+            operations.append(ROTATIONS[rng.integers(4)](angle)(qubit))
+        elif kind == 2:
+            operations.append(TWO_QUBIT_GATES[rng.integers(4)](*qubits))
+        else:
+            operations.append(TWO_QUBIT_ROTATIONS[rng.integers(5)](angle)(*qubits))
+    return circuits.Circuit(operations, n_qubits=n_qubits)
+
+
+def _qasm(circuit):
+    qasm = io.StringIO()
+    write_simplified_qasm(circuit, qasm)
+    return qasm.getvalue()
+
+
+class TestSimulateQasm:
+    @pytest.mark.parametrize("seed", range(5))
+    def test_state_matches_unitary_of_circuit(self, seed):
+        circuit = _random_circuit(4, 40, seed)
+
+        np.testing.assert_allclose(
+            simulate_qasm(_qasm(circuit)), circuit.to_unitary()[:, 0], atol=1e-12
+        )
+
+    def test_state_can_be_returned_in_native_qubit_order(self):
+        circuit = _random_circuit(5, 40)
+        expected = circuit.to_unitary()[:, 0].copy()
+        reverse_qubit_order(expected)
+
+        np.testing.assert_allclose(
+            simulate_qasm(_qasm(circuit), native_qubit_order=True),
+            expected,
+            atol=1e-12,
+        )
+
+    def test_circuit_without_gates_leaves_qubits_in_zero_state(self):
+        state = simulate_qasm(_qasm(circuits.Circuit(n_qubits=3)))
+
+        np.testing.assert_array_equal(state, np.eye(8)[0])
+
+    def test_single_qubit_circuit_is_simulated(self):
+        state = simulate_qasm(_qasm(circuits.Circuit([circuits.H(0)])))
+
+        np.testing.assert_allclose(state, [1 / np.sqrt(2)] * 2)
+
+
+class TestParseQasm:
+    def test_gate_names_params_and_qubits_are_parsed(self):
+        n_qubits, operations = parse_qasm("3\nRx 0.50000000000000000000 2\nCNOT 0 1")
+
+        assert n_qubits == 3
+        assert operations == [("Rx", (0.5,), (2,)), ("CNOT", (), (0, 1))]
+
+    def test_unsupported_gate_raises_error(self):
+        with pytest.raises(UnsupportedGate):
+            parse_qasm("1\nU3 0.1 0.2 0.3 0")
@@ -0,0 +1,116 @@
+import hashlib
+import io
+
+import numpy as np
+import pytest
+import sympy
+from qeqhipster.statevector import simulate_qasm
+from qeqhipster.templates import CircuitTemplate
+from qeqhipster.utils import simplify_circuit, write_simplified_qasm
+from zquantum.core import circuits
+
+ALPHA, BETA = sympy.symbols("alpha beta")
+
+
+@pytest.fixture
+def circuit():
+    return circuits.Circuit(
+        [
+            circuits.RX(ALPHA)(0),
+            circuits.I(1),
+            circuits.RZ(0.5)(1),
+            circuits.RY(2 * BETA - ALPHA)(2),
+            circuits.CNOT(0, 2),
+        ]
+    )
+
+
+def _bound_qasm(circuit, symbols, params):
+    file = io.StringIO()
+    write_simplified_qasm(circuit.bind(dict(zip(symbols, params))), file)
+    return file.getvalue()
+
+
+class TestCircuitTemplate:
+    @pytest.mark.parametrize("params", [[0.1, 0.2], [np.pi, -1.5], [0, 0]])
+    def test_qasm_matches_qasm_of_bound_circuit(self, circuit, params):
+        template = CircuitTemplate(circuit)
+
+        assert template.qasm(params) == _bound_qasm(circuit, template.symbols, params)
+
+    def test_symbols_default_to_free_symbols_of_circuit(self, circuit):
+        template = CircuitTemplate(circuit)
+
+        assert template.symbols == circuit.free_symbols
+        assert template.n_slots == 2
+
+    def test_symbols_can_be_given_in_custom_order(self, circuit):
+        template = CircuitTemplate(circuit, symbols=[BETA, ALPHA])
+
+        assert template.qasm([0.2, 0.1]) == _bound_qasm(
+            circuit, [ALPHA, BETA], [0.1, 0.2]
+        )
+
+    def test_simplified_template_drops_redundant_gates(self, circuit):
+        template = CircuitTemplate(circuit, simplify=True)
+
+        assert template.n_removed_gates == 1
+        assert template.qasm([0.1, 0.2]) == _bound_qasm(
+            circuits.Circuit([op for op in circuit.operations if op.gate.name != "I"]),
+            template.symbols,
+            [0.1, 0.2],
+        )
+
+    @pytest.mark.parametrize("alpha", [0.0, 0.2])
+    def test_simplified_template_keeps_symbolic_gates_that_vanish_or_merge_once_bound(
+        self, alpha
+    ):
+        circuit = circuits.Circuit([circuits.RX(ALPHA)(0), circuits.RX(0.3)(0)])
+        template = CircuitTemplate(circuit, simplify=True)
+        bound = circuit.bind({ALPHA: alpha})
+        direct_qasm = io.StringIO()
+        write_simplified_qasm(simplify_circuit(bound)[0], direct_qasm)
+
+        assert template.qasm([alpha]).count("\n") == 2
+        assert direct_qasm.getvalue().count("\n") == 1
+        np.testing.assert_allclose(
+            simulate_qasm(template.qasm([alpha])),
+            simulate_qasm(direct_qasm.getvalue()),
+        )
+
+    def test_all_symbols_of_circuit_have_to_be_template_symbols(self, circuit):
+        with pytest.raises(ValueError):
+            CircuitTemplate(circuit, symbols=[ALPHA])
+
+    def test_slot_values_are_evaluated_for_many_points_at_once(self, circuit):
+        template = CircuitTemplate(circuit)
+        points = np.array([[0.1, 0.2], [0.3, -1.5], [1.0, 1.0]])
+
+        np.testing.assert_array_almost_equal(
+            template.slot_values(points), [[0.1, 0.3], [0.3, -3.3], [1.0, 1.0]]
+        )
+
+    @pytest.mark.parametrize("params", [[0.1], [0.1, 0.2, 0.3], [[[0.1, 0.2]]]])
+    def test_parameters_of_wrong_shape_are_rejected(self, circuit, params):
+        template = CircuitTemplate(circuit)
+
+        with pytest.raises(ValueError):
+            template.slot_values(params)
+
+    def test_circuit_without_symbols_is_compiled_to_its_qasm(self):
+        circuit = circuits.Circuit([circuits.H(0), circuits.CNOT(0, 1)])
+
+        assert CircuitTemplate(circuit).qasm([]) == _bound_qasm(circuit, [], [])
+
+    def test_gates_unsupported_by_interpreter_are_lowered(self):
+        circuit = circuits.Circuit([circuits.XX(ALPHA)(0, 1), circuits.ISWAP(1, 2)])
+        template = CircuitTemplate(circuit)
+
+        assert template.qasm([0.3]) == _bound_qasm(circuit, [ALPHA], [0.3])
+
+    def test_saved_template_digest_is_sha256_of_written_file(self, circuit, tmp_path):
+        path = tmp_path / "circuit.txt"
+
+        digest = CircuitTemplate(circuit).bind([0.1, 0.2]).save(str(path))
+
+        assert digest == hashlib.sha256(path.read_bytes()).hexdigest()
@@ -0,0 +1,154 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from qeqhipster import simulator as simulator_module
+from qeqhipster.batching import threads_for_circuit
+from qeqhipster.threads import (
+    CoreAllocator,
+    ThreadProfile,
+    binding_env,
+    calibrate,
+    load_thread_profile,
+    main,
+    thread_chooser,
+)
+
+
+def _simulated_time(n_qubits, nthreads):
+    return 2.0**n_qubits * (1e-8 / nthreads + 1e-10) + 1e-3 * nthreads
+
+
+@pytest.fixture
+def profile():
+    return ThreadProfile.fit(
+        [
+            [n_qubits, nthreads, _simulated_time(n_qubits, nthreads)]
+            for n_qubits in range(10, 26, 3)
+            for nthreads in (1, 2, 4, 8, 16)
+        ]
+    )
+
+
+class TestThreadProfile:
+    def test_fitted_model_reproduces_timings(self, profile):
+        assert profile.parallel == pytest.approx(1e-8)
+        assert profile.serial == pytest.approx(1e-10)
+        assert profile.overhead == pytest.approx(1e-3)
+
+    def test_small_circuits_use_single_thread(self, profile):
+        assert profile.threads_for(10, n_cores=32) == 1
+
+    def test_large_circuits_use_many_threads(self, profile):
+        assert profile.threads_for(30, n_cores=32) == 32
+        assert 1 < profile.threads_for(20, n_cores=32) < 32
+
+    def test_profile_can_be_saved_and_loaded(self, profile, tmp_path):
+        path = str(tmp_path / "profile.json")
+
+        profile.save(path)
+
+        assert load_thread_profile(path) == profile
+
+    def test_missing_profile_falls_back_to_heuristic(self, tmp_path):
+        profile = load_thread_profile(str(tmp_path / "missing.json"))
+
+        assert profile is None
+        assert thread_chooser(profile) is threads_for_circuit
+
+    def test_calibration_fits_model_to_measured_timings(self):
+        calls = []
+
+        profile = calibrate(
+            lambda n_qubits, nthreads: calls.append((n_qubits, nthreads)),
+            qubit_counts=[4, 6],
+            thread_counts=[1, 2],
+            repeats=2,
+        )
+
+        assert calls == [(4, 1), (4, 1), (4, 2), (4, 2), (6, 1), (6, 1), (6, 2), (6, 2)]
+        assert [sample[:2] for sample in profile.samples] == [
+            [4, 1],
+            [4, 2],
+            [6, 1],
+            [6, 2],
+        ]
+
+    def test_calibration_always_runs_interpreter(self, tmp_path, monkeypatch):
+        interpreter_path = tmp_path / "interpreter.py"
+        interpreter_path.write_text(
+            f"#!{sys.executable}\n"
+            "import json, sys\n"
+            "n_amplitudes = 2 ** int(open(sys.argv[1]).readline())\n"
+            "real = [1.0] + [0.0] * (n_amplitudes - 1)\n"
+            "json.dump(\n"
+            "    {\n"
+            "        'schema': 'zapata-v1-wavefunction',\n"
+            "        'amplitudes': {'real': real, 'imag': [0.0] * n_amplitudes},\n"
+            "    },\n"
+            "    open(sys.argv[3], 'w'),\n"
+            ")\n"
+        )
+        interpreter_path.chmod(0o755)
+        monkeypatch.setattr(
+            simulator_module, "WAVEFUNCTION_INTERPRETER", str(interpreter_path)
+        )
+        in_process = []
+
+        class _RecordingSimulator(simulator_module.QHipsterSimulator):
+            def __init__(self, **kwargs):
+                super().__init__(wavefunction_format="json", **kwargs)
+                self.stats.add_hook(lambda call: in_process.append(call.in_process))
+
+        monkeypatch.setattr(simulator_module, "QHipsterSimulator", _RecordingSimulator)
+
+        main(
+            [
+                "--min-qubits=2",
+                "--max-qubits=6",
+                "--repeats=1",
+                f"--output={tmp_path / 'profile.json'}",
+            ]
+        )
+
+        assert in_process and not any(in_process)
+
+
+class TestCoreAllocator:
+    def test_allocated_core_sets_are_disjoint(self):
+        allocator = CoreAllocator(cores=range(8), nodes=[range(8)])
+
+        first = allocator.allocate(3)
+        second = allocator.allocate(3)
+
+        assert len(first) == len(second) == 3
+        assert not set(first) & set(second)
+
+    def test_cores_are_taken_from_single_numa_node(self):
+        allocator = CoreAllocator(cores=range(8), nodes=[[0, 2, 4, 6], [1, 3, 5, 7]])
+        allocator.allocate(1)
+
+        assert allocator.allocate(4) == [1, 3, 5, 7]
+
+    def test_released_cores_are_reused(self):
+        allocator = CoreAllocator(cores=range(4), nodes=[range(4)])
+        cores = allocator.allocate(4)
+
+        allocator.release(cores)
+
+        assert allocator.allocate(4) == cores
+
+    def test_least_used_cores_are_shared_when_all_are_in_use(self):
+        allocator = CoreAllocator(cores=range(4), nodes=[range(4)])
+        allocator.allocate(3)
+
+        assert allocator.allocate(2) == [0, 3]
+
+
+def test_binding_env_pins_threads_to_given_cores():
+    env = binding_env([2, 3])
+
+    assert env["OMP_NUM_THREADS"] == "2"
+    assert env["OMP_PLACES"] == "{2},{3}"
+    assert env["KMP_AFFINITY"] == "granularity=fine,proclist=[2,3],explicit"
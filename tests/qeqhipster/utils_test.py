@@ -1,11 +1,30 @@
+import hashlib
+import io
+import os
+
 import numpy as np
 import pytest
 import sympy
+from qeqhipster.operators import (
+    OPERATOR_TXT_FILENAME,
+    PAULI_STRINGS_CONVERTER,
+    convert_with_native_converter,
+)
 from qeqhipster.utils import (
+    LOWERED_GATES,
+    PAULI_STRINGS_CHUNK_SIZE,
+    QASM_CHUNK_SIZE,
+    _lowering,
     convert_to_simplified_qasm,
     make_circuit_qhipster_compatible,
+    save_simplified_qasm,
+    save_symbolic_operator,
+    simplify_circuit,
+    write_pauli_strings,
+    write_simplified_qasm,
 )
 from zquantum.core import circuits
+from zquantum.core.openfermion import QubitOperator
 
 
 class TestMakingCircuitCompatibleWithQHipster:
@@ -47,33 +66,58 @@ class TestMakingCircuitCompatibleWithQHipster:
         )
 
     @pytest.mark.parametrize(
-        "supported_gate", [circuits.X, circuits.RZ(np.pi), circuits.H]
-    )
-    def test_circuit_with_iswap_gate_cannot_be_made_compatible(self, supported_gate):
-        circuit = circuits.Circuit([circuits.ISWAP(0, 2), supported_gate(1)])
-
-        with pytest.raises(NotImplementedError):
-            make_circuit_qhipster_compatible(circuit)
-
-    @pytest.mark.parametrize(
-        "unsupported_gate",
+        "lowered_gate",
         [
+            circuits.ISWAP,
             circuits.XX(0.5),
-            circuits.YY(sympy.Symbol("theta")),
+            circuits.YY(-1.2),
             circuits.ZZ(0.1),
             circuits.XY(np.pi / 2),
         ],
     )
-    @pytest.mark.parametrize(
-        "supported_gate", [circuits.X, circuits.RZ(np.pi), circuits.H]
-    )
-    def test_circuit_with_two_qubit_pauli_rotation_cannot_be_made_compatible(
-        self, supported_gate, unsupported_gate
+    def test_unsupported_gates_are_lowered_into_equivalent_supported_gates(
+        self, lowered_gate
     ):
-        circuit = circuits.Circuit([unsupported_gate(0, 2), supported_gate(1)])
+        circuit = circuits.Circuit([circuits.H(1), lowered_gate(0, 2), circuits.X(1)])
 
-        with pytest.raises(NotImplementedError):
-            make_circuit_qhipster_compatible(circuit)
+        compatible_circuit = make_circuit_qhipster_compatible(circuit)
+
+        assert {op.gate.name for op in compatible_circuit.operations} <= {
+            "CNOT",
+            "RZ",
+            "RX",
+            "H",
+            "X",
+        }
+        np.testing.assert_allclose(
+            compatible_circuit.to_unitary(), circuit.to_unitary(), atol=1e-10
+        )
+
+    def test_lowering_preserves_symbolic_angles(self):
+        theta = sympy.Symbol("theta")
+        circuit = circuits.Circuit([circuits.YY(theta)(0, 1)])
+
+        compatible_circuit = make_circuit_qhipster_compatible(circuit)
+
+        assert compatible_circuit.free_symbols == [theta]
+        np.testing.assert_allclose(
+            compatible_circuit.bind({theta: 0.3}).to_unitary(),
+            circuit.bind({theta: 0.3}).to_unitary(),
+            atol=1e-10,
+        )
+
+    def test_cached_lowerings_do_not_grow_with_number_of_angles(self):
+        make_circuit_qhipster_compatible(
+            circuits.Circuit(
+                [
+                    gate(angle)(0, 1)
+                    for gate in [circuits.XY, circuits.ZZ]
+                    for angle in np.linspace(0, 1, 100)
+                ]
+            )
+        )
+
+        assert _lowering.cache_info().currsize <= len(LOWERED_GATES)
 
 
 class TestConvertingCircuitToSimplifiedQasm:
@@ -109,3 +153,313 @@ class TestConvertingCircuitToSimplifiedQasm:
         self, circuit, expected_qasm
     ):
         assert convert_to_simplified_qasm(circuit) == expected_qasm
+
+
+class TestWritingSimplifiedQasm:
+    @pytest.mark.parametrize(
+        "circuit",
+        [
+            circuits.Circuit(),
+            circuits.Circuit([circuits.X(0), circuits.Y(2), circuits.Z(1)]),
+            circuits.Circuit([circuits.X(4), circuits.CNOT(0, 3), circuits.H(2)]),
+            circuits.Circuit(
+                [circuits.RX(np.pi)(1), circuits.RZ(0.5)(0), circuits.I(2)]
+            ),
+            circuits.Circuit(
+                [circuits.CPHASE(-0.25)(0, 1), circuits.SWAP(1, 2), circuits.T(0)]
+            ),
+        ],
+    )
+    def test_output_matches_converting_compatible_circuit_to_qasm(self, circuit):
+        file = io.StringIO()
+
+        write_simplified_qasm(circuit, file)
+
+        assert file.getvalue() == convert_to_simplified_qasm(
+            make_circuit_qhipster_compatible(circuit)
+        )
+
+    def test_header_contains_number_of_qubits_of_circuit(self):
+        file = io.StringIO()
+
+        write_simplified_qasm(circuits.Circuit([circuits.X(0)], n_qubits=3), file)
+
+        assert file.getvalue() == "3\nX 0"
+
+    def test_circuits_larger_than_single_chunk_are_written_completely(self):
+        circuit = circuits.Circuit(
+            [circuits.RY(0.1 * i)(i % 3) for i in range(2 * QASM_CHUNK_SIZE + 1)]
+        )
+        file = io.StringIO()
+
+        write_simplified_qasm(circuit, file)
+
+        assert file.getvalue() == convert_to_simplified_qasm(circuit)
+
+    @pytest.mark.parametrize(
+        "lowered_operation",
+        [
+            circuits.XX(0.1)(0, 1),
+            circuits.YY(0.1)(0, 1),
+            circuits.ZZ(0.1)(0, 1),
+            circuits.XY(0.1)(0, 1),
+            circuits.ISWAP(0, 1),
+        ],
+    )
+    def test_unsupported_gates_are_written_lowered(self, lowered_operation):
+        circuit = circuits.Circuit([circuits.X(0), lowered_operation])
+        file = io.StringIO()
+
+        write_simplified_qasm(circuit, file)
+
+        assert file.getvalue() == convert_to_simplified_qasm(
+            make_circuit_qhipster_compatible(circuit)
+        )
+
+    def test_returned_digest_is_sha256_of_saved_file(self, tmp_path):
+        path = tmp_path / "circuit.txt"
+        circuit = circuits.Circuit([circuits.H(0), circuits.CNOT(0, 1)])
+
+        digest = save_simplified_qasm(circuit, str(path))
+
+        assert digest == hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+class TestSimplifyingCircuit:
+    @pytest.mark.parametrize(
+        "circuit, expected_operations",
+        [
+            (
+                circuits.Circuit([circuits.I(0), circuits.X(1), circuits.RZ(0)(0)]),
+                [circuits.X(1)],
+            ),
+            (
+                circuits.Circuit([circuits.RX(0.25)(0), circuits.RX(0.5)(0)]),
+                [circuits.RX(0.75)(0)],
+            ),
+            (
+                circuits.Circuit([circuits.RY(0.5)(0), circuits.RY(-0.5)(0)]),
+                [],
+            ),
+            (
+                circuits.Circuit(
+                    [circuits.H(0), circuits.X(0), circuits.X(0), circuits.H(0)]
+                ),
+                [],
+            ),
+            (
+                circuits.Circuit(
+                    [circuits.CNOT(0, 1), circuits.Z(2), circuits.CNOT(0, 1)]
+                ),
+                [circuits.Z(2)],
+            ),
+            (
+                circuits.Circuit([circuits.SWAP(0, 1), circuits.SWAP(1, 0)]),
+                [],
+            ),
+            (
+                circuits.Circuit([circuits.CNOT(0, 1), circuits.CNOT(1, 0)]),
+                [circuits.CNOT(0, 1), circuits.CNOT(1, 0)],
+            ),
+            (
+                circuits.Circuit(
+                    [circuits.RX(0.25)(0), circuits.X(0), circuits.RX(0.5)(0)]
+                ),
+                [circuits.RX(0.25)(0), circuits.X(0), circuits.RX(0.5)(0)],
+            ),
+            (
+                circuits.Circuit([circuits.H(0), circuits.CNOT(0, 1), circuits.H(0)]),
+                [circuits.H(0), circuits.CNOT(0, 1), circuits.H(0)],
+            ),
+        ],
+    )
+    def test_redundant_gates_are_removed(self, circuit, expected_operations):
+        simplified, n_removed = simplify_circuit(circuit)
+
+        assert simplified.operations == expected_operations
+        assert n_removed == len(circuit.operations) - len(expected_operations)
+
+    def test_symbolic_rotations_are_not_merged(self):
+        theta = sympy.Symbol("theta")
+        circuit = circuits.Circuit([circuits.RX(theta)(0), circuits.RX(0.5)(0)])
+
+        simplified, n_removed = simplify_circuit(circuit)
+
+        assert simplified == circuit
+        assert n_removed == 0
+
+    def test_symbolic_rotations_can_be_merged_on_request(self):
+        theta = sympy.Symbol("theta")
+        circuit = circuits.Circuit([circuits.RX(theta)(0), circuits.RX(0.5)(0)])
+
+        simplified, n_removed = simplify_circuit(circuit, merge_symbolic=True)
+
+        assert simplified == circuits.Circuit([circuits.RX(theta + 0.5)(0)])
+        assert n_removed == 1
+
+    def test_number_of_qubits_is_preserved(self):
+        circuit = circuits.Circuit([circuits.X(0), circuits.X(0)], n_qubits=3)
+
+        simplified, _ = simplify_circuit(circuit)
+
+        assert simplified.n_qubits == 3
+
+    def test_simplified_circuit_has_the_same_unitary(self):
+        circuit = circuits.Circuit(
+            [
+                circuits.H(0),
+                circuits.RZ(0.3)(1),
+                circuits.CNOT(0, 1),
+                circuits.RZ(0.2)(1),
+                circuits.CNOT(0, 1),
+                circuits.CNOT(0, 1),
+                circuits.RZ(-0.1)(1),
+                circuits.I(2),
+                circuits.CPHASE(0.5)(1, 2),
+                circuits.CPHASE(0.25)(1, 2),
+                circuits.H(0),
+            ]
+        )
+
+        simplified, n_removed = simplify_circuit(circuit)
+
+        assert n_removed == 5
+        np.testing.assert_array_almost_equal(
+            simplified.to_unitary(), circuit.to_unitary()
+        )
+
+    def test_consecutive_lowered_gates_are_merged(self):
+        circuit = circuits.Circuit([circuits.XX(0.25)(0, 1), circuits.XX(0.5)(0, 1)])
+
+        simplified, n_removed = simplify_circuit(circuit)
+
+        assert simplified == circuits.Circuit(
+            [
+                circuits.H(0),
+                circuits.H(1),
+                circuits.CNOT(0, 1),
+                circuits.RZ(0.75)(1),
+                circuits.CNOT(0, 1),
+                circuits.H(0),
+                circuits.H(1),
+            ]
+        )
+        assert n_removed == 7
+
+
+REFERENCE_OPERATORS = [
+    QubitOperator(),
+    QubitOperator(""),
+    QubitOperator("X0 Y1 Z2", 0.5),
+    QubitOperator("Z0", -1.0) + QubitOperator("X3 X10", 0.25j) + QubitOperator(""),
+    QubitOperator("Y1", 1e-10) + QubitOperator("Z2", 2),
+    sum(
+        (
+            QubitOperator(f"X{i} Y{(i + 1) % 7} Z{(i + 3) % 7}", 0.1 * i)
+            for i in range(1, 50)
+        ),
+        QubitOperator(),
+    ),
+]
+
+
+class TestWritingPauliStrings:
+    @pytest.mark.parametrize(
+        "operator, expected_content",
+        [
+            (QubitOperator(), ""),
+            (QubitOperator("X0 Y1 Z3", 0.5), "X0 Y1 Z3\n"),
+            (
+                QubitOperator("Z0", -1.0) + QubitOperator("X3 X10", 0.25j),
+                "Z0\nX3 X10\n",
+            ),
+            (QubitOperator("Y1", 1e-10) + QubitOperator("Z2", 2), "Z2\n"),
+        ],
+    )
+    def test_pauli_strings_are_written_in_term_order(
+        self, operator, expected_content, tmp_path
+    ):
+        path = tmp_path / "operator.txt"
+
+        write_pauli_strings(operator, str(path))
+
+        assert path.read_text() == expected_content
+
+    def test_operators_larger_than_single_chunk_are_written_completely(self, tmp_path):
+        path = tmp_path / "operator.txt"
+        operator = sum(
+            (QubitOperator(f"Z{i}") for i in range(PAULI_STRINGS_CHUNK_SIZE + 3)),
+            QubitOperator(),
+        )
+
+        write_pauli_strings(operator, str(path))
+
+        assert path.read_text().splitlines() == [
+            f"Z{i}" for i in range(PAULI_STRINGS_CHUNK_SIZE + 3)
+        ]
+
+    @pytest.mark.skipif(
+        not os.access(PAULI_STRINGS_CONVERTER, os.X_OK),
+        reason="qubitop_to_paulistrings.o is available only in qe-qhipster image.",
+    )
+    @pytest.mark.parametrize("operator", REFERENCE_OPERATORS)
+    def test_output_is_identical_to_native_converter_output(self, operator, tmp_path):
+        native_dir = tmp_path / "native"
+        native_dir.mkdir()
+        path = tmp_path / OPERATOR_TXT_FILENAME
+
+        convert_with_native_converter(operator, str(native_dir))
+        write_pauli_strings(operator, str(path))
+
+        assert path.read_bytes() == (native_dir / OPERATOR_TXT_FILENAME).read_bytes()
+
+
+# Expected input and output of qubitop_to_paulistrings.o for edge cases, stored in
+# data/pauli_strings as <name>.json and <name>.txt. Operators are built from their
+# terms, so that negligible coefficients are kept.
+GOLDEN_OPERATOR_TERMS = {
+    "empty": {},
+    "identity": {(): 1.5},
+    "identity_with_terms": {((0, "Z"),): -1.0, (): 0.5, ((1, "X"), (3, "Y")): 0.25j},
+    "negligible_coefficients": {((1, "Y"),): 1e-10, ((2, "Z"),): 2.0, (): 1e-9},
+}
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), "data", "pauli_strings")
+
+
+def _golden_operator(name):
+    operator = QubitOperator()
+    operator.terms = dict(GOLDEN_OPERATOR_TERMS[name])
+    return operator
+
+
+def _golden_file(name, extension):
+    with open(os.path.join(GOLDEN_DIR, f"{name}.{extension}"), "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("name", GOLDEN_OPERATOR_TERMS)
+class TestPauliStringsGoldenFiles:
+    def test_pauli_strings_match_golden_file(self, name, tmp_path):
+        path = tmp_path / OPERATOR_TXT_FILENAME
+
+        write_pauli_strings(_golden_operator(name), str(path))
+
+        assert path.read_bytes() == _golden_file(name, "txt")
+
+    def test_native_converter_input_matches_golden_file(self, name, tmp_path):
+        path = tmp_path / "operator.json"
+
+        save_symbolic_operator(_golden_operator(name), str(path))
+
+        assert path.read_bytes() == _golden_file(name, "json")
+
+    @pytest.mark.skipif(
+        not os.access(PAULI_STRINGS_CONVERTER, os.X_OK),
+        reason="qubitop_to_paulistrings.o is available only in qe-qhipster image.",
+    )
+    def test_golden_file_matches_native_converter_output(self, name, tmp_path):
+        convert_with_native_converter(_golden_operator(name), str(tmp_path))
+
+        assert (tmp_path / OPERATOR_TXT_FILENAME).read_bytes() == _golden_file(
+            name, "txt"
+        )
@@ -0,0 +1,215 @@
+import numpy as np
+import pytest
+from qeqhipster.wavefunction import (
+    DEFAULT_BLOCK_SIZE,
+    DEFAULT_CHUNK_SIZE,
+    bitstrings_from_counts,
+    convert_output,
+    load_binary_wavefunction,
+    reverse_bits,
+    reverse_qubit_order,
+    sample_counts,
+    save_binary_wavefunction,
+)
+
+
+class TestBinaryWavefunction:
+    @pytest.mark.parametrize("n_qubits", [0, 1, 5])
+    def test_saved_wavefunction_can_be_loaded(self, n_qubits, tmp_path):
+        path = str(tmp_path / "wavefunction.bin")
+        amplitudes = np.arange(2**n_qubits) * (1 + 2j)
+
+        save_binary_wavefunction(amplitudes, path)
+
+        np.testing.assert_array_equal(load_binary_wavefunction(path), amplitudes)
+
+    def test_loaded_wavefunction_is_memory_mapped(self, tmp_path):
+        path = str(tmp_path / "wavefunction.bin")
+        save_binary_wavefunction(np.ones(4), path)
+
+        assert isinstance(load_binary_wavefunction(path), np.memmap)
+
+    def test_modifying_loaded_wavefunction_does_not_modify_file(self, tmp_path):
+        path = str(tmp_path / "wavefunction.bin")
+        save_binary_wavefunction(np.ones(4), path)
+
+        load_binary_wavefunction(path)[0] = 0
+
+        np.testing.assert_array_equal(load_binary_wavefunction(path), np.ones(4))
+
+    @pytest.mark.parametrize("n_bytes", [0, 8, 3 * 16])
+    def test_loading_file_of_invalid_size_raises_error(self, n_bytes, tmp_path):
+        path = tmp_path / "wavefunction.bin"
+        path.write_bytes(b"\0" * n_bytes)
+
+        with pytest.raises(ValueError):
+            load_binary_wavefunction(str(path))
+
+
+def _flip_amplitudes(amplitudes):
+    n_qubits = len(amplitudes).bit_length() - 1
+    return np.array(
+        [
+            amplitudes[int(f"{i:0{n_qubits}b}"[::-1] or "0", 2)]
+            for i in range(len(amplitudes))
+        ]
+    )
+
+
+class TestReversingQubitOrder:
+    @pytest.mark.parametrize("n_qubits", range(11))
+    @pytest.mark.parametrize("nthreads", [1, 3])
+    @pytest.mark.parametrize("chunk_size", [1, 64, DEFAULT_CHUNK_SIZE])
+    def test_qubit_order_is_reversed_in_place(self, n_qubits, nthreads, chunk_size):
+        rng = np.random.default_rng(n_qubits)
+        amplitudes = rng.normal(size=2**n_qubits) + 1j * rng.normal(
+            size=2**n_qubits
+        )
+        expected_amplitudes = _flip_amplitudes(amplitudes)
+
+        result = reverse_qubit_order(amplitudes, nthreads, chunk_size)
+
+        assert result is amplitudes
+        np.testing.assert_array_equal(amplitudes, expected_amplitudes)
+
+    def test_reversing_qubit_order_twice_gives_original_state(self):
+        amplitudes = np.arange(2**13, dtype=complex)
+
+        reverse_qubit_order(reverse_qubit_order(amplitudes))
+
+        np.testing.assert_array_equal(amplitudes, np.arange(2**13))
+
+    def test_reversing_qubit_order_of_invalid_state_vector_raises_error(self):
+        with pytest.raises(ValueError):
+            reverse_qubit_order(np.ones(6, dtype=complex))
+
+    def test_reversing_qubit_order_of_non_contiguous_array_raises_error(self):
+        with pytest.raises(ValueError):
+            reverse_qubit_order(np.ones(16, dtype=complex)[::2])
+
+    @pytest.mark.parametrize(
+        "values, n_bits, expected_values",
+        [([0b0011, 0b1000], 4, [0b1100, 0b0001]), ([1, 2, 3], 0, [0, 0, 0])],
+    )
+    def test_bits_are_reversed(self, values, n_bits, expected_values):
+        np.testing.assert_array_equal(reverse_bits(values, n_bits), expected_values)
+
+
+class TestSamplingCounts:
+    @pytest.mark.parametrize("block_size", [1, 3, DEFAULT_BLOCK_SIZE])
+    def test_samples_are_drawn_only_from_nonzero_amplitudes(self, block_size):
+        amplitudes = np.zeros(16, dtype=complex)
+        amplitudes[[3, 12]] = [1j / np.sqrt(2), 1 / np.sqrt(2)]
+
+        counts = sample_counts(amplitudes, 1000, block_size, seed=5)
+
+        assert set(counts) == {3, 12}
+        assert sum(counts.values()) == 1000
+
+    @pytest.mark.parametrize("block_size", [2, 5, DEFAULT_BLOCK_SIZE])
+    def test_sample_frequencies_follow_probabilities(self, block_size):
+        rng = np.random.default_rng(7)
+        amplitudes = rng.normal(size=32) + 1j * rng.normal(size=32)
+        amplitudes /= np.linalg.norm(amplitudes)
+        n_samples = 200000
+
+        counts = sample_counts(amplitudes, n_samples, block_size, seed=11)
+
+        frequencies = np.array([counts.get(i, 0) for i in range(32)]) / n_samples
+        np.testing.assert_allclose(frequencies, np.abs(amplitudes) ** 2, atol=0.01)
+
+    def test_samples_can_be_drawn_from_memory_mapped_file(self, tmp_path):
+        path = str(tmp_path / "wavefunction.bin")
+        save_binary_wavefunction(np.array([0, 0, 0, 1]), path)
+
+        counts = sample_counts(load_binary_wavefunction(path), 10, block_size=2)
+
+        assert counts == {3: 10}
+
+    def test_drawing_non_positive_number_of_samples_raises_error(self):
+        with pytest.raises(ValueError):
+            sample_counts(np.array([1, 0]), 0)
+
+
+class TestBitstringsFromCounts:
+    def test_bitstrings_are_repeated_according_to_counts(self):
+        bitstrings = bitstrings_from_counts({0b001: 2, 0b110: 3}, 3)
+
+        assert sorted(bitstrings) == [(0, 0, 1)] * 2 + [(1, 1, 0)] * 3
+
+    def test_bitstrings_of_native_order_indices_are_reversed(self):
+        bitstrings = bitstrings_from_counts({0b001: 1}, 3, native_qubit_order=True)
+
+        assert bitstrings == [(1, 0, 0)]
+
+
+def _random_state(n_qubits, seed=0):
+    rng = np.random.default_rng(seed)
+    amplitudes = rng.normal(size=2**n_qubits) + 1j * rng.normal(size=2**n_qubits)
+    return amplitudes / np.linalg.norm(amplitudes)
+
+
+class TestConvertingOutput:
+    @pytest.mark.parametrize("block_size", [1, 3, DEFAULT_BLOCK_SIZE])
+    def test_single_precision_amplitudes_match_double_precision_ones(self, block_size):
+        amplitudes = _random_state(6)
+
+        output = convert_output(amplitudes, "complex64", block_size=block_size)
+
+        assert output.dtype == np.complex64
+        np.testing.assert_allclose(output, amplitudes, rtol=1e-6, atol=1e-7)
+
+    @pytest.mark.parametrize("block_size", [1, 3, DEFAULT_BLOCK_SIZE])
+    def test_probabilities_match_squared_magnitudes(self, block_size):
+        amplitudes = _random_state(6)
+
+        output = convert_output(amplitudes, "probabilities", block_size=block_size)
+
+        assert output.dtype == np.float32
+        np.testing.assert_allclose(output, np.abs(amplitudes) ** 2, rtol=1e-6)
+
+    @pytest.mark.parametrize("block_size", [1, 3, DEFAULT_BLOCK_SIZE])
+    def test_sparse_output_keeps_amplitudes_above_threshold(self, block_size):
+        amplitudes = np.zeros(16, dtype=complex)
+        amplitudes[[1, 6, 15]] = [0.6, 0.8j, 1e-9]
+
+        output = convert_output(amplitudes, "sparse", block_size=block_size)
+
+        assert output.n_qubits == 4
+        np.testing.assert_array_equal(output.indices, [1, 6])
+        np.testing.assert_array_equal(output.values, [0.6, 0.8j])
+
+    def test_sparse_output_without_threshold_restores_state_vector(self):
+        amplitudes = _random_state(5)
+
+        output = convert_output(amplitudes, "sparse", threshold=0)
+
+        np.testing.assert_array_equal(output.to_dense(), amplitudes)
+
+    def test_memory_mapped_output_is_converted(self, tmp_path):
+        amplitudes = _random_state(5)
+        path = str(tmp_path / "wavefunction.bin")
+        save_binary_wavefunction(amplitudes, path)
+
+        output = convert_output(
+            load_binary_wavefunction(path), "complex64", block_size=4
+        )
+
+        assert not isinstance(output, np.memmap)
+        np.testing.assert_allclose(output, amplitudes, rtol=1e-6, atol=1e-7)
+
+    def test_unknown_output_mode_raises_error(self):
+        with pytest.raises(ValueError):
+            convert_output(np.ones(2), "float16")
+
+
+def test_reversing_qubit_order_of_sparse_amplitudes_matches_dense_reversal():
+    amplitudes = _random_state(5)
+    amplitudes[np.abs(amplitudes) < 0.15] = 0
+    sparse = convert_output(amplitudes, "sparse")
+
+    reversed_sparse = sparse.reverse_qubit_order()
+
+    reverse_qubit_order(amplitudes)
+    assert np.all(np.diff(reversed_sparse.indices) > 0)
+    np.testing.assert_array_equal(reversed_sparse.to_dense(), amplitudes)
@@ -0,0 +1,202 @@
+import json
+import subprocess
+import sys
+import textwrap
+
+import pytest
+from qeqhipster.worker import (
+    PROTOCOL_VERSION,
+    QHipsterWorker,
+    WorkerError,
+    WorkerTimeout,
+)
+
+# Stand-in for the native worker. "Runs" invocations by dumping their argv into the
+# file passed as the last argument. Invocations starting with "crash" kill the worker
+# if the crash marker passed as their second argument exists (the marker is removed
+# first, so only one crash happens). Invocations starting with "fail" are reported as
+# failed, invocations starting with "hang" never finish.
+STAND_IN_WORKER = textwrap.dedent(
+    f"""
+    import json
+    import os
+    import sys
+    import time
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        if request["command"] == "shutdown":
+            break
+        if request["command"] == "ping":
+            response = {{"status": "ok", "protocol": {PROTOCOL_VERSION}}}
+        elif request["argv"][0] == "crash" and os.path.exists(request["argv"][1]):
+            os.remove(request["argv"][1])
+            os._exit(1)
+        elif request["argv"][0] == "hang":
+            time.sleep(3600)
+        elif request["argv"][0] == "fail":
+            response = {{"status": "error", "returncode": 3, "message": "failed"}}
+        else:
+            with open(request["argv"][-1], "w") as f:
+                json.dump(request["argv"], f)
+            response = {{"status": "ok"}}
+        print(json.dumps(response), flush=True)
+    """
+)
+
+
+@pytest.fixture
+def stand_in_command(tmp_path):
+    script_path = tmp_path / "stand_in_worker.py"
+    script_path.write_text(STAND_IN_WORKER)
+    return [sys.executable, str(script_path)]
+
+
+@pytest.fixture
+def worker(stand_in_command):
+    worker = QHipsterWorker(stand_in_command)
+    yield worker
+    worker.close()
+
+
+class TestQHipsterWorker:
+    def test_worker_is_started_lazily(self, worker, tmp_path):
+        assert not worker.is_alive()
+
+        worker.run(["interpreter", str(tmp_path / "out.json")])
+
+        assert worker.is_alive()
+
+    def test_worker_runs_invocations_in_single_process(self, worker, tmp_path):
+        worker.start()
+        process = worker._process
+
+        for i in range(3):
+            output_path = tmp_path / f"out_{i}.json"
+            worker.run(["interpreter", str(i), str(output_path)])
+
+            assert json.loads(output_path.read_text()) == [
+                "interpreter",
+                str(i),
+                str(output_path),
+            ]
+        assert worker._process is process
+
+    def test_worker_passes_health_check(self, worker):
+        worker.start()
+
+        assert worker.ping()
+
+    def test_failed_invocation_raises_called_process_error(self, worker):
+        with pytest.raises(subprocess.CalledProcessError) as exc_info:
+            worker.run(["fail"])
+
+        assert exc_info.value.returncode == 3
+        assert worker.is_alive()
+
+    def test_worker_is_restarted_after_crash(self, worker, tmp_path):
+        crash_marker = tmp_path / "crash_marker"
+        crash_marker.touch()
+        output_path = tmp_path / "out.json"
+        worker.start()
+        crashed_process = worker._process
+
+        worker.run(["crash", str(crash_marker), str(output_path)])
+
+        assert crashed_process.poll() is not None
+        assert worker.is_alive()
+        assert output_path.exists()
+
+    def test_worker_gives_up_after_max_restarts(self, stand_in_command, tmp_path):
+        worker = QHipsterWorker(stand_in_command, max_restarts=0)
+        crash_marker = tmp_path / "crash_marker"
+        crash_marker.touch()
+
+        with pytest.raises(WorkerError):
+            worker.run(["crash", str(crash_marker), str(tmp_path / "out.json")])
+
+    def test_hung_invocation_times_out_and_worker_is_restarted(
+        self, stand_in_command, tmp_path
+    ):
+        worker = QHipsterWorker(stand_in_command, run_timeout=0.5)
+        worker.start()
+        hung_process = worker._process
+
+        with pytest.raises(WorkerTimeout):
+            worker.run(["hang"])
+        output_path = tmp_path / "out.json"
+        worker.run(["interpreter", str(output_path)])
+
+        assert hung_process.poll() is not None
+        assert worker._process is not hung_process
+        assert output_path.exists()
+        worker.close()
+
+    def test_worker_failing_health_check_raises_error(self, tmp_path):
+        script_path = tmp_path / "silent_worker.py"
+        script_path.write_text("import sys\nfor line in sys.stdin:\n    pass\n")
+        worker = QHipsterWorker([sys.executable, str(script_path)], startup_timeout=1)
+
+        with pytest.raises(WorkerError):
+            worker.start()
+
+    def test_closing_worker_terminates_process(self, worker):
+        worker.start()
+        process = worker._process
+
+        worker.close()
+
+        assert process.wait(timeout=5) == 0
+        assert not worker.is_alive()
+
+
+class TestReferenceWorker:
+    def test_reference_worker_runs_invocations(self, tmp_path):
+        output_path = tmp_path / "out.txt"
+        with_output = f"open({str(output_path)!r}, 'w').write('done')"
+
+        worker = QHipsterWorker()
+        try:
+            worker.run([sys.executable, "-c", with_output])
+        finally:
+            worker.close()
+
+        assert output_path.read_text() == "done"
+
+    def test_reference_worker_reports_resource_usage(self):
+        worker = QHipsterWorker()
+        try:
+            usage = worker.run([sys.executable, "-c", "pass"])
+        finally:
+            worker.close()
+
+        assert usage["max_rss"] > 0
+        assert usage["user_time"] >= 0
+
+    def test_reference_worker_environment_extends_that_of_parent(
+        self, tmp_path, monkeypatch
+    ):
+        monkeypatch.setenv("QHIPSTER_PARENT_VARIABLE", "parent")
+        output_path = tmp_path / "env.json"
+        dump_env = (
+            "import json, os; "
+            f"json.dump(dict(os.environ), open({str(output_path)!r}, 'w'))"
+        )
+
+        worker = QHipsterWorker(env={"QHIPSTER_WORKER_VARIABLE": "worker"})
+        try:
+            worker.run([sys.executable, "-c", dump_env])
+        finally:
+            worker.close()
+
+        env = json.loads(output_path.read_text())
+        assert env["QHIPSTER_PARENT_VARIABLE"] == "parent"
+        assert env["QHIPSTER_WORKER_VARIABLE"] == "worker"
+
+    def test_reference_worker_reports_failures(self):
+        worker = QHipsterWorker()
+        try:
+            with pytest.raises(subprocess.CalledProcessError):
+                worker.run([sys.executable, "-c", "raise SystemExit(2)"])
+        finally:
+            worker.close()